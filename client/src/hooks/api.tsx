@@ -1,6 +1,7 @@
 import { useAuth0 } from "@auth0/auth0-react";
 import { useInfiniteQuery, useMutation, useQuery } from "@tanstack/react-query";
 import axios from "axios";
+import { useRef } from "react";
 
 export type Article = {
   date: string;
@@ -19,6 +20,8 @@ type Topic = {
 
 export const useArticles = (topic: string, pageSize: number = 10) => {
   const { getAccessTokenSilently, isAuthenticated } = useAuth0();
+  // Feed session of the server-side ranking; the first page starts a new one
+  const feedSession = useRef<string | null>(null);
 
   return useInfiniteQuery({
     queryKey: ["articles", topic],
@@ -27,12 +30,18 @@ export const useArticles = (topic: string, pageSize: number = 10) => {
         detailedResponse: true,
       });
 
+      const headers: Record<string, string> = {
+        Authorization: `Bearer ${token.id_token}`,
+      };
+      if (pageParam > 0 && feedSession.current) {
+        headers["X-Feed-Session"] = feedSession.current;
+      }
+
       const response = await axios.get<Article[]>(
         `api/articles/${topic}/${pageSize}`,
-        {
-          headers: { Authorization: `Bearer ${token.id_token}` },
-        }
+        { headers }
       );
+      feedSession.current = response.headers["x-feed-session"] ?? null;
 
       return response.data;
     },
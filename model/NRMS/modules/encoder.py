@@ -49,6 +49,11 @@ class NewsEncoder(nn.Module):
             nn.Linear(d_mlp, d_embed_news)
         )
 
+        # Drop the sequence positions that are padding in every title of the
+        # batch before running the transformer (see forward). Turned off to
+        # export graphs that keep the full padded length.
+        self.trim_padding = True
+
 
     def forward(self, token_ids: torch.LongTensor, mask: torch.BoolTensor):
         """
@@ -56,6 +61,15 @@ class NewsEncoder(nn.Module):
         mask: (batch_size, seq_len) where True=padding positions (to be masked out)
         """
 
+        if self.trim_padding and mask is not None and not torch.jit.is_tracing():
+            # Titles are ~15 tokens padded to 100: only keep the positions up
+            # to the last real token of the batch. Padded positions are
+            # masked out of attention and of the sum pool, so dropping them
+            # gives the same embeddings for a fraction of the FLOPs.
+            real_positions = (~mask).any(dim=0).nonzero()
+            seq_len = int(real_positions[-1]) + 1 if len(real_positions) else 1
+            token_ids, mask = token_ids[:, :seq_len], mask[:, :seq_len]
+
         key_padding_mask = mask if mask is not None else None  # (batch_size, seq_len) boolean padding mask
         
         # Embed tokens and apply positional encoding
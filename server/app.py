@@ -4,21 +4,31 @@ from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from db_scripts.indexes import create_indexes
+from json_provider import FastJSONProvider
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config.update({
     "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "super-secret"),
     "GOOGLE_CLIENT_ID": os.getenv("GOOGLE_CLIENT_ID")
 })
-CORS(app)
+CORS(app, expose_headers=["X-Feed-Session"])
 
 app.config['CORS_HEADERS'] = 'Content-Type'
 
 import articles.controller
 import auth.controller
 import interactions.controller
+import proxy.controller
+from articles.candidate_store import candidate_store
+from articles.cold_start_pool import cold_start_pool
+
+# Load the candidates and the cold start pool in the background from
+# startup on
+candidate_store.start()
+cold_start_pool.start()
 
 if __name__ == '__main__':
     create_indexes()
@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+import torch
+
+from article_recommender.model import calculate_candidate_embeddings, encode_histories, load_report
+
+BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", 2))
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 32))
+
+
+class InferenceEngine:
+    """
+    Owns the NRMS model and runs it on a single worker thread.
+
+    The model is built by `model_loader` on first use (or by `load()`), so
+    that importing the service does not load it: processes and endpoints
+    that never run the model never pay for it. The worker thread is started
+    on the first submission in each process, which makes it safe to call
+    `load()` before forking workers.
+
+    Request threads submit work and get a Future back. The worker collects
+    pending requests for up to `batch_window_ms` or `max_batch_size` items
+    and runs them as one batch, so concurrent requests share a forward pass
+    instead of competing for torch threads:
+      - user requests (history news embeddings) become UserEncoder
+        batches, one per history length bucket (see encode_histories);
+      - news requests (titles without a stored embedding, as token ids)
+        become one NewsEncoder batch.
+    """
+
+    def __init__(
+        self,
+        model_loader: Callable[[], torch.nn.Module],
+        device: torch.device = torch.device("cpu"),
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ):
+        self.model_loader = model_loader
+        self.device = device
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._load_seconds = None
+        self._created_at = time.monotonic()
+        self._ready_after = None
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0,
+                       "max_batch_size": 0, "wait_seconds": 0.0}
+        self._worker = None
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def model(self) -> torch.nn.Module:
+        return self.load()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> torch.nn.Module:
+        """
+        Load the model now if it is not loaded yet, e.g. in the master
+        process of a pre-forking server so that the workers share it.
+        """
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    started = time.monotonic()
+                    model = self.model_loader().to(self.device).eval()
+                    self._load_seconds = time.monotonic() - started
+                    self._ready_after = time.monotonic() - self._created_at
+                    self._model = model
+                    print(f"Inference model loaded in {self._load_seconds:.2f}s "
+                          f"({load_report.get('checkpoint')})")
+        return self._model
+
+    def encode_user(self, history_emb: torch.Tensor) -> Future:
+        """
+        Submit a (N, d_embed_news) history; the future resolves to the user
+        embedding (d_embed_news,) on the CPU.
+        """
+        return self._submit("user", history_emb.float())
+
+    def encode_news(self, titles: List) -> Future:
+        """
+        Submit titles, preferably as token ids so that the worker does no
+        string processing; the future resolves to their news embeddings
+        (len(titles), d_embed_news) on the CPU.
+        """
+        return self._submit("news", titles)
+
+    def _submit(self, kind, payload) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((kind, payload, future, time.monotonic()))
+        return future
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork: each process starts its own worker
+        if self._worker_pid == os.getpid():
+            return
+        with self._worker_lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(
+                    target=self._run, name="inference-engine", daemon=True)
+                self._worker.start()
+                self._worker_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._record(batch)
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Failed to load the inference model: {e}")
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for kind, run in (("user", self._run_users), ("news", self._run_news)):
+                items = [item for item in batch if item[0] == kind]
+                if not items:
+                    continue
+                try:
+                    results = run([payload for _, payload, _, _ in items])
+                except Exception as e:
+                    for _, _, future, _ in items:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future, _), result in zip(items, results):
+                    future.set_result(result)
+
+    def _run_users(self, histories):
+        return list(encode_histories(self.model, histories, self.device))
+
+    def _run_news(self, title_lists):
+        titles = [title for title_list in title_lists for title in title_list]
+        news_emb = calculate_candidate_embeddings(
+            self.model, titles, device=self.device).cpu()
+        return list(torch.split(news_emb, [len(title_list) for title_list in title_lists]))
+
+    def _record(self, batch):
+        now = time.monotonic()
+        with self._stats_lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch_size"] = max(
+                self._stats["max_batch_size"], len(batch))
+            self._stats["wait_seconds"] += sum(now - submitted for *_, submitted in batch)
+            self._stats["last_batch_size"] = len(batch)
+
+    def metrics(self) -> dict:
+        """
+        Queue depth and batching statistics since startup.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats["batches"] or 1
+        requests = stats["requests"] or 1
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": stats["requests"],
+            "batches": stats["batches"],
+            "last_batch_size": stats.get("last_batch_size", 0),
+            "max_batch_size": stats["max_batch_size"],
+            "mean_batch_size": stats["requests"] / batches,
+            "mean_wait_ms": 1000 * stats["wait_seconds"] / requests,
+            "batch_window_ms": 1000 * self.batch_window,
+            "batch_size_limit": self.max_batch_size,
+            "startup": self.startup_report(),
+        }
+
+    def startup_report(self) -> dict:
+        """
+        Whether the model is loaded, how long loading took (with the
+        checkpoint read and the tokenizer load on their own), and how long
+        after the engine was created the model was ready.
+        """
+        return {
+            "model_loaded": self.loaded,
+            "model_load_seconds": self._load_seconds,
+            "ready_after_seconds": self._ready_after,
+            **load_report,
+        }
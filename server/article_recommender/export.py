@@ -0,0 +1,122 @@
+import os
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+
+from article_recommender.model import MAX_HISTORY, MAX_TITLE_LEN, PAD_ID
+
+NEWS_ENCODER = "news_encoder"
+USER_ENCODER = "user_encoder"
+# Example batch size used for tracing; dynamic exports accept any batch size
+EXAMPLE_BATCH_SIZE = 8
+
+
+def example_inputs(model: nn.Module, batch_size: int = EXAMPLE_BATCH_SIZE):
+    """
+    Random inputs of the NewsEncoder (token ids, padding mask) and of the
+    UserEncoder (news embeddings, slot mask), padded like in serving.
+    """
+    token_ids = torch.randint(
+        PAD_ID + 1, model.news_encoder.word_embedding.num_embeddings, (batch_size, MAX_TITLE_LEN))
+    lengths = torch.randint(1, MAX_TITLE_LEN + 1, (batch_size, 1))
+    token_mask = torch.arange(MAX_TITLE_LEN).unsqueeze(0) >= lengths
+    token_ids[token_mask] = PAD_ID
+
+    news_emb = torch.randn(batch_size, MAX_HISTORY, model.d_embed_news)
+    history_lengths = torch.randint(1, MAX_HISTORY + 1, (batch_size, 1))
+    # Histories are left-padded
+    slot_mask = torch.arange(MAX_HISTORY).flip(0).unsqueeze(0) >= history_lengths
+    news_emb[slot_mask] = 0
+    return (token_ids, token_mask), (news_emb, slot_mask)
+
+
+@contextmanager
+def without_fastpath():
+    """
+    Trace the plain transformer math instead of PyTorch's fused fast path,
+    which uses nested tensors that can't be exported.
+    """
+    enabled = torch.backends.mha.get_fastpath_enabled()
+    torch.backends.mha.set_fastpath_enabled(False)
+    try:
+        yield
+    finally:
+        torch.backends.mha.set_fastpath_enabled(enabled)
+
+
+@contextmanager
+def without_trimming(model: nn.Module):
+    """
+    Export the NewsEncoder at the full padded length: trimming it to the
+    batch's longest title depends on the data and can't be in the graph.
+    Callers trim their inputs instead (see pad_title_tokens).
+    """
+    trim_padding = model.news_encoder.trim_padding
+    model.news_encoder.trim_padding = False
+    try:
+        yield
+    finally:
+        model.news_encoder.trim_padding = trim_padding
+
+
+def export_torchscript(model: nn.Module, export_dir: str):
+    """
+    Trace and freeze both encoders to <export_dir>/{news,user}_encoder.pt.
+    The traced graphs accept any batch size and sequence length.
+    """
+    model = model.cpu().eval()
+    news_inputs, user_inputs = example_inputs(model)
+    os.makedirs(export_dir, exist_ok=True)
+    with torch.no_grad(), without_fastpath(), without_trimming(model):
+        for name, encoder, inputs in ((NEWS_ENCODER, model.news_encoder, news_inputs),
+                                      (USER_ENCODER, model.user_encoder, user_inputs)):
+            traced = torch.jit.freeze(torch.jit.trace(encoder, inputs))
+            traced.save(os.path.join(export_dir, f"{name}.pt"))
+
+
+def export_onnx(model: nn.Module, export_dir: str, dynamic: bool = True, batch_size: int = EXAMPLE_BATCH_SIZE):
+    """
+    Export both encoders to <export_dir>/{news,user}_encoder.onnx.
+
+    With `dynamic`, the batch and sequence axes are dynamic; otherwise the
+    graphs are specialised to `batch_size` x (MAX_TITLE_LEN | MAX_HISTORY),
+    which suits runtimes that compile for fixed shapes.
+    """
+    model = model.cpu().eval()
+    news_inputs, user_inputs = example_inputs(model, batch_size)
+    os.makedirs(export_dir, exist_ok=True)
+    exports = (
+        (NEWS_ENCODER, model.news_encoder, news_inputs,
+         ["token_ids", "token_mask"], "length"),
+        (USER_ENCODER, model.user_encoder, user_inputs,
+         ["news_emb", "slot_mask"], "history"),
+    )
+    with torch.no_grad(), without_fastpath(), without_trimming(model):
+        for name, encoder, inputs, input_names, length_axis in exports:
+            dynamic_axes = None
+            if dynamic:
+                dynamic_axes = {input_name: {0: "batch", 1: length_axis}
+                                for input_name in input_names}
+                dynamic_axes[f"{name}_emb"] = {0: "batch"}
+            torch.onnx.export(
+                encoder, inputs, os.path.join(export_dir, f"{name}.onnx"),
+                input_names=input_names, output_names=[f"{name}_emb"],
+                dynamic_axes=dynamic_axes, dynamo=True)
+
+
+def check_parity(model: nn.Module, exported: nn.Module, batch_sizes=(1, 3, EXAMPLE_BATCH_SIZE, 32)):
+    """
+    Largest absolute difference between the encoder outputs of the eager
+    `model` and of a model whose encoders were loaded from an export, by
+    encoder.
+    """
+    diffs = {NEWS_ENCODER: 0.0, USER_ENCODER: 0.0}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            news_inputs, user_inputs = example_inputs(model, batch_size)
+            for name, inputs in ((NEWS_ENCODER, news_inputs), (USER_ENCODER, user_inputs)):
+                expected = getattr(model, name)(*inputs)
+                actual = getattr(exported, name)(*inputs)
+                diffs[name] = max(diffs[name], (expected - actual).abs().max().item())
+    return diffs
@@ -1,34 +1,114 @@
 from article_recommender.nrms import NRMS
 
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
 from typing import List
+import numpy as np
 import torch
-from transformers import BertTokenizer
+import torch.nn as nn
 
 # Constants — make sure these match your training settings
 MAX_HISTORY = 50
+# Upper bounds of the history length buckets encoded together, see
+# encode_histories
+HISTORY_BUCKETS = (5, 10, 20, 35, MAX_HISTORY)
 MAX_TITLE_LEN = 100
 PAD_ID = 0  # [PAD] token for BERT
-
-tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-
-
-def tokenize_titles(titles: List[str], max_len: int = MAX_TITLE_LEN) -> torch.Tensor:
+# Serving precision: "float32", "int8" or "bf16", see prepare_model
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "float32")
+PRECISIONS = ("float32", "int8", "bf16")
+# Serving backend: "eager", or the encoders exported by
+# scripts/export_encoders.py: "torchscript" or "onnx"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+BACKENDS = ("eager", "torchscript", "onnx")
+EXPORT_DIR = os.getenv("INFERENCE_EXPORT_DIR", "./article_recommender/exported")
+# Title token ids are cached on the articles as little-endian int16 bytes,
+# which the bert-base-uncased ids (< 30522) fit in
+TITLE_TOKENS_DTYPE = np.dtype("<i2")
+
+# Timings and checkpoint details of the lazy loads below, for the startup
+# report of the inference engine
+load_report = {}
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    The (Rust backed) BERT tokenizer, loaded on first use: importing
+    transformers and loading the vocabulary is only paid by processes that
+    encode titles.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                started = time.monotonic()
+                from transformers import BertTokenizerFast
+                _tokenizer = BertTokenizerFast.from_pretrained("bert-base-uncased")
+                load_report["tokenizer_seconds"] = time.monotonic() - started
+    return _tokenizer
+
+
+def encode_title_tokens(titles: List[str], max_len: int = MAX_TITLE_LEN) -> List[np.ndarray]:
     """
-    Tokenizes and pads a list of article titles using BERT tokenizer.
-    Returns: token_ids (N, max_len), padding_mask (N, max_len)
+    Token ids of every title, truncated to `max_len` and not padded: the
+    form they are cached in on the articles.
     """
-    encodings = tokenizer(
+    encodings = get_tokenizer()(
         titles,
-        padding="max_length",
         truncation=True,
         max_length=max_len,
-        return_tensors="pt",
-        return_attention_mask=True,
         add_special_tokens=False  # NRMS does not expect [CLS] or [SEP]
     )
-    token_ids = encodings["input_ids"]       # (N, max_len)
-    padding_mask = ~encodings["attention_mask"].bool()  # True = pad
-    return token_ids, padding_mask
+    return [np.asarray(ids, dtype=np.int64) for ids in encodings["input_ids"]]
+
+
+def title_tokens_to_bytes(token_ids: np.ndarray) -> bytes:
+    return np.asarray(token_ids).astype(TITLE_TOKENS_DTYPE).tobytes()
+
+
+def title_tokens_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=TITLE_TOKENS_DTYPE)
+
+
+def pad_title_tokens(token_lists: List[np.ndarray], max_len: int = MAX_TITLE_LEN):
+    """
+    Pads token ids (as returned by encode_title_tokens, or cached) to the
+    longest title, truncating to `max_len`, without any string processing.
+    Returns: token_ids (N, L), padding_mask (N, L) with L <= max_len
+    """
+    max_len = min(max_len, max((len(ids) for ids in token_lists), default=1)) or 1
+    token_ids = np.full((len(token_lists), max_len), PAD_ID, dtype=np.int64)
+    lengths = np.empty(len(token_lists), dtype=np.int64)
+    for i, ids in enumerate(token_lists):
+        ids = ids[:max_len]
+        token_ids[i, :len(ids)] = ids
+        lengths[i] = len(ids)
+    padding_mask = np.arange(max_len)[None, :] >= lengths[:, None]  # True = pad
+    return torch.from_numpy(token_ids), torch.from_numpy(padding_mask)
+
+
+def tokenize_titles(titles: List, max_len: int = MAX_TITLE_LEN) -> torch.Tensor:
+    """
+    Tokenizes and pads a list of article titles using BERT tokenizer. Items
+    that are already token ids (cached on the article) are only padded.
+    Returns: token_ids (N, L), padding_mask (N, L), padded to the longest
+    title (L <= max_len)
+    """
+    token_lists = list(titles)
+    strings = [i for i, title in enumerate(token_lists) if isinstance(title, str)]
+    if strings:
+        encoded = encode_title_tokens([token_lists[i] for i in strings], max_len)
+        for i, ids in zip(strings, encoded):
+            token_lists[i] = ids
+    return pad_title_tokens(token_lists, max_len)
 
 
 def recommend_topk_from_titles(
@@ -44,8 +124,10 @@ def recommend_topk_from_titles(
 
     Args:
         model:            Trained NRMS model.
-        history_titles:   List of clicked article titles (strings).
-        candidate_titles: List of candidate article titles (strings).
+        history_titles:   List of clicked article titles (strings, or
+                          their cached token ids).
+        candidate_titles: List of candidate article titles (strings, or
+                          their cached token ids).
         topk:             Number of top articles to return.
         device:           Torch device to run the model on.
 
@@ -55,41 +137,31 @@ def recommend_topk_from_titles(
     model.to(device)
     model.eval()
 
-    # 1. Tokenize history and candidates
+    # 1. Tokenize history and candidates (each padded to its longest title).
+    # Only the last MAX_HISTORY clicks are encoded, without padding the
+    # history to MAX_HISTORY slots: padded slots are masked out of the
+    # UserEncoder, so they would only cost NewsEncoder and attention work.
     hist_tokens, hist_mask = tokenize_titles(
-        history_titles, max_len=MAX_TITLE_LEN)
+        history_titles[-MAX_HISTORY:], max_len=MAX_TITLE_LEN)
     cand_tokens, cand_mask = tokenize_titles(
         candidate_titles, max_len=MAX_TITLE_LEN)
 
-    # 2. Pad history to MAX_HISTORY size
-    num_hist = len(history_titles)
-    if num_hist < MAX_HISTORY:
-        pad_len = MAX_HISTORY - num_hist
-        pad_tokens = torch.full((pad_len, MAX_TITLE_LEN),
-                                PAD_ID, dtype=torch.long)
-        pad_mask = torch.ones((pad_len, MAX_TITLE_LEN), dtype=torch.bool)
-        hist_tokens = torch.cat([pad_tokens, hist_tokens], dim=0)
-        hist_mask = torch.cat([pad_mask, hist_mask], dim=0)
-    elif num_hist > MAX_HISTORY:
-        hist_tokens = hist_tokens[-MAX_HISTORY:]
-        hist_mask = hist_mask[-MAX_HISTORY:]
-
-    # 3. Add batch dimension
+    # 2. Add batch dimension
     clicked_ids = hist_tokens.unsqueeze(0).to(
-        device)    # (1, MAX_HISTORY, MAX_TITLE_LEN)
+        device)    # (1, N, L)
     clicked_mask = hist_mask.unsqueeze(0).to(
-        device)     # (1, MAX_HISTORY, MAX_TITLE_LEN)
+        device)     # (1, N, L)
     cand_ids = cand_tokens.unsqueeze(0).to(
-        device)       # (1, K, MAX_TITLE_LEN)
+        device)       # (1, K, L)
     cand_mask = cand_mask.unsqueeze(0).to(
-        device)        # (1, K, MAX_TITLE_LEN)
+        device)        # (1, K, L)
 
-    # 4. Forward pass
-    with torch.no_grad():
+    # 3. Forward pass
+    with inference_context(model, device):
         logits = model(clicked_ids, clicked_mask,
                        cand_ids, cand_mask)  # (1, K)
 
-    scores = logits.squeeze(0)  # (K,)
+    scores = logits.squeeze(0).float()  # (K,)
     topk_vals, topk_idxs = torch.topk(scores, k=min(topk, scores.size(0)))
 
     return scores, topk_idxs.tolist()
@@ -102,39 +174,173 @@ def recommend_topk_from_embeddings(
     topk: int = 5,
     device: torch.device = torch.device("cpu")
 ):
+    user_emb = encode_user_from_titles(model, history_titles, device=device)
+    return recommend_topk_from_user_embedding(user_emb, candidate_emb, topk=topk)
+
 
+def encode_user_from_titles(
+    model: torch.nn.Module,
+    history_titles: List[str],
+    device: torch.device = torch.device("cpu")
+) -> torch.Tensor:
+    """
+    Encodes a user's clicked history (as titles, or their cached token ids)
+    into a user embedding.
+
+    Returns:
+        Tensor of shape (d_embed_news,) on the CPU.
+    """
     model.to(device)
     model.eval()
 
-    # 1. Tokenize history and candidates
+    # 1. Tokenize history, its last MAX_HISTORY clicks without slot padding
     hist_tokens, hist_mask = tokenize_titles(
-        history_titles, max_len=MAX_TITLE_LEN)
-
-    # 2. Pad history to MAX_HISTORY size
-    num_hist = len(history_titles)
-    if num_hist < MAX_HISTORY:
-        pad_len = MAX_HISTORY - num_hist
-        pad_tokens = torch.full((pad_len, MAX_TITLE_LEN),
-                                PAD_ID, dtype=torch.long)
-        pad_mask = torch.ones((pad_len, MAX_TITLE_LEN), dtype=torch.bool)
-        hist_tokens = torch.cat([pad_tokens, hist_tokens], dim=0)
-        hist_mask = torch.cat([pad_mask, hist_mask], dim=0)
-    elif num_hist > MAX_HISTORY:
-        hist_tokens = hist_tokens[-MAX_HISTORY:]
-        hist_mask = hist_mask[-MAX_HISTORY:]
+        history_titles[-MAX_HISTORY:], max_len=MAX_TITLE_LEN)
 
-    # 3. Add batch dimension
+    # 2. Add batch dimension
     clicked_ids = hist_tokens.unsqueeze(0).to(
-        device)    # (1, MAX_HISTORY, MAX_TITLE_LEN)
+        device)    # (1, N, L)
     clicked_mask = hist_mask.unsqueeze(0).to(
-        device)     # (1, MAX_HISTORY, MAX_TITLE_LEN)
+        device)     # (1, N, L)
 
-    # 4. Forward pass
-    with torch.no_grad():
-        logits = model.forward_with_cand_embeddings(
-            clicked_ids, clicked_mask, candidate_emb.unsqueeze(0))  # (1, K)
+    # 3. Forward pass
+    with inference_context(model, device):
+        user_emb = model.encode_user(clicked_ids, clicked_mask)  # (1, E)
+
+    return user_emb.squeeze(0).float().cpu()
+
+
+def pad_history_embeddings(history_emb: torch.Tensor, slots: int = MAX_HISTORY):
+    """
+    Left-pads (or truncates) a (N, d_embed_news) history to `slots` slots.
+    Returns: history_emb (slots, d_embed_news), slot_mask (slots,)
+    """
+    num_hist = history_emb.size(0)
+    slot_mask = torch.zeros(num_hist, dtype=torch.bool)
+    if num_hist < slots:
+        pad_len = slots - num_hist
+        pad_emb = torch.zeros(
+            (pad_len, history_emb.size(1)), dtype=history_emb.dtype)
+        history_emb = torch.cat([pad_emb, history_emb], dim=0)
+        slot_mask = torch.cat(
+            [torch.ones(pad_len, dtype=torch.bool), slot_mask], dim=0)
+    elif num_hist > slots:
+        history_emb = history_emb[-slots:]
+        slot_mask = slot_mask[-slots:]
+    return history_emb, slot_mask
+
+
+def history_slots(num_hist: int) -> int:
+    """
+    Slots a history of `num_hist` clicks is encoded with: its own length,
+    up to MAX_HISTORY. Padded slots are masked out of the UserEncoder, so
+    padding every history to MAX_HISTORY gives the same user embedding for
+    more work, and most histories are short.
+    """
+    return max(1, min(num_hist, MAX_HISTORY))
+
+
+def encode_histories(
+    model: torch.nn.Module,
+    histories: List[torch.Tensor],  # each (N_i, d_embed_news)
+    device: torch.device = torch.device("cpu")
+) -> torch.Tensor:
+    """
+    Encodes the histories of several users with the UserEncoder. Histories
+    are grouped by length into HISTORY_BUCKETS, and every bucket is run as
+    one batch padded to its longest history, so short histories are not
+    padded to the longest one of the whole batch.
+
+    Returns:
+        Tensor of shape (len(histories), d_embed_news) on the CPU.
+    """
+    buckets = {}
+    for i, history in enumerate(histories):
+        slots = history_slots(history.size(0))
+        buckets.setdefault(bisect.bisect_left(HISTORY_BUCKETS, slots), []).append(i)
+
+    user_emb = torch.empty((len(histories), model.d_embed_news))
+    for indices in buckets.values():
+        slots = max(history_slots(histories[i].size(0)) for i in indices)
+        padded = [pad_history_embeddings(histories[i].float(), slots) for i in indices]
+        with inference_context(model, device):
+            user_emb[indices] = model.user_encoder(
+                torch.stack([emb for emb, _ in padded]).to(device),
+                torch.stack([mask for _, mask in padded]).to(device)).float().cpu()  # (B, E)
+    return user_emb
+
+
+def encode_user_from_history_embeddings(
+    model: torch.nn.Module,
+    history_emb: torch.Tensor,  # (N, d_embed_news)
+    device: torch.device = torch.device("cpu")
+) -> torch.Tensor:
+    """
+    Encodes a user from the stored news embeddings of their clicked history,
+    running only the UserEncoder.
+
+    Returns:
+        Tensor of shape (d_embed_news,) on the CPU.
+    """
+    model.to(device)
+    model.eval()
+
+    history_emb, slot_mask = pad_history_embeddings(
+        history_emb.float(), history_slots(history_emb.size(0)))
+
+    with inference_context(model, device):
+        user_emb = model.user_encoder(
+            history_emb.unsqueeze(0).to(device),
+            slot_mask.unsqueeze(0).to(device))  # (1, E)
+
+    return user_emb.squeeze(0).float().cpu()
+
+
+def recommend_topk_from_history_embeddings(
+    model: torch.nn.Module,
+    history_emb: torch.Tensor,    # (N, d_embed_news)
+    candidate_emb: torch.Tensor,  # (K, d_embed_news)
+    topk: int = 5,
+    device: torch.device = torch.device("cpu")
+):
+    """
+    Recommends top-k candidates given the stored news embeddings of the
+    user's clicked history and of the candidates.
+
+    Returns:
+        scores (K,) and the indices of the top-k candidates.
+    """
+    model.to(device)
+    model.eval()
+
+    history_emb, slot_mask = pad_history_embeddings(
+        history_emb.float(), history_slots(history_emb.size(0)))
+
+    with inference_context(model, device):
+        logits = model.forward_with_history_embeddings(
+            history_emb.unsqueeze(0).to(device),
+            slot_mask.unsqueeze(0).to(device),
+            candidate_emb.float().unsqueeze(0).to(device))  # (1, K)
+
+    scores = logits.squeeze(0).float()  # (K,)
+    topk_vals, topk_idxs = torch.topk(scores, k=min(topk, scores.size(0)))
+
+    return scores, topk_idxs.tolist()
 
-    scores = logits.squeeze(0)  # (K,)
+
+def recommend_topk_from_user_embedding(
+    user_emb: torch.Tensor,       # (d_embed_news,)
+    candidate_emb: torch.Tensor,  # (K, d_embed_news)
+    topk: int = 5,
+):
+    """
+    Scores candidates against a precomputed user embedding. NRMS scoring is a
+    plain dot product, so this is a single matrix-vector product.
+
+    Returns:
+        scores (K,) and the indices of the top-k candidates.
+    """
+    scores = candidate_emb.to(user_emb.dtype) @ user_emb  # (K,)
     topk_vals, topk_idxs = torch.topk(scores, k=min(topk, scores.size(0)))
 
     return scores, topk_idxs.tolist()
@@ -150,7 +356,8 @@ def calculate_candidate_embeddings(
 
     Args:
         model:            Trained NRMS model.
-        candidate_titles: List of candidate article titles (strings).
+        candidate_titles: List of candidate article titles (strings, or
+                          their cached token ids).
         device:           Torch device to run the model on.
 
     Returns:
@@ -165,35 +372,281 @@ def calculate_candidate_embeddings(
 
     # 3. Add batch dimension
     cand_ids = cand_tokens.to(
-        device)       # (K, MAX_TITLE_LEN)
+        device)       # (K, L)
     cand_mask = cand_mask.to(
-        device)        # (K, MAX_TITLE_LEN)
+        device)        # (K, L)
 
     # 4. Forward pass
-    with torch.no_grad():
+    with inference_context(model, device):
         res = model.calc_news_emb(cand_ids, cand_mask)  # (B, K, d_embed_news)
 
-    return res
+    return res.float()
+
+
+# Hyperparameters of the NRMS checkpoints. .safetensors checkpoints carry
+# their own copy in the file metadata (see save_checkpoint).
+MODEL_CONFIG = dict(
+    vocab_size=30522,  # bert-base-uncased
+    d_embed_word=128,
+    d_embed_news=256,
+    n_heads_news=8,
+    n_heads_user=8,
+    d_mlp_news=512,
+    d_mlp_user=512,
+    news_layers=1,
+    user_layers=1,
+    dropout=0.1,
+    pad_max_len=MAX_TITLE_LEN,
+)
+CHECK_PATH = os.getenv(
+    "MODEL_CHECKPOINT", './article_recommender/checkpoints/checkpoint_epoch2.safetensors')
+# Checkpoint saved by training with torch.save, used until it is converted
+# with scripts/convert_checkpoint.py
+LEGACY_CHECK_PATH = './article_recommender/checkpoints/checkpoint_epoch2.pt'
+
+
+def save_checkpoint(state_dict: dict, path: str, config: dict = MODEL_CONFIG):
+    """
+    Writes the weights as .safetensors, with the model config in the
+    metadata so that the file is self-describing.
+    """
+    from safetensors.torch import save_file
 
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, path,
+              metadata={"config": json.dumps(config)})
 
-CHECK_PATH = './article_recommender/checkpoints/checkpoint_epoch2.pt'
 
+def read_checkpoint(path: str):
+    """
+    (state_dict, config) of a checkpoint. The tensors of a .safetensors
+    checkpoint are memory-mapped from the file rather than read: pages are
+    loaded on first touch and shared through the page cache by every
+    process serving the same file. Legacy torch.save checkpoints are
+    mmapped too, with the default config.
+    """
+    if path.endswith(".safetensors"):
+        from safetensors import safe_open
+        from safetensors.torch import load_file
+
+        with safe_open(path, framework="pt") as f:
+            config = {**MODEL_CONFIG, **json.loads((f.metadata() or {}).get("config", "{}"))}
+        return load_file(path), config
+
+    state_dict = torch.load(path, map_location="cpu", weights_only=True, mmap=True)
+    vocab_size = state_dict["news_encoder.word_embedding.weight"].shape[0]
+    return state_dict, {**MODEL_CONFIG, "vocab_size": vocab_size}
+
+
+def checkpoint_path() -> str:
+    """
+    The served checkpoint: CHECK_PATH, or the legacy .pt checkpoint while it
+    has not been converted.
+    """
+    return CHECK_PATH if os.path.exists(CHECK_PATH) else LEGACY_CHECK_PATH
+
+
+def state_dict_version(state_dict: dict) -> str:
+    """
+    Version of a set of weights: a hash of the tensors, the same whatever
+    the checkpoint format. Article embeddings are stamped with the version
+    of the model that computed them, as vectors of different weights are
+    not comparable.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(state_dict):
+        tensor = state_dict[name].detach().cpu().contiguous()
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)};".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+    return digest.hexdigest()[:16]
+
+
+_versions = {}  # checkpoint path -> version
 
-def load_model():
-    model = NRMS(
-        vocab_size=tokenizer.vocab_size,
-        d_embed_word=128,
-        d_embed_news=256,
-        n_heads_news=8,
-        n_heads_user=8,
-        d_mlp_news=512,
-        d_mlp_user=512,
-        news_layers=1,
-        user_layers=1,
-        dropout=0.1,
-        pad_max_len=MAX_TITLE_LEN,
-    )
 
-    model.load_state_dict(torch.load(
-        CHECK_PATH, map_location="cpu", weights_only=True))
+def model_version(path: str = None) -> str:
+    """
+    Version of the checkpoint at `path` (the served one by default),
+    without building the model.
+    """
+    path = path or checkpoint_path()
+    if path not in _versions:
+        state_dict, _ = read_checkpoint(path)
+        _versions[path] = state_dict_version(state_dict)
+    return _versions[path]
+
+
+def load_model(path: str = None):
+    """
+    NRMS with the weights of the checkpoint at `path` (the served one by
+    default), with its version as `model.version`.
+
+    The modules are built on the meta device and the checkpoint tensors are
+    assigned to them as they are, so the weights are never initialised and
+    then copied over: they stay backed by the mmapped file.
+    """
+    path = path or checkpoint_path()
+    started = time.monotonic()
+    state_dict, config = read_checkpoint(path)
+    with torch.device("meta"):
+        model = NRMS(**config)
+    model.load_state_dict(state_dict, assign=True)
+    if path not in _versions:
+        _versions[path] = state_dict_version(state_dict)
+    model.version = _versions[path]
+    load_report.update({
+        "checkpoint": path,
+        "checkpoint_bytes": os.path.getsize(path),
+        "checkpoint_seconds": time.monotonic() - started,
+        "model_version": model.version,
+    })
+    return model
+
+
+def bf16_supported(device: torch.device) -> bool:
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+
+
+def quantizable_linear_names(model: torch.nn.Module) -> set:
+    """
+    Names of the Linear layers of the NewsEncoder and UserEncoder postnets
+    and of the FFN of every transformer layer.
+    """
+    names = set()
+    for name, module in model.named_modules():
+        if isinstance(module, nn.TransformerEncoderLayer):
+            names |= {f"{name}.linear1", f"{name}.linear2"}
+        elif name.endswith("postnet"):
+            names |= {f"{name}.{child}" for child, layer in module.named_children()
+                      if isinstance(layer, nn.Linear)}
+    return names
+
+
+def prepare_model(
+    model: torch.nn.Module,
+    precision: str = INFERENCE_PRECISION,
+    device: torch.device = torch.device("cpu"),
+    backend: str = INFERENCE_BACKEND,
+) -> torch.nn.Module:
+    """
+    Moves a loaded model to `device` in eval mode, with its encoders run by
+    `backend` (see load_exported_encoders), for inference at `precision`:
+      - "float32": the model as trained;
+      - "int8":    dynamic int8 quantization of the postnet and transformer
+                   FFN Linear layers (CPU only);
+      - "bf16":    bfloat16 autocast, where the device supports it.
+
+    PyTorch's fused transformer fast path supports neither quantized weights
+    nor CPU autocast, so it is turned off for the reduced precisions.
+    Unsupported precisions fall back to float32. The precision is kept on
+    the model as `model.precision`, for inference_context.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    if backend != "eager" and precision != "float32":
+        raise ValueError(f"The {backend} backend only runs in float32")
+    model = load_exported_encoders(model.to(device).eval(), backend, device=device)
+    if precision == "int8" and device.type != "cpu":
+        print("int8 inference is only supported on CPU, using float32")
+        precision = "float32"
+    if precision == "bf16" and not bf16_supported(device):
+        print("bf16 is not supported on this device, using float32")
+        precision = "float32"
+
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, quantizable_linear_names(model), dtype=torch.qint8)
+    if precision != "float32":
+        torch.backends.mha.set_fastpath_enabled(False)
+    model.precision = precision
+    return model
+
+
+@contextmanager
+def inference_context(model: torch.nn.Module, device: torch.device = torch.device("cpu")):
+    """
+    no_grad, plus bfloat16 autocast for models prepared in bf16.
+    """
+    with torch.no_grad():
+        if getattr(model, "precision", "float32") == "bf16":
+            with torch.autocast(device.type, dtype=torch.bfloat16):
+                yield
+        else:
+            yield
+
+
+class OnnxEncoder(nn.Module):
+    """
+    Runs an encoder exported to ONNX with onnxruntime, in place of the eager
+    module. Graphs exported with a fixed batch size are fed in chunks of
+    that size, the last one padded by repeating its last row; inputs shorter
+    than a fixed sequence length are padded up to it (masks with True).
+    """
+
+    def __init__(self, path: str, device: torch.device = torch.device("cpu")):
+        super().__init__()
+        import onnxruntime  # only needed by the onnx backend
+
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda":
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = onnxruntime.InferenceSession(path, providers=providers)
+        inputs = self.session.get_inputs()
+        self.input_names = [input.name for input in inputs]
+        batch_size = inputs[0].shape[0]
+        self.batch_size = batch_size if isinstance(batch_size, int) else None
+        self.lengths = [input.shape[1] if isinstance(input.shape[1], int) else None
+                        for input in inputs]
+
+    def _run(self, arrays):
+        return self.session.run(None, dict(zip(self.input_names, arrays)))[0]
+
+    def _pad_length(self, array, length):
+        if length is None or array.shape[1] >= length:
+            return array
+        widths = [(0, 0)] * array.ndim
+        widths[1] = (0, length - array.shape[1])
+        return np.pad(array, widths, constant_values=array.dtype == np.bool_)
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        arrays = [self._pad_length(input.cpu().numpy(), length)
+                  for input, length in zip(inputs, self.lengths)]
+        if self.batch_size is None:
+            return torch.from_numpy(self._run(arrays)).to(inputs[0].device)
+
+        outputs = []
+        for start in range(0, arrays[0].shape[0], self.batch_size):
+            chunk = [array[start:start + self.batch_size] for array in arrays]
+            size = chunk[0].shape[0]
+            if size < self.batch_size:
+                chunk = [np.concatenate([array, np.repeat(array[-1:], self.batch_size - size, axis=0)])
+                         for array in chunk]
+            outputs.append(self._run(chunk)[:size])
+        return torch.from_numpy(np.concatenate(outputs)).to(inputs[0].device)
+
+
+def load_exported_encoders(
+    model: torch.nn.Module,
+    backend: str = INFERENCE_BACKEND,
+    export_dir: str = EXPORT_DIR,
+    device: torch.device = torch.device("cpu")
+) -> torch.nn.Module:
+    """
+    Replaces the NewsEncoder and UserEncoder of the model with their
+    TorchScript or ONNX exports from `export_dir`. The "eager" backend
+    returns the model unchanged.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend != "eager":
+        for name in ("news_encoder", "user_encoder"):
+            if backend == "torchscript":
+                encoder = torch.jit.load(os.path.join(
+                    export_dir, f"{name}.pt"), map_location=device)
+            else:
+                encoder = OnnxEncoder(os.path.join(
+                    export_dir, f"{name}.onnx"), device)
+            setattr(model, name, encoder)
+    model.backend = backend
     return model
@@ -71,8 +71,8 @@ class NRMS(nn.Module):
             self,
             clicked_token_ids: torch.LongTensor,     # (B, N, L)
             clicked_token_mask: torch.BoolTensor,    # (B, N, L)
-            candidate_token_ids: torch.LongTensor,   # (B, K, L)
-            candidate_token_mask: torch.BoolTensor   # (B, K, L)
+            candidate_token_ids: torch.LongTensor,   # (B, K, L_cand)
+            candidate_token_mask: torch.BoolTensor   # (B, K, L_cand)
     ) -> torch.Tensor:                           # returns (B, K)
 
         B, N, L = clicked_token_ids.shape
@@ -93,8 +93,10 @@ class NRMS(nn.Module):
             clicked_news_emb, clicked_slot_mask)  # (B, d_embed_news)
 
         # Flatten and encode candidate news
-        candidate_flat_ids = candidate_token_ids.view(B * K, L)
-        candidate_flat_mask = candidate_token_mask.view(B * K, L)
+        # Candidates may be padded to another length than the history
+        L_cand = candidate_token_ids.size(2)
+        candidate_flat_ids = candidate_token_ids.view(B * K, L_cand)
+        candidate_flat_mask = candidate_token_mask.view(B * K, L_cand)
 
         candidate_emb_flat = self.news_encoder(
             candidate_flat_ids, candidate_flat_mask)
@@ -128,6 +130,23 @@ class NRMS(nn.Module):
             candidate_emb: torch.LongTensor,   # (B, K, d_embed_news)
     ) -> torch.Tensor:                           # returns (B, K)
 
+        user_emb = self.encode_user(
+            clicked_token_ids, clicked_token_mask)  # (B, d_embed_news)
+
+        # Dot product
+        # logits (B, K)
+        return torch.bmm(candidate_emb, user_emb.unsqueeze(2)).squeeze(2)
+
+    def encode_user(
+            self,
+            clicked_token_ids: torch.LongTensor,     # (B, N, L)
+            clicked_token_mask: torch.BoolTensor,    # (B, N, L)
+    ) -> torch.Tensor:                           # returns (B, d_embed_news)
+        """
+        Encodes the click history into a user embedding. The result only
+        depends on the history, so it can be cached and reused against any
+        set of candidates.
+        """
         B, N, L = clicked_token_ids.shape
 
         # Embed articles of click history
@@ -141,6 +160,19 @@ class NRMS(nn.Module):
 
         # Encode user profile using news embeddings
         clicked_slot_mask = clicked_token_mask.all(dim=2)  # (B, N)
+        return self.user_encoder(
+            clicked_news_emb, clicked_slot_mask)  # (B, d_embed_news)
+
+    def forward_with_history_embeddings(
+            self,
+            clicked_news_emb: torch.Tensor,          # (B, N, d_embed_news)
+            clicked_slot_mask: torch.BoolTensor,     # (B, N)
+            candidate_emb: torch.Tensor,             # (B, K, d_embed_news)
+    ) -> torch.Tensor:                           # returns (B, K)
+        """
+        Scores candidates from precomputed news embeddings of the click
+        history, skipping the NewsEncoder entirely.
+        """
         user_emb = self.user_encoder(
             clicked_news_emb, clicked_slot_mask)  # (B, d_embed_news)
 
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", 20000))
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", 32))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 50000
+ASSIGN_BATCH_SIZE = 8192
+
+
+class IVFIndex:
+    """
+    Inverted-file index for top-k inner-product search over the rows of an
+    embedding matrix.
+
+    The rows are clustered with k-means into ~4*sqrt(n) lists. A query is
+    scored against the centroids, and only the rows of the `n_probe` closest
+    lists are scored exactly, so a search touches O(sqrt(n)) rows instead of
+    the whole catalogue. New rows are added to the list of their nearest
+    centroid; the caller rebuilds the index once it has grown enough for the
+    centroids to drift.
+    """
+
+    def __init__(self, n_probe: int = ANN_N_PROBE, seed: int = 0):
+        self.n_probe = n_probe
+        self.seed = seed
+        # (centroids, lists) is swapped as a whole so readers never see a
+        # half-built index
+        self._state = None
+        self.size = 0
+        self.built_size = 0
+
+    @property
+    def is_built(self):
+        return self._state is not None
+
+    def build(self, matrix: np.ndarray):
+        """
+        Cluster all the rows of `matrix` (n, d) and build the inverted lists.
+        """
+        n = matrix.shape[0]
+        n_lists = max(1, min(n, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(self.seed)
+
+        sample = matrix
+        if n > KMEANS_SAMPLE_SIZE:
+            sample = matrix[rng.choice(n, KMEANS_SAMPLE_SIZE, replace=False)]
+        centroids = sample[rng.choice(
+            sample.shape[0], n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = _nearest(sample, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / \
+                counts[non_empty, None]
+
+        assignment = _nearest(matrix, centroids)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        lists = [[order[bounds[c]:bounds[c + 1]]] for c in range(n_lists)]
+
+        self._state = (centroids, lists)
+        self.size = self.built_size = n
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """
+        Insert `rows` (with their `vectors`) into the list of their nearest
+        centroid.
+        """
+        centroids, lists = self._state
+        assignment = _nearest(vectors, centroids)
+        for c in np.unique(assignment):
+            chunks = lists[c]
+            chunks.append(rows[assignment == c])
+            if len(chunks) > 8:
+                lists[c] = [np.concatenate(chunks)]
+        self.size += len(rows)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int, row_filter=None):
+        """
+        Top-k rows of `matrix` by inner product with `query`.
+
+        Args:
+            matrix:     The embedding matrix the index was built over.
+            query:      Query vector (d,).
+            k:          Number of rows to return.
+            row_filter: Optional callable taking candidate rows and returning
+                        the subset that may be returned (topic, date, seen).
+
+        Returns:
+            rows and scores of the top-k matches, best first.
+        """
+        centroids, lists = self._state
+        order = np.argsort(centroids @ query)[::-1]
+        n_probe = self.n_probe
+        while True:
+            probed = [chunk for c in order[:n_probe] for chunk in lists[c]]
+            rows = np.concatenate(probed) if probed else np.empty(0, np.int64)
+            if row_filter is not None:
+                rows = row_filter(rows)
+            # Probe more lists when the filters leave too few rows
+            if len(rows) >= k or n_probe >= len(order):
+                break
+            n_probe *= 2
+
+        scores = matrix[rows] @ query
+        if len(rows) > k:
+            top = np.argpartition(scores, len(rows) - k)[-k:]
+            rows, scores = rows[top], scores[top]
+        best = np.argsort(scores)[::-1]
+        return rows[best], scores[best]
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Index of the L2-nearest centroid of each vector.
+    """
+    sq_norms = np.sum(centroids * centroids, axis=1)
+    assignment = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], ASSIGN_BATCH_SIZE):
+        batch = vectors[start:start + ASSIGN_BATCH_SIZE]
+        assignment[start:start + ASSIGN_BATCH_SIZE] = np.argmax(
+            2 * batch @ centroids.T - sq_norms, axis=1)
+    return assignment
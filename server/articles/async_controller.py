@@ -0,0 +1,48 @@
+from quart import Blueprint, abort, jsonify, request
+import articles.async_service as service
+from articles.feed_session import FEED_SESSION_HEADER
+from articles.schema import parse_fields
+
+from auth.async_service import auth_required
+
+blueprint = Blueprint('articles', __name__)
+
+
+@blueprint.route('/api/articles/<category>/<page_size>', methods=['GET'])
+@auth_required
+async def get_some_articles(user_email, category, page_size):
+    articles, session_token = await service.recommend(
+        user_email, category, int(page_size), requested_fields(),
+        request.headers.get(FEED_SESSION_HEADER))
+    response = jsonify(articles)
+    if session_token:
+        response.headers[FEED_SESSION_HEADER] = session_token
+    return response, 200
+
+
+@blueprint.route('/api/article', methods=['GET'])
+async def get_random_article():
+    article = await service.get_random_article(requested_fields())
+    if article is None:
+        abort(503, "Articles are still loading")
+    return jsonify(article), 200
+
+
+@blueprint.route('/api/articles/top-topics', methods=['GET'])
+@auth_required
+async def get_top_topics(user_email):
+    res = await service.get_top_topics(user_email)
+    return jsonify(res), 200
+
+
+@blueprint.route('/api/metrics/inference', methods=['GET'])
+@auth_required
+async def get_inference_metrics(user_email):
+    return service.get_inference_metrics(), 200
+
+
+def requested_fields():
+    try:
+        return parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        abort(400, str(e))
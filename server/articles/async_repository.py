@@ -0,0 +1,63 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+from articles.embedding_codec import with_decoded_embeddings
+from articles.schema import PROJECTION
+from db_async import (articles_collection, article_vectors_collection, topic_interaction_collection,
+                      precomputed_feeds_collection)
+
+
+async def find_many_with_embeddings(ids):
+    """
+    Find many articles by their ids, including their stored embeddings (as
+    float32 arrays, with the model version that computed them) and cached
+    title token ids
+    """
+    vectors = await article_vectors_collection.find(
+        {"_id": {"$in": ids}}, {"embeddings": 1, "embeddings_version": 1, "title_tokens": 1}).to_list(None)
+    vectors = {vector.pop("_id"): vector for vector in with_decoded_embeddings(vectors)}
+    articles = await articles_collection.find({"_id": {"$in": ids}}, {"title": 1}).to_list(None)
+    for article in articles:
+        article.update(vectors.get(article["_id"], {}))
+    return articles
+
+
+async def save_title_tokens(tokens_by_id):
+    """
+    Cache the title token ids of articles, by article _id, as bytes (see
+    article_recommender.model.title_tokens_to_bytes).
+    """
+    if tokens_by_id:
+        await article_vectors_collection.bulk_write([
+            UpdateOne({"_id": id}, {"$set": {"title_tokens": tokens}}, upsert=True)
+            for id, tokens in tokens_by_id.items()
+        ], ordered=False)
+
+
+async def find_by_ids(ids):
+    """
+    Find articles by their ids as article cards, keeping the order of `ids`.
+    """
+    articles = await articles_collection.aggregate([
+        {"$match": {"_id": {"$in": [ObjectId(id) for id in ids]}}},
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$project": {"_id": 0, "id": 1, **PROJECTION}},
+    ]).to_list(None)
+    by_id = {article["id"]: article for article in articles}
+    return [by_id[id] for id in ids if id in by_id]
+
+
+async def get_top_topics(user_email):
+    """
+    Get top topics from a list of article ids.
+    """
+    return await topic_interaction_collection.find(
+        {"user": user_email}, {"_id": 0, "embeddings": 0}).sort({"count": -1}).limit(6).to_list(None)
+
+
+async def find_precomputed_feed(user_id, topic, since):
+    """
+    Get the user's precomputed feed for `topic`, if it was computed after
+    `since`.
+    """
+    return await precomputed_feeds_collection.find_one(
+        {"user": user_id, "topic": topic, "computed_at": {"$gte": since}}, {"_id": 0})
@@ -0,0 +1,159 @@
+import asyncio
+from bson import ObjectId
+from article_recommender.model import encode_title_tokens, model_version, title_tokens_to_bytes
+import articles.async_repository as repository
+import articles.service as sync_service
+from articles.candidate_store import candidate_store
+from articles.feed_session import FEED_SESSION_DEPTH, PRECOMPUTED_FEED_MAX_AGE, FeedSession, feed_sessions
+from articles.schema import ARTICLE_FIELDS, article_cards
+from articles.seen_set import seen_sets, SeenSet, RECENTLY_RECOMMENDED_WINDOW
+from articles.user_cache import user_embedding_cache, history_version
+import interactions.async_service as interactions_service
+import interactions.async_repository as interactions_repository
+from datetime import datetime
+
+# The model and the inference engine are shared with the sync service; the
+# engine worker is the executor model inference is handed to.
+engine = sync_service.engine
+# Writes the requests do not wait for, referenced until they complete
+background_writes = set()
+
+
+async def recommend(user_id, topic, page_size, fields=ARTICLE_FIELDS, session_token=None):
+    """
+    Next page of the user's feed, and the token of the feed session it was
+    served from (None for users without history).
+    """
+    session = feed_sessions.get(session_token, user_id, topic)
+    if session is None or session.exhausted:
+        session = await start_feed_session(user_id, topic)
+        if session is None:
+            return await get_some_articles(topic, fields), None
+
+    recommended_rows = session.next_page(page_size, await get_seen_set(user_id))
+    if len(recommended_rows) == 0:
+        return [], session.token
+    recommended_ids = candidate_store.article_ids(recommended_rows)
+
+    prefetched = session.take_prefetched(recommended_ids)
+    res, _ = await asyncio.gather(
+        prefetched if prefetched is not None else repository.find_by_ids(recommended_ids),
+        interactions_service.record_many_recommended(
+            user_id=user_id,
+            article_ids=recommended_ids),
+    )
+    if prefetched is not None:
+        res = sync_service.select_cards(res, recommended_ids)
+    prefetch_next_page(session, page_size)
+    return article_cards(res, fields), session.token
+
+
+async def start_feed_session(user_id, topic):
+    """
+    Rank the candidates for the user once, and keep the ranking in a new
+    feed session. The ranking is taken from the precomputed feeds when one
+    is fresh and was computed from the user's current history. Returns None
+    if the user has no history yet, or while the candidate store is still
+    loading.
+    """
+    loop = asyncio.get_running_loop()
+    viewed_articles_ids, seen, feed = await asyncio.gather(
+        interactions_repository.get_viewed(user_id),
+        get_seen_set(user_id),
+        repository.find_precomputed_feed(
+            user_id, topic, datetime.now() - PRECOMPUTED_FEED_MAX_AGE),
+    )
+
+    if not viewed_articles_ids:
+        return None
+    candidate_store.start()
+    if not candidate_store.size:
+        return None
+    viewed_ids = [article['article_id'] for article in viewed_articles_ids]
+
+    ranked_rows = sync_service.precomputed_rows(
+        feed, history_version(viewed_ids), seen)
+    if ranked_rows is None:
+        user_emb = await get_user_embedding(user_id, viewed_ids)
+        ranked_rows, _scores = await loop.run_in_executor(
+            None, candidate_store.search, user_emb.numpy(), topic, seen, FEED_SESSION_DEPTH)
+    session = FeedSession(user_id, topic, ranked_rows)
+    feed_sessions.put(session)
+    return session
+
+
+def prefetch_next_page(session, page_size):
+    """
+    Load the cards of the session's next page in the background.
+    """
+    next_ids = candidate_store.article_ids(session.peek(page_size))
+    if next_ids:
+        session.set_prefetched(
+            next_ids, asyncio.ensure_future(repository.find_by_ids(next_ids)))
+
+
+async def get_seen_set(user_id):
+    seen = seen_sets.get_cached(user_id)
+    if seen is None:
+        seen = SeenSet.from_interactions(await interactions_repository.get_seen(
+            user_id, datetime.now() - RECENTLY_RECOMMENDED_WINDOW))
+        seen_sets.put(user_id, seen)
+    return seen
+
+
+async def get_user_embedding(user_id, viewed_article_ids):
+    """
+    Get the user embedding from the cache, encoding the click history only
+    when it changed since the last request.
+    """
+    version = history_version(viewed_article_ids)
+    user_emb = user_embedding_cache.get(user_id, version)
+    if user_emb is not None:
+        return user_emb
+
+    viewed_articles = await repository.find_many_with_embeddings(
+        [ObjectId(article_id) for article_id in viewed_article_ids])
+    await cache_title_tokens(viewed_articles)
+    history_emb = await asyncio.get_running_loop().run_in_executor(
+        None, sync_service.get_history_embeddings, viewed_articles)
+    user_emb = await asyncio.wrap_future(engine.encode_user(history_emb))
+    user_embedding_cache.put(user_id, version, user_emb)
+    return user_emb
+
+
+async def cache_title_tokens(articles):
+    """
+    Tokenize, off the event loop, the titles the history encoding will need
+    that have no cached token ids, so that the sync service does not write
+    them back itself. The ids are cached through the async driver, without
+    waiting for the write.
+    """
+    version = model_version()
+    misses = [article for article in articles
+              if not sync_service.has_current_embedding(article, version) and not article.get('title_tokens')]
+    if not misses:
+        return
+    encoded = await asyncio.get_running_loop().run_in_executor(
+        None, encode_title_tokens, [article['title'] for article in misses])
+    for article, ids in zip(misses, encoded):
+        article['title_tokens'] = title_tokens_to_bytes(ids)
+    write = asyncio.ensure_future(repository.save_title_tokens(
+        {article['_id']: article['title_tokens'] for article in misses}))
+    background_writes.add(write)
+    write.add_done_callback(background_writes.discard)
+
+
+def get_inference_metrics():
+    return engine.metrics()
+
+
+async def get_top_topics(user_id):
+    return await repository.get_top_topics(user_id)
+
+
+async def get_some_articles(topic="all", fields=ARTICLE_FIELDS):
+    return sync_service.get_some_articles(topic, fields)
+
+
+async def get_random_article(fields=ARTICLE_FIELDS):
+    return sync_service.get_random_article(fields)
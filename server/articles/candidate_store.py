@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from article_recommender.model import model_version
+import articles.repository as repository
+from articles.ann_index import ANN_MIN_SIZE, IVFIndex
+
+REFRESH_INTERVAL = float(os.getenv("CANDIDATE_REFRESH_INTERVAL", 30))
+CANDIDATE_MAX_AGE_DAYS = os.getenv("CANDIDATE_MAX_AGE_DAYS")
+INITIAL_CAPACITY = 1024
+
+
+class CandidateStore:
+    """
+    Process-resident store of every servable article: a contiguous float32
+    embedding matrix plus parallel arrays of id, date and topic.
+
+    The store is refreshed incrementally: new inserts are picked up with an
+    ingest watermark on `_id` (ObjectIds grow with insertion time), while the
+    `date` array is used at query time so that articles become fresh as their
+    publication date passes. Articles inserted before their embedding was
+    computed are kept in a pending set and re-checked on every refresh.
+    Refreshes run in a background thread (see `start`); requests only read
+    the current snapshot.
+    Only embeddings computed by the served model version are loaded:
+    articles embedded by another checkpoint are pending until re-embedded
+    (see scripts/reembed_articles.py).
+
+    Once the catalogue reaches ANN_MIN_SIZE articles, an IVF index is kept
+    over the matrix so that `search` is sub-linear in the catalogue size.
+    The index is (re)built in its own thread on a copy of the matrix and
+    swapped in when complete; searches use the previous index, or an exact
+    scan, in the meantime.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.size = 0
+        self.matrix = None  # (capacity, d_embed_news) float32
+        self.dates = np.empty(INITIAL_CAPACITY, dtype="datetime64[us]")
+        self.topics = np.empty(INITIAL_CAPACITY, dtype=np.int32)
+        self.ids = []
+        self.rows = {}  # article id -> row
+        self.topic_codes = {}  # topic -> code
+        self.topic_names = []  # code -> topic
+        self.watermark = None
+        self.pending = set()
+        self.version = None
+        self.last_refresh = 0.0
+        self.index = IVFIndex()
+        self._index_build = None
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def refresh(self):
+        """
+        Load the articles inserted since the watermark, and the pending ones
+        whose embedding has been computed since the previous refresh. Rows are
+        only ever appended, so readers never see a row move.
+        """
+        with self._lock:
+            self.version = model_version()
+            previous_size = self.size
+            if self.pending:
+                pending = list(self.pending)
+                for article in repository.find_candidate_vectors(ids=pending, version=self.version):
+                    self._add(article)
+
+            for article in repository.find_candidate_vectors(after_id=self.watermark):
+                self.watermark = article["_id"]
+                self._add(article)
+
+            self._update_index(previous_size)
+            self.last_refresh = time.monotonic()
+
+    def _update_index(self, previous_size):
+        """
+        Insert the new rows into the ANN index, and start rebuilding it when
+        the catalogue doubled since the last build.
+        """
+        if self.size < ANN_MIN_SIZE or self.size == previous_size:
+            return
+        if self.index.is_built:
+            rows = np.arange(previous_size, self.size)
+            self.index.add(rows, self.matrix[rows])
+        if self._index_build is None and (
+                not self.index.is_built or self.size >= 2 * self.index.built_size):
+            self._index_build = threading.Thread(
+                target=self._build_index, args=(self.matrix[:self.size].copy(),),
+                name="candidate-store-index", daemon=True)
+            self._index_build.start()
+
+    def _build_index(self, matrix):
+        """
+        Build a new index over `matrix` (the first rows of the store), catch
+        it up with the rows appended meanwhile and swap it in.
+        """
+        index = IVFIndex()
+        try:
+            index.build(matrix)
+        except Exception as e:
+            print(f"Candidate index build failed: {e}")
+            self._index_build = None
+            return
+        with self._lock:
+            if self.size > index.built_size:
+                rows = np.arange(index.built_size, self.size)
+                index.add(rows, self.matrix[rows])
+            self.index = index
+            self._index_build = None
+
+    def start(self):
+        """
+        Start refreshing the store every REFRESH_INTERVAL seconds in a
+        background thread, unless it already runs in this process (a forked
+        worker starts its own on first use).
+        """
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="candidate-store-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Candidate store refresh failed: {e}")
+            time.sleep(REFRESH_INTERVAL)
+
+    def _add(self, article):
+        id = str(article["_id"])
+        if (article.get("embeddings") is None or "date" not in article
+                or article.get("embeddings_version") != self.version):
+            self.pending.add(article["_id"])
+            return
+        self.pending.discard(article["_id"])
+        if id in self.rows:
+            return
+
+        vector = article["embeddings"]
+        self._reserve(self.size + 1, vector.shape[0])
+        row = self.size
+        self.matrix[row] = vector
+        self.dates[row] = np.datetime64(article["date"], "us")
+        topic = article.get("topic")
+        if topic not in self.topic_codes:
+            self.topic_codes[topic] = len(self.topic_names)
+            self.topic_names.append(topic)
+        self.topics[row] = self.topic_codes[topic]
+        self.ids.append(id)
+        self.rows[id] = row
+        # Publish the row only once it is fully written
+        self.size = row + 1
+
+    def _reserve(self, size, dim):
+        if self.matrix is None:
+            self.matrix = np.empty((INITIAL_CAPACITY, dim), dtype=np.float32)
+        capacity = self.matrix.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        # Grow into new arrays so readers holding a snapshot are unaffected
+        matrix = np.empty((capacity, dim), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        dates = np.empty(capacity, dtype=self.dates.dtype)
+        dates[:self.size] = self.dates[:self.size]
+        topics = np.empty(capacity, dtype=self.topics.dtype)
+        topics[:self.size] = self.topics[:self.size]
+        self.matrix, self.dates, self.topics = matrix, dates, topics
+
+    def filter_rows(self, rows, topic, seen=None, now=None):
+        """
+        Subset of `rows` in `topic` ("all" for any topic), published before
+        `now` (and within CANDIDATE_MAX_AGE_DAYS) and not in the user's
+        `seen` set.
+        """
+        now = now or datetime.now()
+        dates = self.dates[rows]
+        mask = dates <= np.datetime64(now, "us")
+        if CANDIDATE_MAX_AGE_DAYS:
+            since = now - timedelta(days=float(CANDIDATE_MAX_AGE_DAYS))
+            mask &= dates >= np.datetime64(since, "us")
+        if topic != "all":
+            code = self.topic_codes.get(topic)
+            if code is None:
+                return rows[:0]
+            mask &= self.topics[rows] == code
+        rows = rows[mask]
+
+        if seen is not None:
+            rows = rows[~seen.mask(rows, now)]
+        return rows
+
+    def search(self, user_emb, topic, seen=None, k=10, now=None):
+        """
+        Top-k rows by inner product with the user embedding, over the whole
+        catalogue filtered like `filter_rows`. Uses the ANN index when it is
+        built and an exact scan otherwise.
+
+        Returns:
+            rows and scores of the top-k articles, best first.
+        """
+        size = self.size
+        matrix = self.matrix
+        index = self.index
+        user_emb = np.asarray(user_emb, dtype=np.float32)
+
+        def row_filter(rows):
+            return self.filter_rows(rows[rows < size], topic, seen, now)
+
+        if index.is_built:
+            return index.search(matrix, user_emb, k, row_filter)
+
+        rows = row_filter(np.arange(size))
+        scores = matrix[rows] @ user_emb
+        if len(rows) > k:
+            top = np.argpartition(scores, len(rows) - k)[-k:]
+            rows, scores = rows[top], scores[top]
+        best = np.argsort(scores)[::-1]
+        return rows[best], scores[best]
+
+    def topic_of(self, article_id):
+        """
+        Topic of a loaded article, or None if it is not in the store.
+        """
+        row = self.rows.get(article_id)
+        if row is None:
+            return None
+        return self.topic_names[self.topics[row]]
+
+    def article_ids(self, rows):
+        return [self.ids[row] for row in rows]
+
+
+candidate_store = CandidateStore()
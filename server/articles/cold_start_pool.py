@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import articles.repository as repository
+import interactions.repository as interactions_repository
+
+REFRESH_INTERVAL = float(os.getenv("COLD_START_REFRESH_INTERVAL", 300))
+# Most recent articles scanned on every rebuild, and kept per topic
+SCAN_SIZE = int(os.getenv("COLD_START_SCAN_SIZE", 20000))
+TOPIC_POOL_SIZE = int(os.getenv("COLD_START_TOPIC_POOL_SIZE", 500))
+POPULARITY_WINDOW = timedelta(
+    hours=float(os.getenv("COLD_START_POPULARITY_HOURS", 48)))
+HALF_LIFE_HOURS = float(os.getenv("COLD_START_HALF_LIFE_HOURS", 24))
+MAX_DRAW_ROUNDS = 8
+
+
+class ColdStartPool:
+    """
+    In-memory pool of recent articles served to users without a click
+    history, replacing a `$sample` over the whole collection.
+
+    Every REFRESH_INTERVAL seconds the pool is rebuilt from the most recent
+    published articles that have a title and an image, keeping up to
+    TOPIC_POOL_SIZE per topic. Each article is weighted by popularity (its
+    opens over POPULARITY_WINDOW) and recency (halving every HALF_LIFE_HOURS
+    before the newest article), and the cumulative weights of each topic are
+    kept so that a weighted draw of k articles is k binary searches.
+    Rebuilds run in a background thread (see `start`); requests only draw
+    from the current pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rng_lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        # topic -> (articles, cumulative weights), swapped as a whole
+        self._pools = {}
+        self.size = 0
+        self.last_refresh = 0.0
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def refresh(self):
+        """
+        Rebuild the pool from the database.
+        """
+        with self._lock:
+            articles = list(repository.find_pool_candidates(SCAN_SIZE))
+            opens = interactions_repository.count_opens(
+                datetime.now() - POPULARITY_WINDOW)
+
+            by_topic = {}
+            for article in articles:
+                topic_articles = by_topic.setdefault(article.get("topic"), [])
+                if len(topic_articles) < TOPIC_POOL_SIZE:
+                    topic_articles.append(article)
+
+            pools = {topic: self._pool(topic_articles, opens)
+                     for topic, topic_articles in by_topic.items()}
+            everything = [article for topic_articles in by_topic.values()
+                          for article in topic_articles]
+            pools["all"] = self._pool(everything, opens)
+
+            self._pools = pools
+            self.size = len(everything)
+            self.last_refresh = time.monotonic()
+
+    @staticmethod
+    def _pool(articles, opens):
+        if not articles:
+            return articles, np.zeros(0)
+        dates = np.array([np.datetime64(article["date"], "s")
+                          for article in articles])
+        age_hours = (dates.max() - dates).astype(np.float64) / 3600
+        popularity = np.array([1 + opens.get(article["id"], 0)
+                               for article in articles], dtype=np.float64)
+        weights = popularity * np.exp2(-age_hours / HALF_LIFE_HOURS)
+        return articles, np.cumsum(weights)
+
+    def start(self):
+        """
+        Start rebuilding the pool every REFRESH_INTERVAL seconds in a
+        background thread, unless it already runs in this process (a forked
+        worker starts its own on first use).
+        """
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="cold-start-pool-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Cold start pool refresh failed: {e}")
+            time.sleep(REFRESH_INTERVAL)
+
+    def sample(self, k, topic="all"):
+        """
+        Draw `k` distinct articles of `topic`, weighted by popularity and
+        recency. Falls back to all topics when the topic has no articles.
+        """
+        pools = self._pools
+        articles, cumulative = pools.get(topic, ([], None))
+        if not articles:
+            articles, cumulative = pools.get("all", ([], None))
+        if not articles:
+            return []
+        with self._rng_lock:
+            picked = self._draw(cumulative, k)
+        return [dict(articles[i]) for i in picked]
+
+    def _draw(self, cumulative, k):
+        n = len(cumulative)
+        if k >= n:
+            return self._rng.permutation(n).tolist()
+
+        picked = {}  # ordered set of distinct picks
+        for _ in range(MAX_DRAW_ROUNDS):
+            draws = np.searchsorted(
+                cumulative, self._rng.random(2 * (k - len(picked))) * cumulative[-1], side="right")
+            for i in draws.tolist():
+                picked.setdefault(min(i, n - 1))
+                if len(picked) == k:
+                    return list(picked)
+        # A few articles hold nearly all the weight: fill up uniformly
+        rest = np.setdiff1d(np.arange(n), list(picked))
+        return list(picked) + self._rng.choice(rest, k - len(picked), replace=False).tolist()
+
+
+cold_start_pool = ColdStartPool()
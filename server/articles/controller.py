@@ -1,6 +1,7 @@
 from flask import Flask, Response, abort, request, jsonify
-import requests
 import articles.service as service
+from articles.feed_session import FEED_SESSION_HEADER
+from articles.schema import parse_fields
 from __main__ import app
 
 from auth.service import auth_required
@@ -11,12 +12,21 @@ PAGE_SIZE = 10
 @app.route('/api/articles/<category>/<page_size>', methods=['GET'])
 @auth_required
 def get_some_articles(user_email, category, page_size):
-    return service.recommend(user_email, category, int(page_size)), 200
+    articles, session_token = service.recommend(
+        user_email, category, int(page_size), requested_fields(),
+        request.headers.get(FEED_SESSION_HEADER))
+    response = jsonify(articles)
+    if session_token:
+        response.headers[FEED_SESSION_HEADER] = session_token
+    return response, 200
 
 
 @app.route('/api/article', methods=['GET'])
 def get_random_article():
-    return service.get_random_article(), 200
+    article = service.get_random_article(requested_fields())
+    if article is None:
+        abort(503, "Articles are still loading")
+    return jsonify(article), 200
 
 
 @app.route('/api/articles/top-topics', methods=['GET'])
@@ -26,21 +36,14 @@ def get_top_topics(user_email):
     return res, 200
 
 
-@app.route('/api/proxy')
-def proxy():
-    url = request.args.get('url')
-    if not url:
-        return abort(400, 'Missing "url" parameter')
-    # Fetch the target URL
-    resp = requests.get(url, stream=True)
-    # Build a proxy response
-    excluded_headers = ['content-encoding',
-                        'content-length', 'transfer-encoding', 'connection']
-    headers = [(name, value) for (name, value) in resp.raw.headers.items()
-               if name.lower() not in excluded_headers]
-
-    def generate():
-        for chunk in resp.iter_content(chunk_size=8192):
-            if chunk:
-                yield chunk
-    return Response(generate(), status=resp.status_code, headers=headers)
+@app.route('/api/metrics/inference', methods=['GET'])
+@auth_required
+def get_inference_metrics(user_email):
+    return service.get_inference_metrics(), 200
+
+
+def requested_fields():
+    try:
+        return parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        abort(400, str(e))
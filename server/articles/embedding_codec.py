@@ -0,0 +1,48 @@
+import os
+from typing import Optional
+
+import numpy as np
+from bson import Binary
+
+# Storage dtype of the embeddings written from now on: "float32", or
+# "float16" for half the size at ~1e-3 relative precision
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+STORAGE_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+def encode_embedding(vector, dtype: str = EMBEDDING_STORAGE_DTYPE) -> dict:
+    """
+    Stored form of an embedding: its raw little-endian bytes as a BSON
+    Binary, with its dtype and dimension.
+    """
+    array = np.asarray(vector, dtype=STORAGE_DTYPES[dtype])
+    return {"dtype": dtype, "dim": int(array.shape[0]), "data": Binary(array.tobytes())}
+
+
+def decode_embedding(stored) -> Optional[np.ndarray]:
+    """
+    Embedding as a float32 array from its stored form, or from a BSON array
+    of doubles as written before embeddings were stored as binary. None if
+    there is no embedding.
+
+    The binary form is read with np.frombuffer, without a Python object per
+    element; float32 embeddings are a read-only view of the BSON bytes.
+    """
+    if not stored:
+        return None
+    if isinstance(stored, list):
+        return np.asarray(stored, dtype=np.float32)
+    vector = np.frombuffer(stored["data"], dtype=STORAGE_DTYPES[stored["dtype"]])
+    if vector.shape[0] != stored["dim"]:
+        raise ValueError(f"Embedding of {vector.shape[0]} values, expected {stored['dim']}")
+    return vector.astype(np.float32, copy=False)
+
+
+def with_decoded_embeddings(articles):
+    """
+    Decode the `embeddings` of the articles in place as they are read.
+    """
+    for article in articles:
+        if "embeddings" in article:
+            article["embeddings"] = decode_embedding(article["embeddings"])
+        yield article
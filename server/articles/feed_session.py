@@ -0,0 +1,123 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+import numpy as np
+
+FEED_SESSION_HEADER = "X-Feed-Session"
+FEED_SESSION_TTL = float(os.getenv("FEED_SESSION_TTL", 600))
+FEED_SESSION_CACHE_SIZE = int(os.getenv("FEED_SESSION_CACHE_SIZE", 10000))
+# Number of candidates ranked when a session starts
+FEED_SESSION_DEPTH = int(os.getenv("FEED_SESSION_DEPTH", 200))
+FEED_PREFETCH_WORKERS = int(os.getenv("FEED_PREFETCH_WORKERS", 4))
+# Feeds written by scripts/precompute_feeds.py are served up to this age
+PRECOMPUTED_FEED_MAX_AGE = timedelta(
+    hours=float(os.getenv("PRECOMPUTED_FEED_MAX_AGE_HOURS", 12)))
+
+
+class FeedSession:
+    """
+    A user's ranked feed for one topic, paged through with a cursor.
+
+    The candidates are scored once when the session starts; every page is
+    the next slice of the ranking, skipping the articles the user has seen
+    since then (opened, or recommended by another session). The cards of
+    the following page can be prefetched while the client reads the current
+    one.
+    """
+
+    def __init__(self, user_id: str, topic: str, rows: np.ndarray):
+        self.token = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.topic = topic
+        self.rows = rows
+        self.cursor = 0
+        self.created_at = time.monotonic()
+        self._prefetched = None  # (article ids, future of their cards)
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.cursor >= len(self.rows)
+
+    def next_page(self, page_size: int, seen=None) -> np.ndarray:
+        """
+        Rows of the next page, moving the cursor past them.
+        """
+        with self._lock:
+            page = []
+            while len(page) < page_size and self.cursor < len(self.rows):
+                chunk = self.rows[self.cursor:self.cursor +
+                                  page_size - len(page)]
+                self.cursor += len(chunk)
+                if seen is not None:
+                    chunk = chunk[~seen.mask(chunk)]
+                page.extend(chunk.tolist())
+            return np.asarray(page, dtype=np.int64)
+
+    def peek(self, page_size: int) -> np.ndarray:
+        """
+        Rows the next page will most likely be made of.
+        """
+        return self.rows[self.cursor:self.cursor + page_size]
+
+    def set_prefetched(self, article_ids, future):
+        self._prefetched = (set(article_ids), future)
+
+    def take_prefetched(self, article_ids):
+        """
+        The future of the prefetched cards if they cover `article_ids`.
+        """
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is None or not prefetched[0].issuperset(article_ids):
+            return None
+        return prefetched[1]
+
+
+class FeedSessions:
+    """
+    Bounded LRU of feed sessions by token. A session expires FEED_SESSION_TTL
+    seconds after it started, so a ranking never gets older than that.
+    """
+
+    def __init__(self, max_size: int = FEED_SESSION_CACHE_SIZE, ttl: float = FEED_SESSION_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: Optional[str], user_id: str, topic: str) -> Optional[FeedSession]:
+        """
+        The session of `token` if it belongs to the user and topic and has
+        not expired.
+        """
+        if not token:
+            return None
+        with self._lock:
+            session = self._entries.get(token)
+            if session is None:
+                return None
+            if time.monotonic() - session.created_at >= self.ttl:
+                del self._entries[token]
+                return None
+            if session.user_id != user_id or session.topic != topic:
+                return None
+            self._entries.move_to_end(token)
+            return session
+
+    def put(self, session: FeedSession):
+        with self._lock:
+            self._entries[session.token] = session
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, session: FeedSession):
+        with self._lock:
+            self._entries.pop(session.token, None)
+
+
+feed_sessions = FeedSessions()
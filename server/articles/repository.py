@@ -1,52 +1,279 @@
+import itertools
 from bson import ObjectId
-from db import articles_collection, topic_interaction_collection
+from articles.embedding_codec import EMBEDDING_STORAGE_DTYPE, encode_embedding, with_decoded_embeddings
+from articles.schema import PROJECTION
+from pymongo import UpdateOne
+from db import (articles_collection, article_vectors_collection, topic_interaction_collection,
+                precomputed_feeds_collection)
 from datetime import datetime
 
+# Articles whose vectors are read together from article_vectors
+VECTOR_BATCH_SIZE = 1000
+# Ids looked up per query, keeping every $in well under the 16MB limit
+ID_BATCH_SIZE = 10000
+# Fields of the article_vectors documents, which share the _id of their article
+VECTOR_FIELDS = ("embeddings", "embeddings_version", "title_tokens")
+
 
 def find_many(ids):
     """
     Find many articles by their ids
     """
-    return list(articles_collection.find({"_id": {"$in": ids}}, {"_id": 0, "embeddings": 0}))
+    return list(articles_collection.find({"_id": {"$in": ids}}, {"_id": 0, "embeddings": 0, "title_tokens": 0}))
+
+
+def find_many_with_embeddings(ids):
+    """
+    Find many articles by their ids, including their stored embeddings (as
+    float32 arrays, with the model version that computed them) and cached
+    title token ids
+    """
+    vectors = find_vectors(ids, {"embeddings": 1, "embeddings_version": 1, "title_tokens": 1})
+    articles = list(articles_collection.find({"_id": {"$in": ids}}, {"title": 1}))
+    for article in articles:
+        article.update(vectors.get(article["_id"], {}))
+    return articles
 
 
 def find_one(id):
-    return articles_collection.find_one({"article_id": id}, {"_id": 0, "embeddings": 0})
+    return articles_collection.find_one({"article_id": id}, {"_id": 0, "embeddings": 0, "title_tokens": 0})
 
 
-def get_random(limit=10):
+def find_vectors(ids, fields, version=None):
     """
-    Get random articles
+    Bulk read the vector documents (embeddings decoded to float32 arrays,
+    their model version, title token ids) of the articles `ids`, limited to
+    `fields`, by article _id. With `version`, only the embeddings computed by
+    that model version are returned.
     """
-    now = datetime.now()
-    return list(articles_collection.aggregate([{"$match": {"date": {"$lte": now}}}, {"$sample": {"size": limit}},
-                                               {"$addFields": {
-                                                   "id": {"$toString": "$_id"}
-                                               }
-    },
-        {"$project": {"_id": 0}}]))
+    query = {"_id": {"$in": ids}}
+    if version is not None:
+        query["embeddings_version"] = version
+    return {vector.pop("_id"): vector
+            for vector in with_decoded_embeddings(article_vectors_collection.find(query, fields))}
 
 
-def find_fresh(stale_articles, topic):
+def _with_vectors(articles, fields, batch_size=VECTOR_BATCH_SIZE):
     """
-    Find fresh articles that are not stale.
+    Stream the articles of the `articles` cursor with their vector fields,
+    reading the vectors with one bulk read per `batch_size` articles.
     """
-    now = datetime.now()
-    stale_ids = [ObjectId(article['article_id']) for article in stale_articles]
-    limit = 1000 if topic == "all" else 1000
-    pipeline = [
-        {"$match": {
-            "_id": {"$nin": stale_ids},
-            "date": {"$lte": now},
-        }},
-        {"$addFields": {"id": {"$toString": "$_id"}}},
-        {"$project": {"_id": 0}},
+    while batch := list(itertools.islice(articles, batch_size)):
+        vectors = find_vectors([article["_id"] for article in batch], fields)
+        for article in batch:
+            article.update(vectors.get(article["_id"], {}))
+            yield article
+
+
+def find_untokenized_titles():
+    """
+    Stream the titles of the articles that have no cached title token ids.
+    """
+    articles = articles_collection.find({"title": {"$nin": [None, ""]}}, {"title": 1}).sort("_id", 1)
+    return (article for article in _with_vectors(articles, {"title_tokens": 1})
+            if "title_tokens" not in article)
+
+
+def save_title_tokens(tokens_by_id):
+    """
+    Cache the title token ids of articles, by article _id, as bytes (see
+    article_recommender.model.title_tokens_to_bytes).
+    """
+    if tokens_by_id:
+        article_vectors_collection.bulk_write([
+            UpdateOne({"_id": id}, {"$set": {"title_tokens": tokens}}, upsert=True)
+            for id, tokens in tokens_by_id.items()
+        ], ordered=False)
+
+
+def find_pool_candidates(limit):
+    """
+    Get the `limit` most recent published articles that have a title and an
+    image, as article cards, most recent first.
+    """
+    return articles_collection.aggregate([
+        {"$match": {"date": {"$lte": datetime.now()},
+                    "title": {"$nin": [None, ""]},
+                    "image": {"$nin": [None, ""]}}},
         {"$sort": {"date": -1}},
-        {"$limit": limit}
-    ]
-    if topic != "all":
-        pipeline[0]["$match"]["topic"] = topic
-    return list(articles_collection.aggregate(pipeline))
+        {"$limit": limit},
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$project": {"_id": 0, "id": 1, **PROJECTION}},
+    ])
+
+
+def find_candidate_vectors(after_id=None, ids=None, version=None):
+    """
+    Stream the servable fields (id, date, topic, embeddings as float32 arrays
+    and their model version) of articles, either inserted after `after_id` or
+    matching `ids` (looked up ID_BATCH_SIZE at a time), in insertion order.
+    With `version`, only the articles whose embeddings were computed by that
+    model version are returned.
+    """
+    fields = {"embeddings": 1, "embeddings_version": 1}
+    if ids is not None:
+        ids = sorted(ids)
+        for start in range(0, len(ids), ID_BATCH_SIZE):
+            # Read the vectors first: only the articles they cover are servable
+            vectors = find_vectors(ids[start:start + ID_BATCH_SIZE], fields, version)
+            if not vectors:
+                continue
+            articles = articles_collection.find(
+                {"_id": {"$in": list(vectors)}}, {"_id": 1, "date": 1, "topic": 1}).sort("_id", 1)
+            for article in articles:
+                article.update(vectors[article["_id"]])
+                yield article
+        return
+
+    query = {} if after_id is None else {"_id": {"$gt": after_id}}
+    articles = articles_collection.find(query, {"_id": 1, "date": 1, "topic": 1}).sort("_id", 1)
+    for article in _with_vectors(articles, fields):
+        if version is None or article.get("embeddings_version") == version:
+            yield article
+
+
+def find_stale_embeddings(version, after_id=None, limit=1000):
+    """
+    Get the titles (and cached title token ids) of up to `limit` articles
+    inserted after `after_id` whose embeddings are missing or were computed
+    by another model version than `version`, in insertion order.
+    """
+    query = {"title": {"$nin": [None, ""]}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    articles = articles_collection.find(query, {"title": 1}).sort("_id", 1)
+    stale = (article for article in _with_vectors(articles, {"embeddings_version": 1, "title_tokens": 1})
+             if article.get("embeddings_version") != version)
+    return list(itertools.islice(stale, limit))
+
+
+def save_embeddings(embeddings_by_id, version, dtype=EMBEDDING_STORAGE_DTYPE):
+    """
+    Store article embeddings (arrays or tensors), by article _id, as `dtype`
+    binary (see articles.embedding_codec), stamped with the version of the
+    model that computed them.
+    """
+    if embeddings_by_id:
+        article_vectors_collection.bulk_write([
+            UpdateOne({"_id": id}, {"$set": {"embeddings": encode_embedding(embeddings, dtype),
+                                             "embeddings_version": version}}, upsert=True)
+            for id, embeddings in embeddings_by_id.items()
+        ], ordered=False)
+
+
+def find_embeddings_to_convert(dtype, after_id=None, limit=1000):
+    """
+    Get the embeddings of up to `limit` articles inserted after `after_id`
+    that are stored as BSON arrays or as binary of another dtype than
+    `dtype`, in insertion order, undecoded.
+    """
+    query = {"$or": [{"embeddings": {"$type": "array"}},
+                     {"embeddings.dtype": {"$exists": True, "$ne": dtype}}]}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    return list(article_vectors_collection.find(query, {"embeddings": 1}).sort("_id", 1).limit(limit))
+
+
+def save_stored_embeddings(stored_by_id):
+    """
+    Replace the stored form of article embeddings, by article _id, keeping
+    their version stamp.
+    """
+    if stored_by_id:
+        article_vectors_collection.bulk_write([
+            UpdateOne({"_id": id}, {"$set": {"embeddings": stored}})
+            for id, stored in stored_by_id.items()
+        ], ordered=False)
+
+
+def count_embedding_versions():
+    """
+    Number of articles by model version of their embeddings: None for the
+    articles without a version stamp, "missing" for those without
+    embeddings.
+    """
+    counts = article_vectors_collection.aggregate([
+        {"$match": {"embeddings": {"$exists": True, "$ne": None}}},
+        {"$group": {"_id": {"$ifNull": ["$embeddings_version", None]}, "count": {"$sum": 1}}},
+    ])
+    counts = {entry["_id"]: entry["count"] for entry in counts}
+    missing = articles_collection.count_documents({}) - sum(counts.values())
+    if missing:
+        counts["missing"] = missing
+    return counts
+
+
+def stamp_unversioned_embeddings(version):
+    """
+    Stamp the embeddings without a version with `version`. Only valid if
+    they were all computed by that model.
+    """
+    return article_vectors_collection.update_many(
+        {"embeddings": {"$exists": True, "$ne": None}, "embeddings_version": {"$exists": False}},
+        {"$set": {"embeddings_version": version}}).modified_count
+
+
+def find_unsplit_vectors(limit=1000):
+    """
+    Get up to `limit` articles that still hold vector fields (embeddings,
+    their version, title token ids) in their own document, undecoded.
+    """
+    return list(articles_collection.find(
+        {"$or": [{field: {"$exists": True}} for field in VECTOR_FIELDS]},
+        {field: 1 for field in VECTOR_FIELDS}).sort("_id", 1).limit(limit))
+
+
+def move_vectors(articles):
+    """
+    Move the vector fields of `articles` (as returned by
+    find_unsplit_vectors) to article_vectors, then drop them from the
+    articles. Fields already in article_vectors were written since the split
+    and are kept.
+    """
+    if not articles:
+        return
+    ids = [article["_id"] for article in articles]
+    existing = {vector["_id"]: vector for vector in article_vectors_collection.find(
+        {"_id": {"$in": ids}}, {field: 1 for field in VECTOR_FIELDS})}
+    updates = []
+    for article in articles:
+        fields = {field: article[field] for field in VECTOR_FIELDS
+                  if field in article and field not in existing.get(article["_id"], {})}
+        if fields:
+            updates.append(UpdateOne({"_id": article["_id"]}, {"$set": fields}, upsert=True))
+    if updates:
+        article_vectors_collection.bulk_write(updates, ordered=False)
+    articles_collection.update_many(
+        {"_id": {"$in": ids}}, {"$unset": {field: "" for field in VECTOR_FIELDS}})
+
+
+def find_existing_urls(urls):
+    """
+    The urls among `urls` that an article already has.
+    """
+    return {article["url"] for article in articles_collection.find({"url": {"$in": list(urls)}}, {"url": 1})}
+
+
+def insert_articles(articles):
+    """
+    Insert new articles, which must carry their _id when their vectors were
+    saved ahead of them.
+    """
+    if articles:
+        articles_collection.insert_many(articles, ordered=False)
+
+
+def find_by_ids(ids):
+    """
+    Find articles by their ids as article cards, keeping the order of `ids`.
+    """
+    articles = articles_collection.aggregate([
+        {"$match": {"_id": {"$in": [ObjectId(id) for id in ids]}}},
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$project": {"_id": 0, "id": 1, **PROJECTION}},
+    ])
+    by_id = {article["id"]: article for article in articles}
+    return [by_id[id] for id in ids if id in by_id]
 
 
 def get_top_topics(user_email):
@@ -56,3 +283,24 @@ def get_top_topics(user_email):
     top_topics = topic_interaction_collection.find(
         {"user": user_email}, {"_id": 0, "embeddings": 0}).sort({"count": -1}).limit(6)
     return list(top_topics)
+
+
+def find_precomputed_feed(user_id, topic, since):
+    """
+    Get the user's precomputed feed for `topic`, if it was computed after
+    `since`.
+    """
+    return precomputed_feeds_collection.find_one(
+        {"user": user_id, "topic": topic, "computed_at": {"$gte": since}}, {"_id": 0})
+
+
+def save_precomputed_feeds(feeds):
+    """
+    Upsert precomputed feeds, one per (user, topic).
+    """
+    if feeds:
+        precomputed_feeds_collection.bulk_write([
+            UpdateOne({"user": feed["user"], "topic": feed["topic"]},
+                      {"$set": feed}, upsert=True)
+            for feed in feeds
+        ], ordered=False)
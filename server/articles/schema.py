@@ -0,0 +1,32 @@
+from typing import Iterable, Optional, Tuple
+
+# Fields of an article card sent to the client. Anything else stored on an
+# article (embeddings in particular) never leaves the server.
+ARTICLE_FIELDS = ("id", "title", "url", "image",
+                  "publisher", "date", "topic", "keyword")
+
+# Mongo projection of the stored card fields; `id` is derived from `_id`
+PROJECTION = {field: 1 for field in ARTICLE_FIELDS if field != "id"}
+
+
+def parse_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """
+    Fields selected by a comma separated `fields=` query parameter, all
+    card fields if it is empty. Raises ValueError on unknown fields.
+    """
+    if not value:
+        return ARTICLE_FIELDS
+    fields = tuple(dict.fromkeys(field.strip()
+                   for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in ARTICLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def article_card(article: dict, fields: Tuple[str, ...] = ARTICLE_FIELDS) -> dict:
+    return {field: article[field] for field in fields if field in article}
+
+
+def article_cards(articles: Iterable[dict], fields: Tuple[str, ...] = ARTICLE_FIELDS) -> list:
+    return [article_card(article, fields) for article in articles]
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import interactions.repository as interactions_repository
+from articles.candidate_store import candidate_store
+
+RECENTLY_RECOMMENDED_WINDOW = timedelta(hours=1)
+BUCKET_SECONDS = 600
+SEEN_SET_CACHE_SIZE = int(os.getenv("SEEN_SET_CACHE_SIZE", 5000))
+# Seen-sets are reloaded after this long to pick up writes made by other
+# server processes
+SEEN_SET_TTL = float(os.getenv("SEEN_SET_TTL", 300))
+
+
+def _bucket(moment: datetime) -> int:
+    return int(moment.timestamp() // BUCKET_SECONDS)
+
+
+def _set_bits(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Set the bits of `rows`, growing the bitmap if needed. Returns the bitmap.
+    """
+    if len(rows) == 0:
+        return bitmap
+    needed = int(rows.max()) // 8 + 1
+    if needed > len(bitmap):
+        grown = np.zeros(max(needed, 2 * len(bitmap)), dtype=np.uint8)
+        grown[:len(bitmap)] = bitmap
+        bitmap = grown
+    np.bitwise_or.at(bitmap, rows >> 3, (1 << (rows & 7)).astype(np.uint8))
+    return bitmap
+
+
+def _test_bits(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the `rows` whose bit is set.
+    """
+    mask = np.zeros(len(rows), dtype=bool)
+    in_range = rows < len(bitmap) * 8
+    rows = rows[in_range]
+    mask[in_range] = (bitmap[rows >> 3] >> (rows & 7)) & 1 == 1
+    return mask
+
+
+class SeenSet:
+    """
+    Articles a user should not be recommended, as bitmaps over the dense
+    candidate-store rows: everything they opened, plus one bitmap per
+    BUCKET_SECONDS time bucket of recent recommendations. Buckets older than
+    RECENTLY_RECOMMENDED_WINDOW are dropped, so the window is accurate to one
+    bucket.
+
+    Article ids that are not in the candidate store yet are kept aside and
+    resolved once the store has loaded them.
+    """
+
+    def __init__(self):
+        self.opened = np.zeros(0, dtype=np.uint8)
+        self.recommended = {}  # bucket -> bitmap
+        self.unresolved = {}  # article id -> bucket, or None when opened
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_opened(self, article_ids):
+        with self._lock:
+            self._add(article_ids, None)
+
+    def add_recommended(self, article_ids, moment=None):
+        with self._lock:
+            self._add(article_ids, _bucket(moment or datetime.now()))
+
+    def _add(self, article_ids, bucket):
+        rows = []
+        for id in article_ids:
+            row = candidate_store.rows.get(id)
+            if row is None:
+                self.unresolved[id] = bucket
+            else:
+                rows.append(row)
+        rows = np.asarray(rows, dtype=np.int64)
+        if bucket is None:
+            self.opened = _set_bits(self.opened, rows)
+        else:
+            bitmap = self.recommended.get(bucket, np.zeros(0, dtype=np.uint8))
+            self.recommended[bucket] = _set_bits(bitmap, rows)
+
+    def _expire(self, now):
+        oldest = _bucket(now - RECENTLY_RECOMMENDED_WINDOW)
+        # Buckets are added in any order (interactions are loaded unsorted),
+        # so all of them are checked; there are a handful per window
+        for bucket in [bucket for bucket in self.recommended if bucket < oldest]:
+            del self.recommended[bucket]
+        self.unresolved = {id: bucket for id, bucket in self.unresolved.items()
+                           if bucket is None or bucket >= oldest}
+
+    @classmethod
+    def from_interactions(cls, interactions):
+        """
+        Build a seen-set from the documents returned by
+        interactions.repository.get_seen.
+        """
+        seen = cls()
+        seen.add_opened([interaction["article_id"] for interaction in interactions
+                         if interaction.get("is_opened")])
+        for interaction in interactions:
+            if not interaction.get("is_opened"):
+                seen.add_recommended(
+                    [interaction["article_id"]], interaction["last_recommended"])
+        return seen
+
+    def mask(self, rows: np.ndarray, now=None) -> np.ndarray:
+        """
+        Boolean mask of the `rows` the user has already seen.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._expire(now)
+            if self.unresolved:
+                unresolved, self.unresolved = self.unresolved, {}
+                for id, bucket in unresolved.items():
+                    self._add([id], bucket)
+
+            seen = _test_bits(self.opened, rows)
+            for bitmap in self.recommended.values():
+                seen |= _test_bits(bitmap, rows)
+            return seen
+
+
+class SeenSets:
+    """
+    Bounded LRU of per-user seen-sets, loaded from the interactions on first
+    use and kept up to date by the interaction writes of this process.
+    """
+
+    def __init__(self, max_size: int = SEEN_SET_CACHE_SIZE, ttl: float = SEEN_SET_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> SeenSet:
+        seen = self.get_cached(user_id)
+        if seen is None:
+            seen = SeenSet.from_interactions(interactions_repository.get_seen(
+                user_id, datetime.now() - RECENTLY_RECOMMENDED_WINDOW))
+            self.put(user_id, seen)
+        return seen
+
+    def get_cached(self, user_id: str):
+        """
+        The user's seen-set if it is cached and younger than the TTL.
+        """
+        with self._lock:
+            seen = self._entries.get(user_id)
+            if seen is None or time.monotonic() - seen.loaded_at >= self.ttl:
+                return None
+            self._entries.move_to_end(user_id)
+            return seen
+
+    def put(self, user_id: str, seen: SeenSet):
+        with self._lock:
+            self._entries[user_id] = seen
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _cached(self, user_id: str):
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def mark_opened(self, user_id: str, article_id: str):
+        seen = self._cached(user_id)
+        if seen is not None:
+            seen.add_opened([article_id])
+
+    def mark_recommended(self, user_id: str, article_ids):
+        seen = self._cached(user_id)
+        if seen is not None:
+            seen.add_recommended(article_ids)
+
+
+seen_sets = SeenSets()
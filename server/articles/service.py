@@ -1,58 +1,214 @@
 import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
 from bson import ObjectId
-from flask import jsonify
-from article_recommender.model import load_model, recommend_topk_from_embeddings, recommend_topk_from_titles
+from article_recommender.engine import InferenceEngine
+from article_recommender.model import (encode_title_tokens, load_model, model_version, prepare_model,
+                                       title_tokens_from_bytes, title_tokens_to_bytes)
 import articles.repository as repository
+from articles.candidate_store import candidate_store
+from articles.cold_start_pool import cold_start_pool
+from articles.feed_session import FEED_PREFETCH_WORKERS, FEED_SESSION_DEPTH, PRECOMPUTED_FEED_MAX_AGE, FeedSession, feed_sessions
+from articles.schema import ARTICLE_FIELDS, article_card, article_cards
+from articles.seen_set import seen_sets
+from articles.user_cache import user_embedding_cache, history_version
 import interactions.service as interactions_service
 import interactions.repository as interactions_repository
+import numpy as np
 import torch
 
 
-model = load_model()
-
-
-def recommend(user_id, topic, page_size):
-    interaction_data = interactions_repository.get_user_interaction_data(
-        user_id)
-    stale_articles = interaction_data["stale_articles"]
-    viewed_articles_ids = interaction_data["viewed_articles"]
-
-    if not viewed_articles_ids:
-        return jsonify(get_some_articles())
-
-    candidates = repository.find_fresh(stale_articles, topic)
-    if not candidates:
-        return jsonify([])
-
-    viewed_articles_ids = [ObjectId(article['article_id'])
-                           for article in viewed_articles_ids]
-
-    viewed_articles = repository.find_many(viewed_articles_ids)
-
-    _scores, recommended_articles_id = recommend_topk_from_embeddings(
-        model=model,
-        history_titles=[article['title'] for article in viewed_articles],
-        candidate_emb=torch.tensor(
-            [article['embeddings'] for article in candidates]),
-        topk=page_size,
-        device=torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    )
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# The model is loaded on the first request that needs it. Set PRELOAD_MODEL
+# to load it at import instead, e.g. in the master of a pre-forking server
+# (gunicorn --preload) so that the workers share its weights copy-on-write.
+engine = InferenceEngine(lambda: prepare_model(load_model(), device=device), device)
+if os.getenv("PRELOAD_MODEL", "").lower() in ("1", "true", "yes"):
+    engine.load()
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=FEED_PREFETCH_WORKERS, thread_name_prefix="feed-prefetch")
+# Cache writes the requests do not wait for
+write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-write")
+
+
+def recommend(user_id, topic, page_size, fields=ARTICLE_FIELDS, session_token=None):
+    """
+    Next page of the user's feed, and the token of the feed session it was
+    served from (None for users without history).
+    """
+    session = feed_sessions.get(session_token, user_id, topic)
+    if session is None or session.exhausted:
+        session = start_feed_session(user_id, topic)
+        if session is None:
+            return get_some_articles(topic, fields), None
+
+    recommended_rows = session.next_page(page_size, seen_sets.get(user_id))
+    if len(recommended_rows) == 0:
+        return [], session.token
+    recommended_ids = candidate_store.article_ids(recommended_rows)
 
     interactions_service.record_many_recommended(
         user_id=user_id,
-        article_ids=[candidates[i]['id'] for i in recommended_articles_id])
+        article_ids=recommended_ids)
+
+    prefetched = session.take_prefetched(recommended_ids)
+    if prefetched is not None:
+        res = select_cards(prefetched.result(), recommended_ids)
+    else:
+        res = repository.find_by_ids(recommended_ids)
+    prefetch_next_page(session, page_size)
+    return article_cards(res, fields), session.token
+
+
+def start_feed_session(user_id, topic):
+    """
+    Rank the candidates for the user once, and keep the ranking in a new
+    feed session. The ranking is taken from the precomputed feeds when one
+    is fresh and was computed from the user's current history by the
+    served model. Returns None if the user has no history yet, or while the
+    candidate store is still loading.
+    """
+    viewed_articles_ids = interactions_repository.get_viewed(user_id)
 
-    res = [candidates[i] for i in recommended_articles_id]
-    return jsonify(res)
+    if not viewed_articles_ids:
+        return None
+    viewed_ids = [article['article_id'] for article in viewed_articles_ids]
+
+    candidate_store.start()
+    if not candidate_store.size:
+        return None
+    seen = seen_sets.get(user_id)
+    ranked_rows = precomputed_rows(
+        repository.find_precomputed_feed(
+            user_id, topic, datetime.datetime.now() - PRECOMPUTED_FEED_MAX_AGE),
+        history_version(viewed_ids), seen)
+    if ranked_rows is None:
+        user_emb = get_user_embedding(user_id, viewed_ids)
+        ranked_rows, _scores = candidate_store.search(
+            user_emb.numpy(),
+            topic,
+            seen,
+            k=FEED_SESSION_DEPTH,
+        )
+    session = FeedSession(user_id, topic, ranked_rows)
+    feed_sessions.put(session)
+    return session
+
+
+def precomputed_rows(feed, version, seen):
+    """
+    Candidate rows of a precomputed feed, still servable and not seen, or
+    None if there is no feed for the user's current history version.
+    """
+    if (feed is None or feed["history_version"] != version
+            or feed.get("model_version") != model_version()):
+        return None
+    rows = np.array([candidate_store.rows[id] for id in feed["article_ids"]
+                     if id in candidate_store.rows], dtype=np.int64)
+    rows = candidate_store.filter_rows(rows, feed["topic"], seen)
+    return rows if len(rows) else None
+
+
+def prefetch_next_page(session, page_size):
+    """
+    Load the cards of the session's next page in the background.
+    """
+    next_ids = candidate_store.article_ids(session.peek(page_size))
+    if next_ids:
+        session.set_prefetched(
+            next_ids, prefetch_executor.submit(repository.find_by_ids, next_ids))
+
+
+def select_cards(cards, article_ids):
+    by_id = {card["id"]: card for card in cards}
+    return [by_id[id] for id in article_ids if id in by_id]
+
+
+def get_user_embedding(user_id, viewed_article_ids):
+    """
+    Get the user embedding from the cache, encoding the click history only
+    when it changed since the last request.
+    """
+    version = history_version(viewed_article_ids)
+    user_emb = user_embedding_cache.get(user_id, version)
+    if user_emb is not None:
+        return user_emb
+
+    viewed_articles = repository.find_many_with_embeddings(
+        [ObjectId(article_id) for article_id in viewed_article_ids])
+    user_emb = engine.encode_user(
+        get_history_embeddings(viewed_articles)).result()
+    user_embedding_cache.put(user_id, version, user_emb)
+    return user_emb
+
+
+def get_history_embeddings(viewed_articles):
+    """
+    Stack the stored embeddings of the viewed articles, encoding through the
+    NewsEncoder only the articles that have no stored embedding yet, or one
+    computed by another model version.
+    """
+    history_emb = torch.empty((len(viewed_articles), engine.model.d_embed_news))
+    rows = history_emb.numpy()
+    version = model_version()
+    missing = []
+    for i, article in enumerate(viewed_articles):
+        if has_current_embedding(article, version):
+            rows[i] = article['embeddings']
+        else:
+            missing.append(i)
+
+    if missing:
+        history_emb[missing] = engine.encode_news(
+            get_title_tokens([viewed_articles[i] for i in missing])).result()
+    return history_emb
+
+
+def has_current_embedding(article, version):
+    return article.get('embeddings') is not None and article.get('embeddings_version') == version
+
+
+def get_title_tokens(articles):
+    """
+    Token ids of the titles of the articles, from the ids cached on the
+    article. Titles without cached ids are tokenized here, off the inference
+    worker, and their ids are cached for the next time in the background.
+    """
+    tokens = [title_tokens_from_bytes(article['title_tokens']) if article.get('title_tokens') else None
+              for article in articles]
+    misses = [i for i, ids in enumerate(tokens) if ids is None]
+    if misses:
+        encoded = encode_title_tokens([articles[i]['title'] for i in misses])
+        for i, ids in zip(misses, encoded):
+            tokens[i] = ids
+        write_executor.submit(repository.save_title_tokens, {
+            articles[i]['_id']: title_tokens_to_bytes(ids) for i, ids in zip(misses, encoded)
+        }).add_done_callback(report_write_failure)
+    return tokens
+
+
+def report_write_failure(future):
+    if future.exception() is not None:
+        print(f"Caching title tokens failed: {future.exception()}")
+
+
+def get_inference_metrics():
+    return engine.metrics()
 
 
 def get_top_topics(user_id):
     return repository.get_top_topics(user_id)
 
 
-def get_some_articles():
-    return repository.get_random(10)
+def get_some_articles(topic="all", fields=ARTICLE_FIELDS):
+    cold_start_pool.start()
+    return article_cards(cold_start_pool.sample(10, topic), fields)
 
 
-def get_random_article():
-    return repository.get_random(1)[0]
+def get_random_article(fields=ARTICLE_FIELDS):
+    """
+    A random article, or None while the cold start pool is still loading.
+    """
+    cold_start_pool.start()
+    articles = cold_start_pool.sample(1)
+    return article_card(articles[0], fields) if articles else None
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import torch
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+
+def history_version(article_ids: List[str]) -> str:
+    """
+    Digest of the ordered click history. Any new open changes the list
+    returned by the interactions aggregate, and therefore the version.
+    """
+    return hashlib.sha1(",".join(article_ids).encode()).hexdigest()
+
+
+class UserEmbeddingCache:
+    """
+    Bounded LRU cache of user embeddings, keyed by user and history version.
+
+    An entry is only returned if it was computed from the same history
+    version, so a stale embedding is never served even if an open event was
+    written by another process.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (version, embedding)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, version: str) -> Optional[torch.Tensor]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id: str, version: str, embedding: torch.Tensor):
+        with self._lock:
+            self._entries[user_id] = (version, embedding)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_embedding_cache = UserEmbeddingCache()
@@ -0,0 +1,43 @@
+# Async serving mode: the same API as app.py as an ASGI app, with Mongo
+# accessed through the async driver. Run it with an ASGI server, e.g.
+#   hypercorn asgi:app --bind 0.0.0.0:5000
+from quart import Quart
+from quart_cors import cors
+import os
+from dotenv import load_dotenv
+from json_provider import FastJSONProvider
+
+load_dotenv()
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app)
+app.config.update({
+    "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "super-secret"),
+    "GOOGLE_CLIENT_ID": os.getenv("GOOGLE_CLIENT_ID")
+})
+app = cors(app, expose_headers=["X-Feed-Session"])
+
+from articles.async_controller import blueprint as articles_blueprint
+from interactions.async_controller import blueprint as interactions_blueprint
+from proxy.async_controller import blueprint as proxy_blueprint
+from articles.candidate_store import candidate_store
+from articles.cold_start_pool import cold_start_pool
+
+app.register_blueprint(articles_blueprint)
+app.register_blueprint(interactions_blueprint)
+app.register_blueprint(proxy_blueprint)
+
+
+@app.before_serving
+async def start_background_refreshes():
+    # Load the candidates and the cold start pool in the background from
+    # startup on
+    candidate_store.start()
+    cold_start_pool.start()
+
+
+if __name__ == '__main__':
+    from db_scripts.indexes import create_indexes
+    create_indexes()
+    print("Starting the async server...")
+    app.run(port=5000)
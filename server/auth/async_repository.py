@@ -0,0 +1,11 @@
+from db_async import user_collection
+
+
+async def upsert_one(user_data: dict):
+    await user_collection.update_one(
+        {'email': user_data["email"]},
+        {'$setOnInsert':
+            user_data
+         },
+        upsert=True
+    )
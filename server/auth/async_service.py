@@ -0,0 +1,47 @@
+import asyncio
+from functools import wraps
+from quart import request, jsonify
+import auth.async_repository as repository
+from auth.service import get_bearer_token, decode_token, token_error, user_fields
+from auth.token_cache import known_users, token_cache
+
+
+def auth_required(f):
+    """
+    Async version of auth.service.auth_required for the ASGI app.
+
+    Expected header format: "Authorization: Bearer <token>"
+
+    The user's email is passed to the decorated coroutine as 'user_email'.
+    """
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        token, error = get_bearer_token(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
+
+        try:
+            decoded_payload = token_cache.get(token)
+            if decoded_payload is None:
+                # A JWKS cache miss fetches the signing keys over HTTP
+                decoded_payload = await asyncio.get_running_loop().run_in_executor(
+                    None, decode_token, token)
+
+            # Upsert the user only the first time this process sees them
+            if decoded_payload['email'] not in known_users:
+                await find_or_create_user(decoded_payload)
+                known_users.add(decoded_payload['email'])
+
+        except Exception as e:
+            error, status = token_error(e)
+            return jsonify({'error': error}), status
+        return await f(user_email=decoded_payload['email'], *args, **kwargs)
+
+    return decorated_function
+
+
+async def find_or_create_user(user_data: dict):
+    """
+    Find a user by their email, or create a new user if not found.
+    """
+    await repository.upsert_one(user_fields(user_data))
@@ -1,8 +1,31 @@
+import os
 from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError, DecodeError
 import auth.repository as repository
+from auth.token_cache import token_cache, known_users
+
+AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
+# The client authenticates with its Auth0 ID token, whose audience is the
+# client id of the single page application
+AUTH0_CLIENT_ID = os.getenv("AUTH0_CLIENT_ID")
+ALGORITHMS = os.getenv("ALGORITHMS", "RS256").split(",")
+JWKS_CACHE_LIFESPAN = int(os.getenv("JWKS_CACHE_LIFESPAN", 3600))
+
+# Fetches the signing keys once and caches them; an unknown key id triggers
+# a refetch, so key rotation is picked up
+jwks_client = jwt.PyJWKClient(
+    f"https://{AUTH0_DOMAIN}/.well-known/jwks.json",
+    cache_keys=True,
+    lifespan=JWKS_CACHE_LIFESPAN,
+) if AUTH0_DOMAIN else None
+if not (AUTH0_DOMAIN and AUTH0_CLIENT_ID):
+    print("AUTH0_DOMAIN and AUTH0_CLIENT_ID must be set: authenticated routes answer 503 until they are")
+
+
+class AuthNotConfigured(Exception):
+    pass
 
 
 def auth_required(f):
@@ -15,44 +38,94 @@ def auth_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Get the Authorization header
-        auth_header = request.headers.get('Authorization')
-
-        if not auth_header:
-            return jsonify({'error': 'Authorization header is required'}), 401
-
-        # Extract token from "Bearer <token>" format
-        try:
-            token_type, token = auth_header.split(' ', 1)
-            if token_type.lower() != 'bearer':
-                return jsonify({'error': 'Invalid authorization header format. Expected: Bearer <token>'}), 401
-        except ValueError:
-            return jsonify({'error': 'Invalid authorization header format. Expected: Bearer <token>'}), 401
+        token, error = get_bearer_token(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
 
         try:
-            decoded_payload = jwt.decode(token, algorithms=["RS256"],  options={
-                "verify_signature": False})
+            decoded_payload = decode_token(token)
 
-            find_or_create_user(decoded_payload)
+            # Upsert the user only the first time this process sees them
+            if decoded_payload['email'] not in known_users:
+                find_or_create_user(decoded_payload)
+                known_users.add(decoded_payload['email'])
 
-        except ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except DecodeError:
-            return jsonify({'error': 'Invalid token format'}), 401
-        except InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
         except Exception as e:
-            return jsonify({'error': f'Token validation failed {e}'}), 500
-        print(f"User {decoded_payload['email']} authenticated successfully")
+            error, status = token_error(e)
+            return jsonify({'error': error}), status
         return f(user_email=decoded_payload['email'], *args, **kwargs)
 
     return decorated_function
 
 
+def get_bearer_token(auth_header):
+    """
+    Extract the token from a "Bearer <token>" Authorization header.
+
+    Returns: (token, None), or (None, error message) if the header is invalid.
+    """
+    if not auth_header:
+        return None, 'Authorization header is required'
+
+    try:
+        token_type, token = auth_header.split(' ', 1)
+    except ValueError:
+        return None, 'Invalid authorization header format. Expected: Bearer <token>'
+    if token_type.lower() != 'bearer':
+        return None, 'Invalid authorization header format. Expected: Bearer <token>'
+    return token, None
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verify and decode the Auth0 ID token (audience AUTH0_CLIENT_ID) against
+    the Auth0 signing keys, raising a jwt exception if it is invalid. Verified payloads are cached until the
+    token expires, so the signature is checked once per token.
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    if jwks_client is None or not AUTH0_CLIENT_ID:
+        raise AuthNotConfigured("AUTH0_DOMAIN and AUTH0_CLIENT_ID must be set")
+    signing_key = jwks_client.get_signing_key_from_jwt(token)
+    payload = jwt.decode(
+        token,
+        signing_key.key,
+        algorithms=ALGORITHMS,
+        audience=AUTH0_CLIENT_ID,
+        issuer=f"https://{AUTH0_DOMAIN}/",
+        options={"require": ["exp", "aud"]},
+    )
+    token_cache.put(token, payload)
+    return payload
+
+
+def token_error(e: Exception):
+    """
+    Map a token validation exception to an error message and HTTP status.
+    """
+    if isinstance(e, AuthNotConfigured):
+        return 'Authentication is not configured', 503
+    if isinstance(e, ExpiredSignatureError):
+        return 'Token has expired', 401
+    if isinstance(e, DecodeError):
+        return 'Invalid token format', 401
+    if isinstance(e, InvalidTokenError):
+        return 'Invalid token', 401
+    return f'Token validation failed {e}', 500
+
+
+def user_fields(user_data: dict) -> dict:
+    """
+    The token claims stored on the user document.
+    """
+    return {key: user_data[key] for key in [
+        "name", "given_name", "family_name", "nickname", "picture", "email"] if key in user_data}
+
+
 def find_or_create_user(user_data: dict):
     """
     Find a user by their email, or create a new user if not found.
     """
-    user_data = {key: user_data[key] for key in [
-        "name", "given_name", "family_name", "nickname", "picture", "email"] if key in user_data}
-    repository.upsert_one(user_data)
+    repository.upsert_one(user_fields(user_data))
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 3600))
+KNOWN_USERS_SIZE = int(os.getenv("KNOWN_USERS_SIZE", 100000))
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified token payloads keyed by the token's hash.
+
+    An entry lives for at most `ttl` seconds and never past the token's
+    `exp` claim, so an expired token is always re-verified (and rejected).
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token hash -> (payload, expires_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token: str, payload: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class KnownUsers:
+    """
+    Bounded LRU set of the users this process already upserted.
+    """
+
+    def __init__(self, max_size: int = KNOWN_USERS_SIZE):
+        self.max_size = max_size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, user: str) -> bool:
+        with self._lock:
+            if user not in self._users:
+                return False
+            self._users.move_to_end(user)
+            return True
+
+    def add(self, user: str):
+        with self._lock:
+            self._users[user] = True
+            self._users.move_to_end(user)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+
+token_cache = TokenCache()
+known_users = KnownUsers()
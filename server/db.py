@@ -10,6 +10,8 @@ client = MongoClient(MONGO_URL)
 db = client["hermes"]
 user_collection = db["users"]
 articles_collection = db["articles"]
+article_vectors_collection = db["article_vectors"]
 interactions_collection = db["interactions"]
 topic_interaction_collection = db["topic_interactions"]
+precomputed_feeds_collection = db["precomputed_feeds"]
 print("Connected to MongoDB")
@@ -0,0 +1,16 @@
+# connect to mongoDB with the async driver, used by the ASGI serving mode
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL")
+
+client = AsyncIOMotorClient(MONGO_URL)
+db = client["hermes"]
+user_collection = db["users"]
+articles_collection = db["articles"]
+article_vectors_collection = db["article_vectors"]
+interactions_collection = db["interactions"]
+topic_interaction_collection = db["topic_interactions"]
+precomputed_feeds_collection = db["precomputed_feeds"]
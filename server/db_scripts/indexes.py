@@ -1,4 +1,4 @@
-from db import articles_collection, interactions_collection
+from db import articles_collection, interactions_collection, user_collection, precomputed_feeds_collection
 from pymongo import IndexModel, ASCENDING, DESCENDING
 
 
@@ -9,11 +9,21 @@ def create_indexes():
     print("INDEXING")
     articles_collection.create_indexes([
         IndexModel([("date", DESCENDING)]),
-        IndexModel([("topic", ASCENDING)])
+        IndexModel([("topic", ASCENDING)]),
+        IndexModel([("url", ASCENDING)])
     ])
 
     interactions_collection.create_indexes([
         IndexModel([("user", ASCENDING), ("last_recommended", DESCENDING)]),
         IndexModel([("user", ASCENDING), ("is_opened", ASCENDING)]),
-        IndexModel([("user", ASCENDING), ("last_opened", DESCENDING)])
+        IndexModel([("user", ASCENDING), ("last_opened", DESCENDING)]),
+        IndexModel([("is_opened", ASCENDING), ("last_opened", DESCENDING)])
+    ])
+
+    user_collection.create_indexes([
+        IndexModel([("email", ASCENDING)])
+    ])
+
+    precomputed_feeds_collection.create_indexes([
+        IndexModel([("user", ASCENDING), ("topic", ASCENDING)], unique=True)
     ])
@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List
+
+# End of stream marker, passed from stage to stage
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: `process` takes a list of items and returns the
+    items to pass on, possibly fewer (filtered out) or transformed.
+
+    Items are handed to `process` in batches of up to `batch_size`: a batch
+    is closed when it is full or `max_wait` seconds after its first item,
+    so that the model stages batch under load without holding items back
+    when the input is slow. `workers` threads run the stage.
+    """
+
+    def __init__(self, name: str, process: Callable[[List], List], batch_size: int = 1,
+                 workers: int = 1, max_wait: float = 0.5):
+        self.name = name
+        self.process = process
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_wait = max_wait
+        self._stats_lock = threading.Lock()
+        self._stats = {"items_in": 0, "items_out": 0, "batches": 0, "errors": 0, "busy_seconds": 0.0}
+
+    def record(self, items_in, items_out, seconds, error=False):
+        with self._stats_lock:
+            self._stats["items_in"] += items_in
+            self._stats["items_out"] += items_out
+            self._stats["batches"] += 1
+            self._stats["errors"] += error
+            self._stats["busy_seconds"] += seconds
+
+    def metrics(self) -> dict:
+        """
+        Items in and out, batches and failed batches, and throughput: items
+        per second of work of one worker.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        busy = stats["busy_seconds"]
+        return {
+            **stats,
+            "dropped": stats["items_in"] - stats["items_out"],
+            "mean_batch_size": stats["items_in"] / (stats["batches"] or 1),
+            "items_per_second": stats["items_in"] / busy if busy else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    Streams the items of `source` through `stages`, each running in its own
+    threads, with a bounded queue of `queue_size` items in front of every
+    stage. A slow stage fills its queue, which blocks the stages upstream
+    down to the source: memory stays bounded however fast items come in.
+
+    A batch whose processing raises is logged and dropped, and the pipeline
+    goes on. Every `report_interval` seconds (and at the end), the metrics of
+    the stages are printed.
+    """
+
+    def __init__(self, source: Iterable, stages: List[Stage], queue_size: int = 1000,
+                 report_interval: float = 10):
+        self.source = source
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.report_interval = report_interval
+        self.fetched = 0
+        self.started = None
+        self._finished = threading.Event()
+
+    def run(self) -> dict:
+        """
+        Run the pipeline until the source is exhausted and every item went
+        through; returns the metrics.
+        """
+        self.started = time.monotonic()
+        threads = [threading.Thread(target=self._feed, name="ingest-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(index, remaining, lock),
+                    name=f"ingest-{stage.name}-{worker}", daemon=True))
+        reporter = threading.Thread(target=self._report, name="ingest-report", daemon=True)
+
+        for thread in threads:
+            thread.start()
+        reporter.start()
+        for thread in threads:
+            thread.join()
+        self._finished.set()
+        reporter.join()
+        self.print_metrics()
+        return self.metrics()
+
+    def _feed(self):
+        try:
+            for item in self.source:
+                self.queues[0].put(item)
+                self.fetched += 1
+        except Exception as e:
+            print(f"Ingest source failed after {self.fetched} items: {e}")
+        finally:
+            self.queues[0].put(_DONE)
+
+    def _next_batch(self, stage, inbox):
+        """
+        Up to `stage.batch_size` items, and whether the stream ended.
+        """
+        item = inbox.get()
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + stage.max_wait
+        while len(batch) < stage.batch_size:
+            try:
+                item = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self, index, remaining, lock):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        done = False
+        while not done:
+            batch, done = self._next_batch(stage, inbox)
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = stage.process(batch)
+            except Exception as e:
+                print(f"Ingest stage {stage.name} dropped a batch of {len(batch)}: {e}")
+                stage.record(len(batch), 0, time.perf_counter() - started, error=True)
+                continue
+            stage.record(len(batch), len(results), time.perf_counter() - started)
+            if outbox is not None:
+                for item in results:
+                    outbox.put(item)
+
+        # Let the other workers of the stage see the end of the stream; the
+        # last one to stop passes it downstream
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if not last:
+            inbox.put(_DONE)
+        elif outbox is not None:
+            outbox.put(_DONE)
+
+    def _report(self):
+        while not self._finished.wait(self.report_interval):
+            self.print_metrics()
+
+    def metrics(self) -> dict:
+        """
+        Items read from the source, wall time, and the metrics and queue
+        depth of every stage.
+        """
+        return {
+            "fetched": self.fetched,
+            "elapsed_seconds": time.monotonic() - self.started if self.started else 0.0,
+            "stages": {stage.name: {**stage.metrics(), "queue_depth": inbox.qsize()}
+                       for stage, inbox in zip(self.stages, self.queues)},
+        }
+
+    def print_metrics(self):
+        metrics = self.metrics()
+        print(f"Ingest: {metrics['fetched']} fetched in {metrics['elapsed_seconds']:.1f}s")
+        for name, stage in metrics["stages"].items():
+            print(f"  {name:10s} in {stage['items_in']:6d}  out {stage['items_out']:6d}  "
+                  f"errors {stage['errors']:3d}  queue {stage['queue_depth']:5d}  "
+                  f"batch {stage['mean_batch_size']:6.1f}  {stage['items_per_second']:8.1f} items/s")
@@ -0,0 +1,195 @@
+import csv
+import json
+import os
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from langdetect import DetectorFactory, LangDetectException, detect
+
+from article_recommender.model import (calculate_candidate_embeddings, encode_title_tokens, load_model,
+                                       prepare_model, title_tokens_to_bytes)
+import articles.repository as repository
+from ingest.pipeline import Stage
+
+# Zero-shot topic classification of the titles (see model/topic_classifier.ipynb)
+TOPICS = ["politics", "geopolitics", "economics", "entertainment",
+          "lifestyle", "sports", "science", "health", "business", "technology"]
+TOPIC_MODEL = os.getenv("TOPIC_MODEL", "FacebookAI/roberta-large-mnli")
+TOPIC_HYPOTHESIS = "Under which topic would I see the following article in the news? The topics are: {}."
+
+# Stored article fields, besides the ones derived here (date, publisher, topic)
+ARTICLE_FIELDS = ("title", "url", "image", "keyword", "country")
+
+# Language detection is randomized; seed it so that reruns agree
+DetectorFactory.seed = 0
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _load(name, loader):
+    """
+    Model `name`, loaded on first use by `loader` and shared by the workers.
+    """
+    if name not in _models:
+        with _models_lock:
+            if name not in _models:
+                _models[name] = loader()
+    return _models[name]
+
+
+def read_csv_articles(path):
+    """
+    Stream the rows of a news CSV (as data/google_news.csv: url, title,
+    publisher, date, image, ...) as raw articles.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl_articles(path):
+    """
+    Stream raw articles (GNews API articles, or news CSV rows) stored one
+    JSON object per line.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _parse_date(value):
+    """
+    Local naive datetime of a publication date (datetime or ISO 8601
+    string), as the served articles are compared with datetime.now(). None
+    if unparseable.
+    """
+    if not value:
+        return None
+    try:
+        date = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    return date
+
+
+def normalize(raw_articles):
+    """
+    Articles in the stored form, from news CSV rows or GNews API articles.
+    Articles without a title, url, image or valid date are dropped.
+    """
+    articles = []
+    for raw in raw_articles:
+        article = {field: raw[field].strip() for field in ARTICLE_FIELDS
+                   if isinstance(raw.get(field), str) and raw[field].strip()}
+        source = raw.get("source")
+        publisher = raw.get("publisher") or (source.get("name") if isinstance(source, dict) else source)
+        if publisher:
+            article["publisher"] = publisher
+        article["date"] = _parse_date(raw.get("date") or raw.get("publishedAt"))
+        if all(article.get(field) for field in ("title", "url", "image", "date")):
+            articles.append(article)
+    return articles
+
+
+class Deduplicator:
+    """
+    Drops the articles whose url was already ingested, in this run or
+    before.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = set()
+
+    def __call__(self, articles):
+        with self._lock:
+            fresh = {}
+            for article in articles:
+                if article["url"] not in self._seen:
+                    self._seen.add(article["url"])
+                    fresh[article["url"]] = article
+        existing = repository.find_existing_urls(fresh) if fresh else set()
+        return [article for url, article in fresh.items() if url not in existing]
+
+
+def is_english(text):
+    try:
+        return detect(text) == "en"
+    except LangDetectException:
+        return False
+
+
+def keep_english(articles):
+    """
+    Drops the articles whose title is not in English.
+    """
+    return [article for article in articles if is_english(article["title"])]
+
+
+def _load_topic_classifier():
+    from transformers import pipeline
+    return pipeline("zero-shot-classification", model=TOPIC_MODEL, hypothesis_template=TOPIC_HYPOTHESIS)
+
+
+def classify_topics(articles):
+    """
+    Sets the topic of the articles, classifying their titles in one batch.
+    """
+    classifier = _load("topics", _load_topic_classifier)
+    results = classifier([article["title"] for article in articles], candidate_labels=TOPICS,
+                         batch_size=len(articles))
+    for article, result in zip(articles, results):
+        article["topic"] = result["labels"][0]
+    return articles
+
+
+def embed(articles):
+    """
+    Sets the NRMS embedding, its model version and the title token ids of
+    the articles, encoding them in one batch.
+    """
+    model = _load("nrms", lambda: prepare_model(load_model(), "float32", backend="eager"))
+    tokens = encode_title_tokens([article["title"] for article in articles])
+    embeddings = calculate_candidate_embeddings(model, tokens).cpu().numpy()
+    for article, ids, embedding in zip(articles, tokens, embeddings):
+        article["title_tokens"] = ids
+        article["embeddings"] = embedding
+        article["embeddings_version"] = model.version
+    return articles
+
+
+def store(articles):
+    """
+    Writes the vectors of the articles, then the articles: an article is only
+    ever visible fully enriched, so the candidate store and the cold start
+    pool never pick it up half done.
+    """
+    by_version = {}
+    for article in articles:
+        article["_id"] = ObjectId()
+        by_version.setdefault(article.pop("embeddings_version"), {})[article["_id"]] = article.pop("embeddings")
+    for version, embeddings_by_id in by_version.items():
+        repository.save_embeddings(embeddings_by_id, version)
+    repository.save_title_tokens({article["_id"]: title_tokens_to_bytes(article.pop("title_tokens"))
+                                  for article in articles})
+    repository.insert_articles(articles)
+    return articles
+
+
+def ingest_stages(topic_batch_size=64, embed_batch_size=256, store_batch_size=500, language_workers=2):
+    """
+    The ingest stages: dedupe -> language -> topic -> embed -> store, after
+    normalizing the fetched articles.
+    """
+    return [
+        Stage("normalize", normalize, batch_size=100),
+        Stage("dedupe", Deduplicator(), batch_size=200),
+        Stage("language", keep_english, batch_size=50, workers=language_workers),
+        Stage("topic", classify_topics, batch_size=topic_batch_size),
+        Stage("embed", embed, batch_size=embed_batch_size),
+        Stage("store", store, batch_size=store_batch_size, max_wait=1.0),
+    ]
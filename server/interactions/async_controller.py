@@ -0,0 +1,13 @@
+from quart import Blueprint
+import interactions.async_service as service
+
+from auth.async_service import auth_required
+
+blueprint = Blueprint('interactions', __name__)
+
+
+@blueprint.route('/api/interactions/<article_id>', methods=['POST'])
+@auth_required
+async def open_article(user_email, article_id):
+    await service.record_opened(user_email, article_id)
+    return 'article opened', 201
@@ -0,0 +1,36 @@
+from db_async import interactions_collection
+from interactions.write_behind import interaction_sink
+
+
+async def record_open(user_email, article_id):
+    # Buffered in the interaction sink, which writes behind the request
+    interaction_sink.record_open(user_email, article_id)
+
+
+async def record_many_recommended(user_id, article_ids):
+    interaction_sink.record_recommended(user_id, article_ids)
+
+
+async def get_viewed(user_id, limit=50):
+    """
+    Get the most recently opened articles of the user.
+    """
+    viewed = await interactions_collection.find(
+        {"user": user_id, "is_opened": True},
+        {"_id": 0, "article_id": 1}
+    ).sort("last_opened", -1).limit(limit).to_list(None)
+    return interaction_sink.overlay_viewed(user_id, viewed, limit)
+
+
+async def get_seen(user_id, since):
+    """
+    Get the articles opened by the user, or recommended to them since `since`.
+    """
+    seen = await interactions_collection.find(
+        {"user": user_id, "$or": [
+            {"last_recommended": {"$gte": since}},
+            {"is_opened": True},
+        ]},
+        {"_id": 0, "article_id": 1, "is_opened": 1, "last_recommended": 1}
+    ).to_list(None)
+    return interaction_sink.overlay_seen(user_id, seen, since)
@@ -0,0 +1,20 @@
+import interactions.async_repository as repository
+from articles.seen_set import seen_sets
+from articles.user_cache import user_embedding_cache
+
+
+async def record_opened(user_email, article_id):
+    """
+    Handle the interaction with an article by the user.
+    """
+    await repository.record_open(user_email, article_id)
+    user_embedding_cache.invalidate(user_email)
+    seen_sets.mark_opened(user_email, article_id)
+
+
+async def record_many_recommended(user_id, article_ids):
+    """
+    Handle the recommendation interaction with multiple articles by the user.
+    """
+    await repository.record_many_recommended(user_id, article_ids)
+    seen_sets.mark_recommended(user_id, article_ids)
@@ -1,66 +1,75 @@
-from bson import ObjectId
-from sympy import true
-from db import interactions_collection, topic_interaction_collection, articles_collection
-from datetime import datetime, timedelta
+from db import interactions_collection
+from interactions.write_behind import interaction_sink
 
 
 def record_open(user_email, article_id):
-    now = datetime.now()
+    interaction_sink.record_open(user_email, article_id)
 
-    interactions_collection.update_one(
-        {"user": user_email, "article_id": article_id},
-        {"$set": {"last_opened": now, "is_opened": True}},
-        upsert=True
-    )
 
-    article = articles_collection.find_one({
-        "_id": ObjectId(article_id)
-    }, {"topic": 1})
+def record_recommended(user_id, article_id):
+    interaction_sink.record_recommended(user_id, [article_id])
 
-    topic_interaction_collection.update_one(
-        {"user": user_email, "topic": article["topic"]},
-        {"$inc": {"count": 1}},
-        upsert=True
-    )
 
+def record_many_recommended(user_id, article_ids):
+    interaction_sink.record_recommended(user_id, article_ids)
 
-def record_recommended(user_id, article_id):
-    now = datetime.now()
-    interactions_collection.update_one(
-        {"user": user_id, "article_id": article_id},
-        {"$set": {"last_recommended": now}},
-        upsert=True
-    )
-
-
-def get_user_interaction_data(user_id):
-    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-
-    pipeline = [
-        {"$match": {"user": user_id}},
-        {
-            "$facet": {
-                "stale_articles": [
-                    {
-                        "$match": {
-                            "$or": [
-                                {"last_recommended": {"$gte": one_hour_ago}},
-                                {"is_opened": True},
-                            ]
-                        }
-                    },
-                    {"$project": {"_id": 0, "article_id": 1}},
-                ],
-                "viewed_articles": [
-                    {"$match": {"is_opened": True}},
-                    {"$sort": {"last_opened": -1}},
-                    {"$limit": 50},
-                    {"$project": {"_id": 0, "article_id": 1}},
-                ],
-            }
-        },
-    ]
-    result = list(interactions_collection.aggregate(pipeline))
-    if not result:
-        return {"stale_articles": [], "viewed_articles": []}
-    return result[0]
+
+def get_viewed(user_id, limit=50):
+    """
+    Get the most recently opened articles of the user.
+    """
+    viewed = list(interactions_collection.find(
+        {"user": user_id, "is_opened": True},
+        {"_id": 0, "article_id": 1}
+    ).sort("last_opened", -1).limit(limit))
+    return interaction_sink.overlay_viewed(user_id, viewed, limit)
+
+
+def get_seen(user_id, since):
+    """
+    Get the articles opened by the user, or recommended to them since `since`.
+    """
+    seen = list(interactions_collection.find(
+        {"user": user_id, "$or": [
+            {"last_recommended": {"$gte": since}},
+            {"is_opened": True},
+        ]},
+        {"_id": 0, "article_id": 1, "is_opened": 1, "last_recommended": 1}
+    ))
+    return interaction_sink.overlay_seen(user_id, seen, since)
+
+
+def count_opens(since):
+    """
+    Count the opens of each article by users who opened it since `since`.
+    """
+    return {count["_id"]: count["opens"] for count in interactions_collection.aggregate([
+        {"$match": {"is_opened": True, "last_opened": {"$gte": since}}},
+        {"$group": {"_id": "$article_id", "opens": {"$sum": 1}}},
+    ])}
+
+
+def find_active_users(since):
+    """
+    Stream the ids of the users who opened an article since `since`.
+    """
+    for user in interactions_collection.aggregate([
+        {"$match": {"is_opened": True, "last_opened": {"$gte": since}}},
+        {"$group": {"_id": "$user"}},
+    ], allowDiskUse=True):
+        yield user["_id"]
+
+
+def get_viewed_many(user_ids, limit=50):
+    """
+    Get the most recently opened article ids of each of the users.
+    """
+    viewed = {user_id: [] for user_id in user_ids}
+    for interaction in interactions_collection.find(
+        {"user": {"$in": list(user_ids)}, "is_opened": True},
+        {"_id": 0, "user": 1, "article_id": 1}
+    ).sort([("user", 1), ("last_opened", -1)]):
+        history = viewed[interaction["user"]]
+        if len(history) < limit:
+            history.append(interaction["article_id"])
+    return viewed
@@ -1,5 +1,7 @@
 from flask import jsonify
 import interactions.repository as repository
+from articles.seen_set import seen_sets
+from articles.user_cache import user_embedding_cache
 
 
 def record_opened(user_email, article_id):
@@ -7,6 +9,8 @@ def record_opened(user_email, article_id):
     Handle the interaction with an article by the user.
     """
     repository.record_open(user_email, article_id)
+    user_embedding_cache.invalidate(user_email)
+    seen_sets.mark_opened(user_email, article_id)
 
 
 def record_recommended(user_id, article_id):
@@ -20,8 +24,8 @@ def record_many_recommended(user_id, article_ids):
     """
     Handle the recommendation interaction with multiple articles by the user.
     """
-    for article_id in article_ids:
-        repository.record_recommended(user_id, article_id)
+    repository.record_many_recommended(user_id, article_ids)
+    seen_sets.mark_recommended(user_id, article_ids)
 
 
 def get_stale(user_id):
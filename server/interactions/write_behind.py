@@ -0,0 +1,237 @@
+import atexit
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from articles.candidate_store import candidate_store
+from db import interactions_collection, topic_interaction_collection, articles_collection
+
+FLUSH_INTERVAL = float(os.getenv("INTERACTION_FLUSH_INTERVAL", 1.0))
+FLUSH_SIZE = int(os.getenv("INTERACTION_FLUSH_SIZE", 500))
+
+
+class InteractionSink:
+    """
+    Write-behind buffer for interaction writes.
+
+    Opens and recommendations are queued in memory and coalesced per
+    (user, article): later fields overwrite earlier ones, so a page of
+    recommendations followed by an open is a single upsert. A flusher thread
+    writes them as unordered bulk writes every FLUSH_INTERVAL seconds, or
+    as soon as FLUSH_SIZE (user, article) pairs are pending, and once more on
+    shutdown. Topic counters are incremented in the same flush, resolving
+    the topic from the candidate store when it is loaded there.
+
+    The two writes are retried separately: a failed interactions write is
+    requeued with its opens, and a failed counter write only requeues the
+    increments Mongo reports as not applied, so that no increment is applied
+    twice. Increments whose outcome is unknown are dropped.
+
+    `pending` exposes the writes that are not in Mongo yet, so reads can
+    overlay them and still see the user's own writes.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}  # (user, article_id) -> fields to $set
+        self._opens = Counter()  # (user, article_id) -> number of opens
+        self._topic_counts = Counter()  # (user, topic) -> increments to retry
+        self._flushing = {}  # batch being written, still visible to reads
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+
+    # Timestamps are local naive datetime.now(), the clock of the `since`
+    # values readers compare them with (seen set, cold start pool)
+    def record_open(self, user_id, article_id):
+        self._record(user_id, [article_id], {
+                     "last_opened": datetime.now(), "is_opened": True}, opened=True)
+
+    def record_recommended(self, user_id, article_ids):
+        self._record(user_id, article_ids, {
+                     "last_recommended": datetime.now()})
+
+    def _record(self, user_id, article_ids, fields, opened=False):
+        with self._cond:
+            self._start()
+            for article_id in article_ids:
+                key = (user_id, article_id)
+                self._pending.setdefault(key, {}).update(fields)
+                if opened:
+                    self._opens[key] += 1
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify()
+
+    def pending(self, user_id):
+        """
+        Not yet written fields of the user's interactions, by article id.
+        """
+        overlay = defaultdict(dict)
+        with self._cond:
+            for batch in (self._flushing, self._pending):
+                for (user, article_id), fields in batch.items():
+                    if user == user_id:
+                        overlay[article_id].update(fields)
+        return overlay
+
+    def overlay_viewed(self, user_id, viewed, limit):
+        """
+        Merge the user's pending opens into the most recently opened
+        articles read from Mongo.
+        """
+        opened = sorted(((fields["last_opened"], article_id)
+                         for article_id, fields in self.pending(user_id).items()
+                         if fields.get("is_opened")), reverse=True)
+        if not opened:
+            return viewed
+        opened_ids = [article_id for _, article_id in opened]
+        merged = [{"article_id": article_id} for article_id in opened_ids]
+        opened_ids = set(opened_ids)
+        merged += [article for article in viewed
+                   if article["article_id"] not in opened_ids]
+        return merged[:limit]
+
+    def overlay_seen(self, user_id, seen, since):
+        """
+        Merge the user's pending opens, and recommendations made since
+        `since`, into the seen interactions read from Mongo.
+        """
+        by_id = {interaction["article_id"]: interaction for interaction in seen}
+        for article_id, fields in self.pending(user_id).items():
+            if fields.get("is_opened") or fields.get("last_recommended", since) > since:
+                by_id[article_id] = {
+                    **by_id.get(article_id, {"article_id": article_id}), **fields}
+        return list(by_id.values())
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="interaction-sink", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.flush_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending interactions to Mongo.
+        """
+        with self._flush_lock:
+            with self._cond:
+                # Opens are also requeued alone when their topics could not
+                # be resolved
+                if not self._pending and not self._opens and not self._topic_counts:
+                    return
+                batch, self._pending = self._pending, {}
+                opens, self._opens = self._opens, Counter()
+                counts, self._topic_counts = self._topic_counts, Counter()
+                self._flushing = batch
+
+            try:
+                self._write_interactions(batch)
+            except Exception as e:
+                print(f"Failed to flush {len(batch)} interactions: {e}")
+                self._requeue(batch, opens, counts)
+                return
+            finally:
+                with self._cond:
+                    self._flushing = {}
+
+            try:
+                counts.update(self._count_topics(opens))
+            except Exception as e:
+                print(f"Failed to resolve the topics of {len(opens)} opens: {e}")
+                self._requeue({}, opens, counts)
+                return
+            self._write_topic_counts(counts)
+
+    def _write_interactions(self, batch):
+        if batch:
+            interactions_collection.bulk_write([
+                UpdateOne(
+                    {"user": user_id, "article_id": article_id},
+                    {"$set": fields},
+                    upsert=True
+                ) for (user_id, article_id), fields in batch.items()
+            ], ordered=False)
+
+    def _count_topics(self, opens):
+        """
+        Topic counter increments of the opens, by (user, topic).
+        """
+        counts = Counter()
+        if not opens:
+            return counts
+        topics = self._topics({article_id for _, article_id in opens})
+        for (user_id, article_id), count in opens.items():
+            if topics.get(article_id) is not None:
+                counts[(user_id, topics[article_id])] += count
+        return counts
+
+    def _write_topic_counts(self, counts):
+        """
+        Apply the counter increments. Only the ones Mongo reports as failed are
+        retried: the others were applied, or may have been.
+        """
+        if not counts:
+            return
+        keys = list(counts)
+        try:
+            topic_interaction_collection.bulk_write([
+                UpdateOne(
+                    {"user": user_id, "topic": topic},
+                    {"$inc": {"count": counts[(user_id, topic)]}},
+                    upsert=True
+                ) for user_id, topic in keys
+            ], ordered=False)
+        except BulkWriteError as e:
+            failed = Counter({keys[error["index"]]: counts[keys[error["index"]]]
+                              for error in e.details.get("writeErrors", [])})
+            print(f"Failed to increment {len(failed)} of {len(keys)} topic counters, retrying them")
+            self._requeue({}, Counter(), failed)
+        except Exception as e:
+            print(f"Dropped {len(keys)} topic counter increments of unknown outcome: {e}")
+
+    def _topics(self, article_ids):
+        topics = {article_id: candidate_store.topic_of(article_id)
+                  for article_id in article_ids}
+        missing = [ObjectId(article_id) for article_id, topic in topics.items()
+                   if topic is None and ObjectId.is_valid(article_id)]
+        if missing:
+            for article in articles_collection.find({"_id": {"$in": missing}}, {"topic": 1}):
+                topics[str(article["_id"])] = article.get("topic")
+        return topics
+
+    def _requeue(self, batch, opens, counts):
+        with self._cond:
+            for key, fields in batch.items():
+                # Writes recorded during the failed flush are more recent
+                self._pending[key] = {**fields, **self._pending.get(key, {})}
+            self._opens.update(opens)
+            self._topic_counts.update(counts)
+
+    def close(self):
+        """
+        Stop the flusher thread and write what is still pending.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+
+interaction_sink = InteractionSink()
@@ -0,0 +1,62 @@
+# JSON encoding of API responses, shared by app.py and asgi.py.
+# Uses orjson when it is installed, and the standard library otherwise.
+import json
+from datetime import date, datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+
+
+def default(obj):
+    """
+    Encode the types Mongo documents and metrics contain. Naive datetimes
+    are UTC, as stored by Mongo.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider for Flask and Quart apps that encodes datetime and
+    ObjectId values directly, and builds responses from the encoded bytes.
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
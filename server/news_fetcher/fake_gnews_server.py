@@ -0,0 +1,115 @@
+"""
+Local fake of the GNews API (top-headlines and search), to exercise the
+fetcher without an API key or quota.
+
+Every feed has --total articles, served --max at most per page with the
+`page` parameter. The server enforces --rate requests per second per API
+key (429 with Retry-After above it), fails --fail-rate of the requests with
+a 503, and answers after --latency seconds.
+
+Run it, then point the fetcher at it:
+    python fake_gnews_server.py --port 8080 --fail-rate 0.1
+    GNEWS_BASE_URL=http://localhost:8080/api/v4 GNEWS_API_KEY=test python fetch_pipeline.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_articles(feed, page, size, total):
+    start = (page - 1) * size
+    now = datetime.now(timezone.utc)
+    return [{
+        "title": f"Headline {i} for {feed}",
+        "description": f"Description of headline {i} for {feed}",
+        "content": "",
+        "url": f"https://news.example.com/{feed}/{i}",
+        "image": f"https://news.example.com/{feed}/{i}.jpg",
+        "publishedAt": (now - timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "source": {"name": "Example News", "url": "https://news.example.com"},
+    } for i in range(start, min(start + size, total))]
+
+
+def make_handler(args):
+    lock = threading.Lock()
+    requests_by_key = {}  # api key -> times of the requests in the last second
+    stats = {"requests": 0, "rate_limited": 0, "failed": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            endpoint = url.path.rsplit("/", 1)[-1]
+            if endpoint not in ("top-headlines", "search"):
+                return self._send(404, {"errors": ["Not found"]})
+            if "apikey" not in params:
+                return self._send(401, {"errors": ["Missing API key"]})
+
+            with lock:
+                stats["requests"] += 1
+                now = time.monotonic()
+                recent = [t for t in requests_by_key.get(params["apikey"], []) if now - t < 1]
+                limited = len(recent) >= args.rate
+                if not limited:
+                    recent.append(now)
+                requests_by_key[params["apikey"]] = recent
+                if limited:
+                    stats["rate_limited"] += 1
+            if limited:
+                return self._send(429, {"errors": ["Too many requests"]}, {"Retry-After": "1"})
+
+            time.sleep(args.latency)
+            if random.random() < args.fail_rate:
+                with lock:
+                    stats["failed"] += 1
+                return self._send(503, {"errors": ["Service unavailable"]})
+
+            feed = "-".join(filter(None, [params.get("q") or params.get("category", "general"),
+                                          params.get("country")]))
+            size = min(int(params.get("max", 10)), args.max)
+            page = int(params.get("page", 1))
+            self._send(200, {"totalArticles": args.total,
+                             "articles": fake_articles(feed, page, size, args.total)})
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *log_args):
+            pass
+
+    return Handler, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake GNews API server.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rate", type=float, default=10, help="requests per second allowed per API key")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests failing with a 503")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before answering")
+    parser.add_argument("--total", type=int, default=50, help="articles in every feed")
+    parser.add_argument("--max", type=int, default=10, help="articles per page at most")
+    args = parser.parse_args()
+
+    handler, stats = make_handler(args)
+    server = ThreadingHTTPServer(("localhost", args.port), handler)
+    print(f"Fake GNews API on http://localhost:{args.port}/api/v4")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {stats}")
+
+
+if __name__ == "__main__":
+    main()
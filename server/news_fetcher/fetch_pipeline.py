@@ -1,41 +1,52 @@
-from fetcher.google_fetcher import GoogleNewsFetcher
+from fetcher.google_fetcher import GNEWS_CATEGORIES, fan_out, fetch_feeds
 from utils.insert_articles import insert_articles
 import os
-import time
 
 
-CATEGORIES = [
-    "world", "nation", "business", "technology",
-    "entertainment", "sports", "science", "health"
-]
+CATEGORIES = GNEWS_CATEGORIES
+# Optional extra fan-out, comma separated: search queries, and countries
+# (each category and query is fetched once per country)
+QUERIES = [query for query in os.getenv("GNEWS_QUERIES", "").split(",") if query]
+COUNTRIES = [country for country in os.getenv("GNEWS_COUNTRIES", "").split(",") if country] or [None]
+FETCH_WORKERS = int(os.getenv("GNEWS_WORKERS", 8))
 
 
-def fetch_articles_by_category(api_key, categories, articles_per_category=10):
+def fetch_articles_by_category(api_key, categories, articles_per_category=10, queries=(), countries=(None,),
+                               workers=FETCH_WORKERS):
     """
-    Fetches news articles for each specified category using GNews API.
+    Fetches news articles for each specified category (and query, for each
+    country) using GNews API.
+
+    The feeds are fetched concurrently over one keep-alive session, within
+    the rate limit of the API key (GNEWS_RATE requests per second), with
+    retries and pagination (see fetcher.google_fetcher).
 
     Args:
         api_key (str): GNews API key.
         categories (list of str): List of GNews-supported category keywords (e.g., 'business', 'technology').
         articles_per_category (int): Number of articles to fetch per category.
+        queries (list of str): Search queries to fetch as well.
+        countries (list of str): Countries to fetch every feed for, None for all countries.
+        workers (int): Feeds fetched concurrently.
 
     Returns:
-        list of dict: Combined list of all fetched and parsed articles.
+        list of dict: Combined list of all fetched and parsed articles, without duplicate urls.
     """
-    all_articles = []
-    for category in categories:
-        print(f"\nFetching articles for category: {category}")
-        fetcher = GoogleNewsFetcher(api_key=api_key, query=category, max_results=articles_per_category)
-        articles = fetcher.fetch_articles()
-        all_articles.extend(articles)
-        time.sleep(1.5)
-    return all_articles
+    feeds = fan_out(categories, queries, countries)
+    all_articles = {}
+    for article in fetch_feeds(api_key, feeds, max_results=articles_per_category, workers=workers):
+        all_articles.setdefault(article["url"], article)
+    return list(all_articles.values())
 
 
 def run_fetcher():
     api_key = os.getenv("GNEWS_API_KEY")
     if not api_key:
         raise ValueError("GNEWS_API_KEY not found in environment variables.")
-    articles = fetch_articles_by_category(api_key, CATEGORIES, articles_per_category=10)
+    articles = fetch_articles_by_category(api_key, CATEGORIES, articles_per_category=10,
+                                          queries=QUERIES, countries=COUNTRIES)
     insert_articles(articles)
 
+
+if __name__ == "__main__":
+    run_fetcher()
@@ -0,0 +1,209 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GNEWS_BASE_URL = os.getenv("GNEWS_BASE_URL", "https://gnews.io/api/v4")
+# Categories of the top-headlines endpoint
+GNEWS_CATEGORIES = [
+    "world", "nation", "business", "technology",
+    "entertainment", "sports", "science", "health"
+]
+# Requests per second allowed per API key, and the burst allowed above it
+GNEWS_RATE = float(os.getenv("GNEWS_RATE", 1))
+GNEWS_BURST = int(os.getenv("GNEWS_BURST", 4))
+# Articles per page (10 on the free plan, up to 100 on paid ones)
+GNEWS_PAGE_SIZE = int(os.getenv("GNEWS_PAGE_SIZE", 10))
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `acquire` blocks until a token is available.
+    Tokens are refilled at `rate` per second, up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter(api_key: str, rate: float = GNEWS_RATE, burst: int = GNEWS_BURST) -> TokenBucket:
+    """
+    The token bucket shared by every fetcher using `api_key` in this process.
+    """
+    with _buckets_lock:
+        if api_key not in _buckets:
+            _buckets[api_key] = TokenBucket(rate, burst)
+        return _buckets[api_key]
+
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    """
+    HTTP session keeping up to `pool_size` connections alive, to be shared by
+    the fetchers of a run.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """
+    Seconds to wait before retry `attempt` (from 0): the server's Retry-After
+    when it sent one, else exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class GoogleNewsFetcher:
+    """
+    Fetches the articles of one GNews feed: the top headlines of a category,
+    or the results of a search query, optionally for one country.
+
+    Requests go through the token bucket of the API key and the shared
+    session, follow the pages until `max_results` articles are fetched, and
+    are retried on connection errors, 429 and 5xx responses.
+    """
+
+    def __init__(self, api_key, query=None, category=None, country=None, lang="en", max_results=10,
+                 page_size=GNEWS_PAGE_SIZE, session=None, limiter=None, base_url=GNEWS_BASE_URL):
+        self.api_key = api_key
+        self.query = query
+        self.category = category
+        self.country = country
+        self.lang = lang
+        self.max_results = max_results
+        self.page_size = page_size
+        self.session = session or make_session()
+        self.limiter = limiter or rate_limiter(api_key)
+        self.base_url = base_url.rstrip("/")
+
+    def fetch_articles(self) -> list:
+        """
+        Fetches the feed, page by page.
+
+        Returns:
+            list of dict: Parsed articles, at most `max_results`.
+        """
+        articles = []
+        page = 1
+        while len(articles) < self.max_results:
+            # Every page has the same size: GNews offsets page n by (n - 1) * max
+            data = self._get(page)
+            batch = data.get("articles", [])
+            articles.extend(self.parse_article(article) for article in batch)
+            if len(batch) < self.page_size or len(articles) >= data.get("totalArticles", 0):
+                break
+            page += 1
+        return articles[:self.max_results]
+
+    def _get(self, page) -> dict:
+        endpoint = "search" if self.query else "top-headlines"
+        params = {"apikey": self.api_key, "lang": self.lang, "max": self.page_size, "page": page}
+        if self.query:
+            params["q"] = self.query
+        if self.category:
+            params["category"] = self.category
+        if self.country:
+            params["country"] = self.country
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            retry_after = None
+            try:
+                response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=REQUEST_TIMEOUT)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            if attempt == MAX_RETRIES:
+                raise RuntimeError(f"GNews {endpoint} page {page} failed after {attempt + 1} attempts: {error}")
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    def parse_article(self, article: dict) -> dict:
+        source = article.get("source") or {}
+        return {
+            "url": article.get("url"),
+            "title": article.get("title"),
+            "description": article.get("description", ""),
+            "source": source.get("name", ""),
+            "publishedAt": article.get("publishedAt"),
+            "image": article.get("image"),
+            "category": self.category or self.query or "",
+            "country": self.country or "",
+        }
+
+
+def fan_out(categories=(), queries=(), countries=(None,)) -> list:
+    """
+    Feeds to fetch: every category and every query, for every country.
+
+    Returns:
+        list of dict: Feed parameters (category or query, and country).
+    """
+    feeds = [{"category": category} for category in categories] + [{"query": query} for query in queries]
+    return [{**feed, "country": country} for feed in feeds for country in countries]
+
+
+def fetch_feeds(api_key, feeds, max_results=10, workers=8, session=None, **fetcher_args):
+    """
+    Fetches `feeds` concurrently with `workers` threads, sharing one session
+    and the rate limit of `api_key`. A feed that fails after its retries is
+    reported and skipped.
+
+    Yields:
+        dict: Parsed articles, feed by feed as they complete.
+    """
+    session = session or make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(GoogleNewsFetcher(api_key, max_results=max_results, session=session,
+                                              **feed, **fetcher_args).fetch_articles): feed
+            for feed in feeds
+        }
+        for future in as_completed(futures):
+            try:
+                articles = future.result()
+            except Exception as e:
+                print(f"Failed to fetch {futures[future]}: {e}")
+                continue
+            print(f"Fetched {len(articles)} articles for {futures[future]}")
+            yield from articles
@@ -0,0 +1,22 @@
+import asyncio
+from quart import Blueprint, Response, abort, request
+import proxy.service as service
+
+blueprint = Blueprint('proxy', __name__)
+
+
+@blueprint.route('/api/proxy')
+async def proxy():
+    url = request.args.get('url')
+    if not url:
+        return abort(400, 'Missing "url" parameter')
+    try:
+        # The pooled client is blocking, so fetch off the event loop
+        resp = await asyncio.get_running_loop().run_in_executor(
+            None, service.image_proxy.fetch, url)
+    except service.ProxyError as e:
+        return abort(e.status, e.message)
+    headers = service.client_headers(resp)
+    if resp.status == 200 and resp.etag and request.headers.get('If-None-Match') == resp.etag:
+        return Response('', status=304, headers=headers)
+    return Response(resp.body, status=resp.status, headers=headers)
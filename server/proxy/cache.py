@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class CachedResponse:
+    """
+    A proxied upstream response and the metadata needed to reuse it.
+    """
+
+    def __init__(self, status: int, headers: dict, body: bytes, stored_at: float = None,
+                 max_age: float = 0.0, must_revalidate: bool = False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        self.max_age = max_age
+        self.must_revalidate = must_revalidate
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("Last-Modified")
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return not self.must_revalidate and self.age() < self.max_age
+
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+
+class MemoryCache:
+    """
+    LRU of responses bounded by the total size of their bodies.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def delete(self, key: str):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+
+
+class DiskCache:
+    """
+    Responses stored as <key>.body / <key>.json files in a directory, bounded
+    by total body size. The least recently used files are removed first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory)
+                        if entry.name.endswith(".body"))
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        # Entries are replaced atomically (see put), so reads need no lock
+        try:
+            with open(self._path(key, ".json")) as f:
+                meta = json.load(f)
+            with open(self._path(key, ".body"), "rb") as f:
+                body = f.read()
+            # Touch the body so eviction is least recently used
+            os.utime(self._path(key, ".body"))
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(body=body, **meta)
+
+    def put(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        meta = {"status": entry.status, "headers": entry.headers, "stored_at": entry.stored_at,
+                "max_age": entry.max_age, "must_revalidate": entry.must_revalidate}
+        with self._lock:
+            self._delete(key)
+            # Write to temporary files first so readers never see a partial entry
+            for suffix, data, mode in ((".body", entry.body, "wb"), (".json", json.dumps(meta), "w")):
+                tmp = self._path(key, suffix + ".tmp")
+                with open(tmp, mode) as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key, suffix))
+            self.size += len(entry.body)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._delete(key)
+
+    def _delete(self, key: str):
+        """
+        Remove an entry; the caller holds the lock, which keeps `size` in
+        step with the files.
+        """
+        try:
+            size = os.path.getsize(self._path(key, ".body"))
+            os.remove(self._path(key, ".body"))
+            self.size -= size
+        except OSError:
+            pass
+        try:
+            os.remove(self._path(key, ".json"))
+        except OSError:
+            pass
+
+    def _evict(self):
+        bodies = sorted((entry for entry in os.scandir(self.directory)
+                         if entry.name.endswith(".body")),
+                        key=lambda entry: entry.stat().st_mtime)
+        for entry in bodies:
+            if self.size <= self.max_bytes:
+                break
+            self._delete(entry.name[:-len(".body")])
+
+
+class ResponseCache:
+    """
+    Two-level response cache: memory in front of an optional disk cache.
+    """
+
+    def __init__(self, memory_bytes: int, disk_directory: Optional[str] = None, disk_bytes: int = 0):
+        self.memory = MemoryCache(memory_bytes)
+        self.disk = DiskCache(
+            disk_directory, disk_bytes) if disk_directory else None
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        key = self.key(url)
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.put(key, entry)
+        return entry
+
+    def put(self, url: str, entry: CachedResponse):
+        key = self.key(url)
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def delete(self, url: str):
+        key = self.key(url)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
@@ -0,0 +1,18 @@
+from flask import Response, abort, request
+import proxy.service as service
+from __main__ import app
+
+
+@app.route('/api/proxy')
+def proxy():
+    url = request.args.get('url')
+    if not url:
+        return abort(400, 'Missing "url" parameter')
+    try:
+        resp = service.image_proxy.fetch(url)
+    except service.ProxyError as e:
+        return abort(e.status, e.message)
+    headers = service.client_headers(resp)
+    if resp.status == 200 and resp.etag and request.headers.get('If-None-Match') == resp.etag:
+        return Response('', status=304, headers=headers)
+    return Response(resp.body, status=resp.status, headers=headers)
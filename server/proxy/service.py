@@ -0,0 +1,319 @@
+import fnmatch
+import ipaddress
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from proxy.cache import CachedResponse, ResponseCache
+
+# Comma separated host patterns, e.g. "*.nytimes.com,images.example.org".
+# Nothing is proxied until it is set.
+PROXY_ALLOWED_HOSTS = os.getenv("PROXY_ALLOWED_HOSTS", "")
+PROXY_MAX_REDIRECTS = int(os.getenv("PROXY_MAX_REDIRECTS", 3))
+PROXY_MAX_BYTES = int(os.getenv("PROXY_MAX_BYTES", 5 * 1024 * 1024))
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", 3))
+PROXY_READ_TIMEOUT = float(os.getenv("PROXY_READ_TIMEOUT", 10))
+PROXY_POOL_SIZE = int(os.getenv("PROXY_POOL_SIZE", 32))
+PROXY_DEFAULT_TTL = float(os.getenv("PROXY_DEFAULT_TTL", 3600))
+PROXY_MEMORY_CACHE_BYTES = int(
+    os.getenv("PROXY_MEMORY_CACHE_BYTES", 64 * 1024 * 1024))
+PROXY_CACHE_DIR = os.getenv("PROXY_CACHE_DIR", "./.proxy_cache")
+PROXY_DISK_CACHE_BYTES = int(
+    os.getenv("PROXY_DISK_CACHE_BYTES", 512 * 1024 * 1024))
+
+FORWARDED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+
+class ProxyError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ImageProxy:
+    """
+    Fetches upstream resources through a pooled HTTP session, with a bounded
+    memory and disk cache that follows Cache-Control, and revalidates stale
+    entries with If-None-Match / If-Modified-Since.
+
+    Concurrent fetches of the same URL are collapsed: the first caller does
+    the upstream request and the others wait for its result.
+    """
+
+    def __init__(
+        self,
+        allowed_hosts: str = PROXY_ALLOWED_HOSTS,
+        max_bytes: int = PROXY_MAX_BYTES,
+        cache: ResponseCache = None,
+        session: requests.Session = None,
+        timeout=(PROXY_CONNECT_TIMEOUT, PROXY_READ_TIMEOUT),
+        default_ttl: float = PROXY_DEFAULT_TTL,
+        max_redirects: int = PROXY_MAX_REDIRECTS,
+    ):
+        self.allowed_hosts = [pattern.strip().lower()
+                              for pattern in allowed_hosts.split(",") if pattern.strip()]
+        self.max_bytes = max_bytes
+        self.cache = cache if cache is not None else ResponseCache(
+            PROXY_MEMORY_CACHE_BYTES, PROXY_CACHE_DIR, PROXY_DISK_CACHE_BYTES)
+        self.session = session if session is not None else pooled_session(
+            private_hosts=self.allowed_hosts)
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.max_redirects = max_redirects
+        self._inflight = {}  # url -> Future
+        self._lock = threading.Lock()
+
+    def is_allowed(self, url: str) -> bool:
+        """
+        Only http(s) URLs whose host matches the allow-list. A host matched by
+        a pattern must only resolve to public addresses; hosts listed exactly
+        (e.g. a local image server) may resolve to private ones. The session
+        checks the addresses again when it connects (see PublicAddressAdapter).
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme not in ("http", "https") or not host:
+            return False
+        if host in self.allowed_hosts:
+            return True
+        if not any(fnmatch.fnmatch(host, pattern) for pattern in self.allowed_hosts):
+            return False
+        return public_address(host, parsed.port or (443 if parsed.scheme == "https" else 80)) is not None
+
+    def fetch(self, url: str) -> CachedResponse:
+        """
+        The response for `url`, from the cache when it is fresh.
+        Raises ProxyError if the URL is not allowed or the upstream fails.
+        """
+        if not self.is_allowed(url):
+            raise ProxyError(403, "URL is not allowed")
+
+        cached = self.cache.get(url)
+        if cached is not None and not is_image(cached.headers):
+            cached = None
+        if cached is not None and cached.is_fresh():
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self._inflight[url] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._fetch_upstream(url, cached)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[url]
+
+    def _fetch_upstream(self, url: str, cached: CachedResponse = None) -> CachedResponse:
+        headers = {}
+        if cached is not None and cached.can_revalidate():
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        try:
+            with self._open(url, headers) as resp:
+                if resp.status_code == 304 and cached is not None:
+                    max_age, must_revalidate, cacheable = self._freshness(resp)
+                    refreshed = CachedResponse(
+                        cached.status, {**cached.headers, **self._headers(resp)}, cached.body,
+                        max_age=max_age, must_revalidate=must_revalidate)
+                    if cacheable:
+                        self.cache.put(url, refreshed)
+                    return refreshed
+                if resp.status_code != 200:
+                    if cached is not None:
+                        self.cache.delete(url)
+                    status = resp.status_code if 400 <= resp.status_code < 500 else 502
+                    raise ProxyError(status, f"Upstream answered {resp.status_code}")
+                if not is_image(resp.headers):
+                    raise ProxyError(415, "Upstream response is not an image")
+
+                body = self._read(resp)
+                max_age, must_revalidate, cacheable = self._freshness(resp)
+                response = CachedResponse(
+                    resp.status_code, self._headers(resp), body,
+                    max_age=max_age, must_revalidate=must_revalidate)
+        except requests.RequestException as e:
+            raise ProxyError(502, f"Upstream request failed: {e}")
+
+        if cacheable:
+            self.cache.put(url, response)
+        elif cached is not None:
+            self.cache.delete(url)
+        return response
+
+    def _open(self, url: str, headers: dict):
+        """
+        Streamed upstream response for `url`. Redirects are followed by hand,
+        up to `max_redirects`, and every target must pass is_allowed.
+        """
+        for _ in range(self.max_redirects + 1):
+            resp = self.session.get(url, headers=headers, stream=True, timeout=self.timeout,
+                                    allow_redirects=False)
+            if not resp.is_redirect:
+                return resp
+            resp.close()
+            url = urljoin(url, resp.headers["Location"])
+            if not self.is_allowed(url):
+                raise ProxyError(403, "Redirect target is not allowed")
+        raise ProxyError(502, "Too many upstream redirects")
+
+    def _read(self, resp) -> bytes:
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ProxyError(413, "Upstream response is too large")
+        chunks, size = [], 0
+        for chunk in resp.iter_content(chunk_size=8192):
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ProxyError(413, "Upstream response is too large")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @staticmethod
+    def _headers(resp) -> dict:
+        return {name: resp.headers[name] for name in FORWARDED_HEADERS if name in resp.headers}
+
+    def _freshness(self, resp):
+        """
+        (max_age, must_revalidate, cacheable) from Cache-Control and Expires.
+        """
+        directives = {}
+        for directive in resp.headers.get("Cache-Control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name:
+                directives[name.lower()] = value.strip('"')
+
+        if "no-store" in directives or "private" in directives:
+            return 0.0, True, False
+        must_revalidate = "no-cache" in directives
+        for name in ("s-maxage", "max-age"):
+            if directives.get(name, "").isdigit():
+                return float(directives[name]), must_revalidate, True
+        if "Expires" in resp.headers:
+            try:
+                expires = parsedate_to_datetime(resp.headers["Expires"])
+                date = parsedate_to_datetime(resp.headers["Date"]) \
+                    if "Date" in resp.headers else datetime.now(timezone.utc)
+                return max(0.0, (expires - date).total_seconds()), must_revalidate, True
+            except (TypeError, ValueError):
+                # An invalid Expires means already expired
+                return 0.0, must_revalidate, True
+        return self.default_ttl, must_revalidate, True
+
+
+def is_image(headers) -> bool:
+    content_type = headers.get("Content-Type", "")
+    return content_type.split(";")[0].strip().lower().startswith("image/")
+
+
+def public_address(host: str, port: int) -> Optional[str]:
+    """
+    An address of `host` to connect to, if every address it resolves to is
+    globally routable: no private, loopback, link-local (cloud metadata),
+    reserved or multicast address. None if one is not, or if the host does
+    not resolve.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            return None
+    return infos[0][4][0] if infos else None
+
+
+def _public_connection(connection_cls, private_hosts):
+    class PublicConnection(connection_cls):
+        def _new_conn(self):
+            # Connect to the very address that was checked; TLS still uses
+            # self.host for SNI and the certificate
+            host = self._dns_host
+            if host.lower() not in private_hosts:
+                address = public_address(host, self.port)
+                if address is None:
+                    raise ProxyError(403, "URL is not allowed")
+                self._dns_host = address
+            try:
+                return super()._new_conn()
+            finally:
+                self._dns_host = host
+
+    return PublicConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections resolve the host once, refuse it unless
+    all its addresses are public (hosts in `private_hosts` excepted) and
+    connect to the address that was checked, so that a DNS answer changing
+    between is_allowed and the connection (rebinding) can't reach an
+    internal address.
+    """
+
+    def __init__(self, private_hosts=(), **kwargs):
+        self.private_hosts = frozenset(host.lower() for host in private_hosts)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("HTTPConnectionPool", (HTTPConnectionPool,), {
+                "ConnectionCls": _public_connection(HTTPConnection, self.private_hosts)}),
+            "https": type("HTTPSConnectionPool", (HTTPSConnectionPool,), {
+                "ConnectionCls": _public_connection(HTTPSConnection, self.private_hosts)}),
+        }
+
+
+def client_headers(resp: CachedResponse) -> dict:
+    """
+    Headers of the response sent to the client, letting the browser cache it
+    as long as the proxy would.
+    """
+    headers = dict(resp.headers)
+    if resp.status == 200:
+        remaining = 0 if resp.must_revalidate else max(
+            0, int(resp.max_age - resp.age()))
+        headers["Cache-Control"] = f"public, max-age={remaining}"
+    return headers
+
+
+def pooled_session(pool_size: int = PROXY_POOL_SIZE, private_hosts=()) -> requests.Session:
+    """
+    A session that keeps up to `pool_size` connections alive per host, and
+    only connects to public addresses, except for the `private_hosts`.
+    """
+    session = requests.Session()
+    adapter = PublicAddressAdapter(private_hosts, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+image_proxy = ImageProxy()
@@ -0,0 +1,104 @@
+"""
+Benchmark the NewsEncoder on titles padded to MAX_TITLE_LEN against the
+same titles trimmed to the longest one of the batch, and check that both
+give the same embeddings.
+
+Titles get random lengths in [--min-len, --max-len] tokens (real headlines
+are ~12-20 WordPiece tokens). Reported per batch size, for inference with
+and without PyTorch's fused transformer fast path (the reduced-precision
+and exported backends run without it), and for a training step:
+  - mean time with the padded and the trimmed inputs, and the speedup;
+  - largest absolute difference between the padded and trimmed embeddings.
+
+Run from the server directory:
+    python -m scripts.benchmark_news_encoder
+    python -m scripts.benchmark_news_encoder --random-init --batch-sizes 32 256
+"""
+import argparse
+import time
+from contextlib import nullcontext
+
+import torch
+
+from article_recommender.export import without_fastpath
+from article_recommender.model import MAX_TITLE_LEN, MODEL_CONFIG, PAD_ID, load_model
+from article_recommender.nrms import NRMS
+
+
+def random_titles(batch_size, min_len, max_len, vocab_size):
+    """
+    (token_ids, padding_mask) of `batch_size` titles padded to MAX_TITLE_LEN.
+    """
+    token_ids = torch.randint(PAD_ID + 1, vocab_size, (batch_size, MAX_TITLE_LEN))
+    lengths = torch.randint(min_len, max_len + 1, (batch_size, 1))
+    mask = torch.arange(MAX_TITLE_LEN).unsqueeze(0) >= lengths
+    token_ids[mask] = PAD_ID
+    return token_ids, mask
+
+
+def timed(run, rounds):
+    run()  # warm up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = run()
+    return result, (time.perf_counter() - started) / rounds * 1000
+
+
+def benchmark_inference(encoder, inputs, rounds):
+    timings, outputs = {}, {}
+    for trim_padding in (False, True):
+        encoder.trim_padding = trim_padding
+        with torch.no_grad():
+            outputs[trim_padding], timings[trim_padding] = timed(lambda: encoder(*inputs), rounds)
+    diff = (outputs[False] - outputs[True]).abs().max().item()
+    return timings[False], timings[True], diff
+
+
+def benchmark_training(encoder, inputs, rounds):
+    encoder.train()
+    timings = {}
+    for trim_padding in (False, True):
+        encoder.trim_padding = trim_padding
+
+        def step():
+            encoder.zero_grad()
+            encoder(*inputs).sum().backward()
+        _, timings[trim_padding] = timed(step, rounds)
+    encoder.eval()
+    return timings[False], timings[True], None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the NewsEncoder on padded vs trimmed titles.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--min-len", type=int, default=12)
+    parser.add_argument("--max-len", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--random-init", action="store_true",
+                        help="use random weights instead of the checkpoint")
+    args = parser.parse_args()
+
+    model = NRMS(**MODEL_CONFIG) if args.random_init else load_model()
+    encoder = model.news_encoder.eval()
+    vocab_size = encoder.word_embedding.num_embeddings
+
+    for batch_size in args.batch_sizes:
+        inputs = random_titles(batch_size, args.min_len, args.max_len, vocab_size)
+        modes = (
+            ("inference, fast path", benchmark_inference, nullcontext),
+            ("inference, no fast path", benchmark_inference, without_fastpath),
+            ("training step", benchmark_training, nullcontext),
+        )
+        for mode, benchmark, context in modes:
+            with context():
+                padded, trimmed, diff = benchmark(encoder, inputs, args.rounds)
+            line = (f"batch {batch_size:4d}, {mode:24s}: padded {padded:8.1f} ms, "
+                    f"trimmed {trimmed:8.1f} ms, x{padded / trimmed:.1f}")
+            if diff is not None:
+                line += f", max abs diff {diff:.2e}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark the UserEncoder on histories padded to MAX_HISTORY slots against
+encode_histories (true lengths, grouped into length buckets), and check that
+both give the same user embeddings.
+
+History lengths are drawn from a geometric distribution with mean
+--mean-len clicks, capped at MAX_HISTORY: most users have a few clicks and
+a few have many. Reported per batch size, with and without PyTorch's fused
+transformer fast path.
+
+Run from the server directory:
+    python -m scripts.benchmark_user_encoder
+    python -m scripts.benchmark_user_encoder --random-init --mean-len 3
+"""
+import argparse
+from contextlib import nullcontext
+
+import numpy as np
+import torch
+
+from article_recommender.export import without_fastpath
+from article_recommender.model import MAX_HISTORY, MODEL_CONFIG, encode_histories, load_model, pad_history_embeddings
+from article_recommender.nrms import NRMS
+from scripts.benchmark_news_encoder import timed
+
+
+def encode_padded(model, histories):
+    padded = [pad_history_embeddings(history) for history in histories]
+    with torch.no_grad():
+        return model.user_encoder(
+            torch.stack([emb for emb, _ in padded]),
+            torch.stack([mask for _, mask in padded]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the UserEncoder on padded vs true-length histories.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--mean-len", type=float, default=6)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--random-init", action="store_true",
+                        help="use random weights instead of the checkpoint")
+    args = parser.parse_args()
+
+    model = (NRMS(**MODEL_CONFIG) if args.random_init else load_model()).eval()
+    rng = np.random.default_rng(0)
+
+    for batch_size in args.batch_sizes:
+        lengths = np.minimum(rng.geometric(1 / args.mean_len, batch_size), MAX_HISTORY)
+        histories = [torch.randn(length, model.d_embed_news) for length in lengths]
+        for mode, context in (("fast path", nullcontext), ("no fast path", without_fastpath)):
+            with context():
+                padded_emb, padded = timed(lambda: encode_padded(model, histories), args.rounds)
+                bucketed_emb, bucketed = timed(lambda: encode_histories(model, histories), args.rounds)
+            diff = (padded_emb - bucketed_emb).abs().max().item()
+            print(f"batch {batch_size:4d} (mean {lengths.mean():4.1f} clicks), {mode:12s}: "
+                  f"padded {padded:7.1f} ms, bucketed {bucketed:7.1f} ms, x{padded / bucketed:.1f}, "
+                  f"max abs diff {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
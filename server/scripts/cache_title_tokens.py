@@ -0,0 +1,39 @@
+"""
+Cache the title token ids of the articles that have none yet.
+
+The token ids are stored in article_vectors (`title_tokens`, int16 bytes) so
+that serving builds the NewsEncoder inputs without tokenizing. Serving
+caches the ids of the titles it has to tokenize itself; run this after
+ingesting articles so that it never has to.
+
+Run from the server directory:
+    python -m scripts.cache_title_tokens
+"""
+import argparse
+import itertools
+import time
+
+from article_recommender.model import encode_title_tokens, title_tokens_to_bytes
+import articles.repository as repository
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cache the title token ids of the articles that have none yet.")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="titles tokenized and written together")
+    args = parser.parse_args()
+
+    articles = repository.find_untokenized_titles()
+    done, started = 0, time.monotonic()
+    while batch := list(itertools.islice(articles, args.batch_size)):
+        tokens = encode_title_tokens([article["title"] for article in batch])
+        repository.save_title_tokens({article["_id"]: title_tokens_to_bytes(ids)
+                                      for article, ids in zip(batch, tokens)})
+        done += len(batch)
+        print(f"{done} titles ({done / (time.monotonic() - started):.0f}/s)")
+    print(f"Cached the token ids of {done} titles")
+
+
+if __name__ == "__main__":
+    main()
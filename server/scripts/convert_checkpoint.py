@@ -0,0 +1,48 @@
+"""
+Convert a torch.save NRMS checkpoint to .safetensors, with the model config
+stored in the file metadata.
+
+The server memory-maps .safetensors checkpoints instead of unpickling them,
+which makes loading near instant and lets every worker on the host share
+one copy of the weights through the page cache.
+
+Run from the server directory:
+    python -m scripts.convert_checkpoint
+    python -m scripts.convert_checkpoint --src checkpoint_epoch3.pt --dst checkpoint_epoch3.safetensors
+"""
+import argparse
+import time
+
+import torch
+
+from article_recommender.model import CHECK_PATH, LEGACY_CHECK_PATH, load_model, read_checkpoint, save_checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a torch.save NRMS checkpoint to .safetensors.")
+    parser.add_argument("--src", default=LEGACY_CHECK_PATH)
+    parser.add_argument("--dst", default=CHECK_PATH)
+    args = parser.parse_args()
+
+    state_dict, config = read_checkpoint(args.src)
+    save_checkpoint(state_dict, args.dst, config)
+
+    # Check the round trip, and time both loads
+    timings = {}
+    models = {}
+    for path in (args.src, args.dst):
+        started = time.monotonic()
+        models[path] = load_model(path)
+        timings[path] = time.monotonic() - started
+    source, converted = (models[args.src].state_dict(), models[args.dst].state_dict())
+    mismatched = [name for name in source if not torch.equal(source[name], converted[name])]
+    if mismatched or source.keys() != converted.keys():
+        raise SystemExit(f"Converted checkpoint differs from {args.src}: {mismatched}")
+    print(f"Wrote {args.dst} with config {config}")
+    for path, seconds in timings.items():
+        print(f"  load {path}: {seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Export the NRMS news and user encoders to TorchScript and/or ONNX, then
+load the exports back the way the server does and check them against the
+eager model.
+
+The server picks them up with INFERENCE_BACKEND=torchscript|onnx, from
+INFERENCE_EXPORT_DIR (./article_recommender/exported by default). The
+exports are float32 and are tied to the checkpoint they were made from:
+export again after every new checkpoint.
+
+Run from the server directory:
+    python -m scripts.export_encoders --format both
+    python -m scripts.export_encoders --format onnx --fixed --batch-size 32
+"""
+import argparse
+import time
+
+import torch
+
+from article_recommender.export import (check_parity, example_inputs, export_onnx, export_torchscript,
+                                        without_fastpath)
+from article_recommender.model import EXPORT_DIR, load_exported_encoders, load_model
+
+BENCHMARK_BATCH_SIZE = 64
+BENCHMARK_ROUNDS = 10
+
+
+def encoder_timings(model, news_inputs, user_inputs, rounds=BENCHMARK_ROUNDS):
+    """
+    Mean milliseconds per call of the news and user encoders.
+    """
+    timings = {}
+    with torch.no_grad():
+        for name, inputs in (("news_encoder", news_inputs), ("user_encoder", user_inputs)):
+            encoder = getattr(model, name)
+            encoder(*inputs)  # warm up
+            started = time.perf_counter()
+            for _ in range(rounds):
+                encoder(*inputs)
+            timings[name] = (time.perf_counter() - started) / rounds * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the NRMS encoders and check them against the eager model.")
+    parser.add_argument("--out-dir", default=EXPORT_DIR)
+    parser.add_argument("--format", choices=("torchscript", "onnx", "both"), default="both")
+    parser.add_argument("--fixed", action="store_true",
+                        help="export ONNX graphs with a fixed batch size and padded lengths")
+    parser.add_argument("--batch-size", type=int, default=BENCHMARK_BATCH_SIZE,
+                        help="batch size of the --fixed ONNX graphs")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="largest absolute difference allowed with the eager outputs")
+    args = parser.parse_args()
+
+    backends = ["torchscript", "onnx"] if args.format == "both" else [args.format]
+    if "torchscript" in backends:
+        export_torchscript(load_model(), args.out_dir)
+    if "onnx" in backends:
+        export_onnx(load_model(), args.out_dir, dynamic=not args.fixed, batch_size=args.batch_size)
+    print(f"Exported {', '.join(backends)} encoders to {args.out_dir}")
+
+    eager = load_model().eval()
+    inputs = example_inputs(eager, BENCHMARK_BATCH_SIZE)
+    timings = {"eager": encoder_timings(eager, *inputs)}
+    failed = False
+    for backend in backends:
+        exported = load_exported_encoders(load_model().eval(), backend, args.out_dir)
+        # Compare with the plain transformer math the graphs were traced from
+        with without_fastpath():
+            diffs = check_parity(eager, exported)
+        timings[backend] = encoder_timings(exported, *inputs)
+        for name, diff in diffs.items():
+            status = "ok" if diff <= args.tolerance else "MISMATCH"
+            failed |= diff > args.tolerance
+            print(f"{backend} {name}: max abs diff {diff:.2e} {status}")
+
+    for backend, times in timings.items():
+        print(f"{backend}: " + ", ".join(
+            f"{name} {ms:.1f} ms" for name, ms in times.items()) + f" (batch of {BENCHMARK_BATCH_SIZE})")
+    if failed:
+        raise SystemExit(f"Exports differ from the eager model by more than {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
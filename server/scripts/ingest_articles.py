@@ -0,0 +1,67 @@
+"""
+Ingest new articles: fetch -> normalize -> dedupe -> language -> topic ->
+embed -> store, as one streaming pipeline.
+
+Every stage runs in its own thread(s) behind a bounded queue, so a slow
+stage (topic classification, NRMS embedding) holds back the fetching
+instead of piling articles up in memory, and the model stages get full
+batches under load. Articles are only inserted once they have their topic,
+embedding and title token ids, so they become servable (candidate store,
+cold start pool) complete. Per-stage throughput is printed every
+--report-interval seconds.
+
+Run from the server directory:
+    python -m scripts.ingest_articles --csv news_fetcher/data/google_news.csv
+    GNEWS_API_KEY=... python -m scripts.ingest_articles --gnews --countries us gb
+    python -m scripts.ingest_articles --jsonl fetched.jsonl --embed-batch-size 512
+"""
+import argparse
+import itertools
+import os
+
+import torch
+
+from ingest.pipeline import Pipeline
+from ingest.stages import ingest_stages, read_csv_articles, read_jsonl_articles
+from news_fetcher.fetcher.google_fetcher import GNEWS_CATEGORIES, fan_out, fetch_feeds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new articles through the enrichment pipeline.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="news CSV to ingest (url, title, publisher, date, image, ...)")
+    source.add_argument("--jsonl", help="raw articles to ingest, one JSON object per line")
+    source.add_argument("--gnews", action="store_true", help="fetch the articles from GNews (GNEWS_API_KEY)")
+    parser.add_argument("--categories", nargs="*", default=GNEWS_CATEGORIES, help="GNews categories to fetch")
+    parser.add_argument("--queries", nargs="*", default=[], help="GNews search queries to fetch")
+    parser.add_argument("--countries", nargs="*", default=[None], help="countries to fetch every feed for")
+    parser.add_argument("--per-feed", type=int, default=10, help="articles fetched per GNews feed")
+    parser.add_argument("--limit", type=int, default=None, help="ingest at most this many fetched articles")
+    parser.add_argument("--queue-size", type=int, default=1000, help="items queued in front of every stage")
+    parser.add_argument("--topic-batch-size", type=int, default=64)
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--store-batch-size", type=int, default=500)
+    parser.add_argument("--language-workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=None, help="torch threads")
+    parser.add_argument("--report-interval", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if args.gnews:
+        api_key = os.getenv("GNEWS_API_KEY")
+        if not api_key:
+            raise ValueError("GNEWS_API_KEY not found in environment variables.")
+        articles = fetch_feeds(api_key, fan_out(args.categories, args.queries, args.countries), args.per_feed)
+    else:
+        articles = read_csv_articles(args.csv) if args.csv else read_jsonl_articles(args.jsonl)
+    if args.limit:
+        articles = itertools.islice(articles, args.limit)
+    stages = ingest_stages(args.topic_batch_size, args.embed_batch_size, args.store_batch_size,
+                           args.language_workers)
+    metrics = Pipeline(articles, stages, args.queue_size, args.report_interval).run()
+    print(f"Stored {metrics['stages']['store']['items_out']} of {metrics['fetched']} fetched articles")
+
+
+if __name__ == "__main__":
+    main()
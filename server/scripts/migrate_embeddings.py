@@ -0,0 +1,59 @@
+"""
+Convert the stored article embeddings to compact binary.
+
+Embeddings used to be stored as BSON arrays of doubles: ~12 bytes per value
+in Mongo (an index key and a double each), and one Python float per value
+when read. They are now stored as the raw bytes of a float32 (or float16)
+array with their dtype and dimension (see articles.embedding_codec), which
+the repository decodes with np.frombuffer. The server reads both forms, so this can run while it serves.
+
+Articles are converted in insertion order, --batch-size at a time, keeping
+their version stamp. The job only ever selects the articles still to
+convert, so it can be stopped and restarted at any time. With --dtype
+float16, binary float32 embeddings are converted too (and back with
+--dtype float32).
+
+Run from the server directory:
+    python -m scripts.migrate_embeddings
+    python -m scripts.migrate_embeddings --dtype float16
+"""
+import argparse
+import time
+
+import bson
+
+from articles.embedding_codec import EMBEDDING_STORAGE_DTYPE, STORAGE_DTYPES, decode_embedding, encode_embedding
+import articles.repository as repository
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the stored article embeddings to compact binary.")
+    parser.add_argument("--dtype", choices=sorted(STORAGE_DTYPES), default=EMBEDDING_STORAGE_DTYPE,
+                        help="dtype to store the embeddings as")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="articles converted and written together")
+    args = parser.parse_args()
+
+    done, size_before, size_after = 0, 0, 0
+    after_id, started = None, time.monotonic()
+    while batch := repository.find_embeddings_to_convert(args.dtype, after_id, args.batch_size):
+        after_id = batch[-1]["_id"]
+        stored_by_id = {}
+        for article in batch:
+            stored = encode_embedding(decode_embedding(article["embeddings"]), args.dtype)
+            size_before += len(bson.encode({"embeddings": article["embeddings"]}))
+            size_after += len(bson.encode({"embeddings": stored}))
+            stored_by_id[article["_id"]] = stored
+        repository.save_stored_embeddings(stored_by_id)
+        done += len(batch)
+        print(f"{done} articles ({done / (time.monotonic() - started):.0f}/s)")
+
+    print(f"Converted {done} embeddings to {args.dtype}")
+    if done:
+        print(f"Embedding field size: {size_before / done:.0f} -> {size_after / done:.0f} bytes per article "
+              f"(x{size_before / size_after:.1f} smaller)")
+
+
+if __name__ == "__main__":
+    main()
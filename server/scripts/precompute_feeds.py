@@ -0,0 +1,202 @@
+"""
+Precompute the feeds of recently active users, to run off-peak.
+
+For every user who opened an article in the last --days days, the click
+history is encoded with the NRMS user encoder in batches of --chunk-size
+users, and the servable candidates are scored topic by topic, in blocks of
+SCORE_CHUNK_SIZE columns, keeping a running top-k. The top --top-n articles
+of every topic (and of "all") are upserted into the precomputed_feeds
+collection, which the feed serves instead of scoring online while the feed
+is fresh and the user's history has not changed since.
+
+Users are sharded by a hash of their id across --workers processes.
+
+Run from the server directory:
+    python -m scripts.precompute_feeds --days 7 --workers 4
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import torch
+
+from articles.feed_session import FEED_SESSION_DEPTH
+
+# Candidate columns scored at once per chunk of users
+SCORE_CHUNK_SIZE = 16384
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    return zlib.crc32(user_id.encode()) % shards
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def best_of(columns: np.ndarray, scores: np.ndarray, n: int):
+    """
+    Best `n` of the `columns` (B, K) of every row by their `scores` (B, K),
+    best first. Returns the columns and their scores, both (B, min(n, K)).
+    """
+    n = min(n, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(columns, top, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def top_columns(user_emb: np.ndarray, candidates: np.ndarray, start: int, stop: int, n: int, opened):
+    """
+    Best `n` candidates of columns start:stop for every user of `user_emb`
+    (B, E), best first. The columns are scored SCORE_CHUNK_SIZE at a time,
+    so that only a (B, SCORE_CHUNK_SIZE) block of scores is held. `opened`
+    is a pair of (user, column) arrays excluded from the feeds.
+    Returns the columns and their scores, both (B, n).
+    """
+    opened_users, opened_columns = opened
+    best = None
+    for lo in range(start, stop, SCORE_CHUNK_SIZE):
+        hi = min(lo + SCORE_CHUNK_SIZE, stop)
+        scores = user_emb @ candidates[lo:hi].T  # (B, hi - lo)
+        inside = (opened_columns >= lo) & (opened_columns < hi)
+        scores[opened_users[inside], opened_columns[inside] - lo] = -np.inf
+        chunk = best_of(np.broadcast_to(np.arange(lo, hi), scores.shape), scores, n)
+        best = chunk if best is None else merge_best(best, chunk, n)
+    return best
+
+
+def merge_best(a, b, n):
+    return best_of(np.concatenate([a[0], b[0]], axis=1), np.concatenate([a[1], b[1]], axis=1), n)
+
+
+def run_shard(shard, shards, days, top_n, chunk_size, threads):
+    # Imported in the worker so that every process opens its own Mongo client
+    from bson import ObjectId
+    from article_recommender.model import encode_histories, model_version
+    import articles.repository as repository
+    from articles.candidate_store import candidate_store
+    from articles.service import engine, get_history_embeddings
+    from articles.user_cache import history_version
+    import interactions.repository as interactions_repository
+
+    torch.set_num_threads(threads)
+    model = engine.load()
+    candidate_store.refresh()
+
+    now = datetime.now()
+    rows = candidate_store.filter_rows(
+        np.arange(candidate_store.size), "all", now=now)
+    # Candidates grouped by topic, so that every topic is a contiguous
+    # block of columns scored on its own
+    rows = rows[np.argsort(candidate_store.topics[rows], kind="stable")]
+    candidates = candidate_store.matrix[rows]  # (M, E)
+    ids = candidate_store.article_ids(rows)
+    column_of = {id: column for column, id in enumerate(ids)}
+    topics = candidate_store.topics[rows]
+    codes, starts = np.unique(topics, return_index=True)
+    topic_blocks = {candidate_store.topic_names[code]: (start, stop)
+                    for code, start, stop in zip(codes, starts, [*starts[1:], len(rows)])}
+    print(f"[shard {shard}/{shards}] {len(rows)} candidates, "
+          f"{sum(topic is not None for topic in topic_blocks)} topics")
+
+    active_users = (user_id for user_id in interactions_repository.find_active_users(now - timedelta(days=days))
+                    if shard_of(user_id, shards) == shard)
+    users_done, started = 0, time.monotonic()
+    for chunk in batched(active_users, chunk_size):
+        viewed = interactions_repository.get_viewed_many(chunk)
+
+        # The histories are read and encoded like the online feed's (see
+        # articles.service.get_history_embeddings), not only from the
+        # articles that are still candidates
+        articles_by_id = {str(article["_id"]): article for article in repository.find_many_with_embeddings(
+            list({ObjectId(id) for user_id in chunk for id in viewed[user_id]}))}
+        users, histories = [], []
+        for user_id in chunk:
+            viewed_articles = [articles_by_id[id] for id in viewed[user_id] if id in articles_by_id]
+            if viewed_articles:
+                users.append(user_id)
+                histories.append(get_history_embeddings(viewed_articles))
+        if not users:
+            continue
+
+        user_emb = encode_histories(model, histories, engine.device).numpy()  # (B, E)
+        opened = (
+            np.array([i for i, user_id in enumerate(users) for id in viewed[user_id] if id in column_of],
+                     dtype=np.int64),
+            np.array([column_of[id] for user_id in users for id in viewed[user_id] if id in column_of],
+                     dtype=np.int64),
+        )
+        tops = {topic: top_columns(user_emb, candidates, start, stop, top_n, opened)
+                for topic, (start, stop) in topic_blocks.items()}
+        if tops:
+            # The best of all topics are among the best of every topic
+            tops["all"] = functools.reduce(lambda a, b: merge_best(a, b, top_n), tops.values())
+            tops.pop(None, None)
+
+        feeds = []
+        for topic, (top, top_scores) in tops.items():
+            for i, user_id in enumerate(users):
+                feeds.append({
+                    "user": user_id,
+                    "topic": topic,
+                    "article_ids": [ids[column] for column, score in zip(top[i], top_scores[i])
+                                    if np.isfinite(score)],
+                    "history_version": history_version(viewed[user_id]),
+                    "model_version": model_version(),
+                    "computed_at": now,
+                })
+        repository.save_precomputed_feeds(feeds)
+
+        users_done += len(users)
+        elapsed = time.monotonic() - started
+        print(f"[shard {shard}/{shards}] {users_done} users ({users_done / elapsed:.1f}/s)")
+    print(f"[shard {shard}/{shards}] done: {users_done} users")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute the feeds of recently active users.")
+    parser.add_argument("--days", type=float, default=7,
+                        help="users active in the last DAYS days")
+    parser.add_argument("--top-n", type=int, default=FEED_SESSION_DEPTH,
+                        help="articles kept per user and topic")
+    parser.add_argument("--chunk-size", type=int, default=256,
+                        help="users encoded and scored together")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, each taking a shard of the users")
+    args = parser.parse_args()
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    if args.workers == 1:
+        run_shard(0, 1, args.days, args.top_n, args.chunk_size, threads)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_shard,
+                               args=(shard, args.workers, args.days, args.top_n, args.chunk_size, threads))
+               for shard in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed = [shard for shard, worker in enumerate(workers) if worker.exitcode != 0]
+    if failed:
+        raise SystemExit(f"Shards {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compute the embeddings of the articles that have none, or whose embeddings
+were computed by another model version than the checkpoint's.
+
+Articles are read in insertion order, --batch-size at a time, encoded with
+calculate_candidate_embeddings (from their cached title token ids when
+they have them) and written back stamped with the model version. The job
+can be stopped and restarted at any time: it only ever selects the stale
+articles. --max-rate caps the articles embedded per second, to keep the
+load on Mongo and on the host bounded while the servers run.
+
+Upgrading the model without downtime:
+  1. run this job with the new checkpoint while the servers still run the
+     old one. The servers keep the candidate vectors they already loaded,
+     and re-encode the history articles that were re-embedded meanwhile;
+  2. roll the servers onto the new checkpoint (MODEL_CHECKPOINT): they only
+     load the vectors of the new version.
+Keep it running with --follow to embed newly ingested articles.
+
+Run from the server directory:
+    python -m scripts.reembed_articles --status
+    python -m scripts.reembed_articles --checkpoint ./article_recommender/checkpoints/new.safetensors
+    python -m scripts.reembed_articles --follow --max-rate 200
+    python -m scripts.reembed_articles --stamp-existing  # embeddings predating versions
+"""
+import argparse
+import time
+
+import torch
+
+from article_recommender.model import (calculate_candidate_embeddings, checkpoint_path, load_model, model_version,
+                                       prepare_model, title_tokens_from_bytes)
+import articles.repository as repository
+
+
+def print_status(version):
+    counts = repository.count_embedding_versions()
+    print(f"Model version {version}")
+    for stamp, count in sorted(counts.items(), key=lambda item: -item[1]):
+        label = {None: "unversioned", "missing": "no embeddings"}.get(stamp, stamp)
+        current = " (current)" if stamp == version else ""
+        print(f"  {label}{current}: {count}")
+    return sum(count for stamp, count in counts.items() if stamp != version)
+
+
+def reembed(model, version, batch_size, max_rate):
+    """
+    Embed every stale article once; returns the number of articles embedded.
+    """
+    stale = print_status(version)
+    done, after_id, started = 0, None, time.monotonic()
+    while True:
+        batch = repository.find_stale_embeddings(version, after_id, batch_size)
+        if not batch:
+            break
+        after_id = batch[-1]["_id"]
+
+        titles = [title_tokens_from_bytes(article["title_tokens"]) if article.get("title_tokens")
+                  else article["title"] for article in batch]
+        embeddings = calculate_candidate_embeddings(model, titles).cpu()
+        repository.save_embeddings(
+            {article["_id"]: embedding.numpy() for article, embedding in zip(batch, embeddings)}, version)
+
+        done += len(batch)
+        elapsed = time.monotonic() - started
+        if max_rate:
+            # Sleep off the time the batch was ahead of the allowed rate
+            time.sleep(max(0.0, done / max_rate - elapsed))
+            elapsed = time.monotonic() - started
+        rate = done / elapsed
+        remaining = max(0, stale - done)
+        print(f"{done}/{stale} articles ({rate:.0f}/s, ~{remaining / rate / 60:.1f} min left)")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-embed the articles whose embeddings are missing or stale.")
+    parser.add_argument("--checkpoint", default=None,
+                        help="checkpoint to embed with, the served one by default")
+    parser.add_argument("--batch-size", type=int, default=512,
+                        help="articles encoded and written together")
+    parser.add_argument("--max-rate", type=float, default=500,
+                        help="articles embedded per second at most, 0 for no limit")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads, to leave cores to the servers")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep running, embedding new articles as they come")
+    parser.add_argument("--interval", type=float, default=60,
+                        help="seconds between two passes with --follow")
+    parser.add_argument("--status", action="store_true",
+                        help="only print the number of articles by embedding version")
+    parser.add_argument("--stamp-existing", action="store_true",
+                        help="stamp the unversioned embeddings with this model's version, "
+                             "if they are known to come from this checkpoint")
+    args = parser.parse_args()
+
+    path = args.checkpoint or checkpoint_path()
+    version = model_version(path)
+    if args.status:
+        print_status(version)
+        return
+    if args.stamp_existing:
+        stamped = repository.stamp_unversioned_embeddings(version)
+        print(f"Stamped {stamped} articles with version {version}")
+        return
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = prepare_model(load_model(path), "float32", backend="eager")
+    while True:
+        done = reembed(model, version, args.batch_size, args.max_rate)
+        print(f"Embedded {done} articles with model version {version}")
+        if not args.follow:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Move the article embeddings, their version and the cached title token ids
+out of the `articles` documents into `article_vectors`.
+
+The vector documents share the _id of their article, so metadata queries
+only touch small documents and vectors are bulk read by article _id. The
+server only reads article_vectors: run this before rolling it out. Articles
+not moved yet are served as if they had no vectors (their embeddings are
+recomputed on the fly, and the candidate store keeps them pending until
+they are moved).
+
+Articles are moved --batch-size at a time; the job only ever selects the
+articles that still hold vector fields, so it can be stopped and restarted
+at any time. Vector fields already in article_vectors are never
+overwritten.
+
+Run from the server directory:
+    python -m scripts.split_article_vectors
+"""
+import argparse
+import time
+
+import articles.repository as repository
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move the article vectors to the article_vectors collection.")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="articles moved together")
+    args = parser.parse_args()
+
+    done, started = 0, time.monotonic()
+    while batch := repository.find_unsplit_vectors(args.batch_size):
+        repository.move_vectors(batch)
+        done += len(batch)
+        print(f"{done} articles ({done / (time.monotonic() - started):.0f}/s)")
+    print(f"Moved the vectors of {done} articles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Compare the reduced-precision inference modes of NRMS against float32 on a
+slice of the MIND validation set.
+
+For every impression of the slice, the candidates are scored with the float
+model and with each reduced-precision model. Reported per precision:
+  - Pearson correlation of all the scores, and the mean Spearman
+    correlation within an impression;
+  - mean top-k overlap with the float ranking;
+  - mean impression AUC of both models on the click labels;
+  - news / user encoding time and serialized model size.
+
+Run from the server directory:
+    python -m scripts.verify_quantization \\
+        --news MINDsmall_dev/news.tsv --behaviors MINDsmall_dev/behaviors.tsv
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import torch
+
+from article_recommender.model import (MAX_HISTORY, PRECISIONS, calculate_candidate_embeddings, encode_histories,
+                                       load_model, prepare_model)
+
+NEWS_BATCH_SIZE = 256
+USER_BATCH_SIZE = 64
+
+
+def load_news_titles(news_path):
+    titles = {}
+    with open(news_path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) >= 4:
+                titles[cols[0]] = cols[3]
+    return titles
+
+
+def load_impressions(behaviors_path, titles, limit):
+    """
+    (history news ids, candidate news ids, click labels) of the first
+    `limit` impressions with a history and a click.
+    """
+    impressions = []
+    with open(behaviors_path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 5:
+                continue
+            history = [nid for nid in cols[3].split() if nid in titles][-MAX_HISTORY:]
+            candidates, labels = [], []
+            for item in cols[4].split():
+                nid, label = item.split("-")
+                if nid in titles:
+                    candidates.append(nid)
+                    labels.append(int(label))
+            if history and candidates and any(labels):
+                impressions.append((history, candidates, np.array(labels)))
+                if len(impressions) == limit:
+                    break
+    return impressions
+
+
+def score_impressions(model, impressions, titles):
+    """
+    Scores of the candidates of every impression, and the time spent in
+    the news and user encoders.
+    """
+    news_ids = sorted({nid for history, candidates, _ in impressions
+                       for nid in history + candidates})
+    started = time.perf_counter()
+    news_emb = torch.cat([
+        calculate_candidate_embeddings(model, [titles[nid] for nid in news_ids[i:i + NEWS_BATCH_SIZE]])
+        for i in range(0, len(news_ids), NEWS_BATCH_SIZE)
+    ])
+    news_seconds = time.perf_counter() - started
+    row_of = {nid: row for row, nid in enumerate(news_ids)}
+
+    started = time.perf_counter()
+    user_emb = []
+    for i in range(0, len(impressions), USER_BATCH_SIZE):
+        user_emb.append(encode_histories(model, [news_emb[[row_of[nid] for nid in history]]
+                                                 for history, _, _ in impressions[i:i + USER_BATCH_SIZE]]))
+    user_emb = torch.cat(user_emb)
+    user_seconds = time.perf_counter() - started
+
+    scores = [(news_emb[[row_of[nid] for nid in candidates]] @ user_emb[i]).numpy()
+              for i, (_, candidates, _) in enumerate(impressions)]
+    return scores, news_seconds, user_seconds
+
+
+def ranks(values):
+    return np.argsort(np.argsort(values)).astype(np.float64)
+
+
+def spearman(a, b):
+    if len(a) < 2:
+        return 1.0
+    return float(np.corrcoef(ranks(a), ranks(b))[0, 1])
+
+
+def topk_overlap(a, b, k):
+    return len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k
+
+
+def auc(scores, labels):
+    positives, negatives = scores[labels == 1], scores[labels == 0]
+    if len(positives) == 0 or len(negatives) == 0:
+        return None
+    greater = (positives[:, None] > negatives[None, :]).mean()
+    ties = (positives[:, None] == negatives[None, :]).mean()
+    return float(greater + ties / 2)
+
+
+def mean_auc(all_scores, impressions):
+    aucs = [auc(scores, labels) for scores, (_, _, labels) in zip(all_scores, impressions)]
+    return np.mean([value for value in aucs if value is not None])
+
+
+def model_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return len(buffer.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare reduced-precision NRMS inference with float32 on MIND.")
+    parser.add_argument("--news", required=True, help="MIND news.tsv")
+    parser.add_argument("--behaviors", required=True, help="MIND behaviors.tsv")
+    parser.add_argument("--limit", type=int, default=2000,
+                        help="number of impressions to score")
+    parser.add_argument("--precisions", default="int8,bf16",
+                        help="comma separated precisions to compare with float32")
+    parser.add_argument("--topk", type=int, nargs="+", default=[5, 10])
+    args = parser.parse_args()
+
+    titles = load_news_titles(args.news)
+    impressions = load_impressions(args.behaviors, titles, args.limit)
+    print(f"{len(impressions)} impressions, "
+          f"{sum(len(candidates) for _, candidates, _ in impressions)} candidates")
+
+    # float32 first: the reduced precisions turn off the fused fast path
+    reference = prepare_model(load_model(), "float32")
+    reference_scores, news_seconds, user_seconds = score_impressions(
+        reference, impressions, titles)
+    print(f"float32: AUC {mean_auc(reference_scores, impressions):.4f}, "
+          f"news {news_seconds:.2f}s, users {user_seconds:.2f}s, "
+          f"size {model_size(reference) / 2**20:.1f} MiB")
+
+    for precision in args.precisions.split(","):
+        if precision not in PRECISIONS or precision == "float32":
+            raise SystemExit(f"Unknown precision {precision!r}")
+        model = prepare_model(load_model(), precision)
+        if model.precision != precision:
+            continue
+        scores, news_seconds, user_seconds = score_impressions(
+            model, impressions, titles)
+
+        pearson = np.corrcoef(np.concatenate(reference_scores), np.concatenate(scores))[0, 1]
+        rank_corr = np.mean([spearman(a, b) for a, b in zip(reference_scores, scores)])
+        overlaps = ", ".join(
+            f"top-{k} overlap {np.mean([topk_overlap(a, b, k) for a, b in zip(reference_scores, scores) if len(a) >= k]):.4f}"
+            for k in args.topk)
+        print(f"{precision}: AUC {mean_auc(scores, impressions):.4f}, "
+              f"news {news_seconds:.2f}s, users {user_seconds:.2f}s, "
+              f"size {model_size(model) / 2**20:.1f} MiB")
+        print(f"  vs float32: pearson {pearson:.5f}, spearman {rank_corr:.5f}, {overlaps}")
+
+
+if __name__ == "__main__":
+    main()
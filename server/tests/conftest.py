@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server runs from its own directory, with its packages imported bare
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
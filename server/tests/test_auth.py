@@ -0,0 +1,58 @@
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import auth.service as auth_service
+
+DOMAIN = "tenant.example.com"
+CLIENT_ID = "spa-client-id"
+
+
+@pytest.fixture(scope="module")
+def key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def configured(monkeypatch, key):
+    signing_key = SimpleNamespace(key=key.public_key())
+    monkeypatch.setattr(auth_service, "AUTH0_DOMAIN", DOMAIN)
+    monkeypatch.setattr(auth_service, "AUTH0_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setattr(auth_service, "jwks_client",
+                        SimpleNamespace(get_signing_key_from_jwt=lambda token: signing_key))
+
+
+def id_token(key, **claims):
+    claims = {"iss": f"https://{DOMAIN}/", "aud": CLIENT_ID, "exp": time.time() + 60,
+              "email": "reader@example.com", "nonce": time.monotonic_ns(), **claims}
+    # A None claim is left out
+    return jwt.encode({name: value for name, value in claims.items() if value is not None},
+                      key, algorithm="RS256")
+
+
+def test_id_tokens_of_the_client_are_accepted(configured, key):
+    payload = auth_service.decode_token(id_token(key))
+    assert payload["email"] == "reader@example.com"
+
+
+@pytest.mark.parametrize("claims", [
+    {"aud": f"https://{DOMAIN}/api/v2/"},
+    {"aud": None},
+    {"iss": "https://other.example.com/"},
+    {"exp": time.time() - 60},
+])
+def test_other_tokens_are_rejected(configured, key, claims):
+    token = id_token(key, **claims)
+    with pytest.raises(jwt.InvalidTokenError) as error:
+        auth_service.decode_token(token)
+    assert auth_service.token_error(error.value)[1] == 401
+
+
+def test_missing_configuration_is_a_503(monkeypatch, key):
+    monkeypatch.setattr(auth_service, "jwks_client", None)
+    with pytest.raises(auth_service.AuthNotConfigured) as error:
+        auth_service.decode_token(id_token(key))
+    assert auth_service.token_error(error.value) == ('Authentication is not configured', 503)
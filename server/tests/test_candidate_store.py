@@ -0,0 +1,103 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import articles.candidate_store as candidate_store_module
+from articles.candidate_store import CandidateStore
+
+DIM = 8
+
+
+def make_articles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    date = datetime.now() - timedelta(hours=1)
+    return [{"_id": ObjectId(), "date": date, "topic": "world",
+             "embeddings": rng.standard_normal(DIM).astype(np.float32),
+             "embeddings_version": "v1"} for _ in range(n)]
+
+
+class FakeRepository:
+    """
+    Serves `articles` like find_candidate_vectors, blocking until `gate` is
+    set.
+    """
+
+    def __init__(self, articles):
+        self.articles = articles
+        self.gate = threading.Event()
+
+    def find_candidate_vectors(self, after_id=None, ids=None, version=None):
+        self.gate.wait()
+        if ids is not None:
+            ids = set(ids)
+            return [article for article in self.articles if article["_id"] in ids]
+        return [article for article in self.articles
+                if after_id is None or article["_id"] > after_id]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    repository = FakeRepository(make_articles(50))
+    monkeypatch.setattr(candidate_store_module, "repository", repository)
+    monkeypatch.setattr(candidate_store_module, "model_version", lambda: "v1")
+    return repository
+
+
+def test_start_loads_in_the_background(repository):
+    store = CandidateStore()
+    started = time.monotonic()
+    store.start()
+    store.start()
+    # Requests never wait for the load, they see the empty snapshot
+    assert time.monotonic() - started < 1
+    assert store.size == 0
+
+    repository.gate.set()
+    wait_for(lambda: store.size == 50)
+    rows, scores = store.search(np.ones(DIM, dtype=np.float32), "all", k=5)
+    assert len(rows) == 5
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_index_is_built_off_the_refresh(repository, monkeypatch):
+    monkeypatch.setattr(candidate_store_module, "ANN_MIN_SIZE", 20)
+    building = threading.Event()
+    release = threading.Event()
+    build = candidate_store_module.IVFIndex.build
+
+    def slow_build(index, matrix):
+        building.set()
+        release.wait()
+        build(index, matrix)
+
+    monkeypatch.setattr(candidate_store_module.IVFIndex, "build", slow_build)
+    repository.gate.set()
+    store = CandidateStore()
+    query = np.ones(DIM, dtype=np.float32)
+
+    store.refresh()
+    assert building.wait(5)
+    # Exact search is served while the index builds
+    assert not store.index.is_built
+    exact_rows, _ = store.search(query, "all", k=5)
+    assert len(exact_rows) == 5
+
+    # Rows appended during the build are in the index once it is swapped in
+    repository.articles += make_articles(5, seed=1)
+    store.refresh()
+    release.set()
+    wait_for(lambda: store.index.is_built)
+    assert store.index.size == store.size == 55
+    rows, _ = store.search(query, "all", k=store.size)
+    assert sorted(rows) == list(range(55))
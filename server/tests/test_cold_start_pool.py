@@ -0,0 +1,58 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import articles.cold_start_pool as cold_start_pool_module
+from articles.cold_start_pool import ColdStartPool
+
+
+class FakeRepository:
+    """
+    Serves pool candidates, blocking until `gate` is set, and counts the
+    scans.
+    """
+
+    def __init__(self, n):
+        now = datetime.now()
+        self.articles = [{"id": str(i), "title": f"t{i}", "topic": ["world", "sports"][i % 2],
+                          "date": now - timedelta(hours=i)} for i in range(n)]
+        self.gate = threading.Event()
+        self.scans = 0
+
+    def find_pool_candidates(self, limit):
+        self.gate.wait()
+        self.scans += 1
+        return self.articles[:limit]
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    repository = FakeRepository(40)
+    monkeypatch.setattr(cold_start_pool_module, "repository", repository)
+    monkeypatch.setattr(cold_start_pool_module.interactions_repository, "count_opens", lambda since: {"3": 5})
+    return repository
+
+
+def test_pool_is_built_in_the_background(repository):
+    pool = ColdStartPool()
+    started = time.monotonic()
+    # Concurrent cold requests neither wait for the scan nor start their own
+    threads = [threading.Thread(target=lambda: (pool.start(), pool.sample(10))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started < 1
+    assert pool.sample(10) == []
+
+    repository.gate.set()
+    deadline = time.monotonic() + 5
+    while not pool.size:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert repository.scans == 1
+    sports = pool.sample(5, "sports")
+    assert len({article["id"] for article in sports}) == 5
+    assert all(article["topic"] == "sports" for article in sports)
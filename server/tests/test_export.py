@@ -0,0 +1,45 @@
+import copy
+
+import pytest
+import torch
+
+from article_recommender.export import (EXAMPLE_BATCH_SIZE, NEWS_ENCODER, USER_ENCODER, example_inputs,
+                                        export_onnx, export_torchscript)
+from article_recommender.model import MAX_TITLE_LEN, load_exported_encoders
+from article_recommender.nrms import NRMS
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return NRMS(vocab_size=500, d_embed_word=32, d_embed_news=64, n_heads_news=4, n_heads_user=4,
+                d_mlp_news=64, d_mlp_user=64, news_layers=1, user_layers=1, dropout=0.1,
+                pad_max_len=MAX_TITLE_LEN).eval()
+
+
+def export(model, backend, export_dir):
+    if backend == "torchscript":
+        export_torchscript(copy.deepcopy(model), export_dir)
+    else:
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("onnxscript")
+        export_onnx(copy.deepcopy(model), export_dir)
+    return load_exported_encoders(copy.deepcopy(model), backend, str(export_dir))
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnx"])
+def test_exported_encoders_match_eager(model, backend, tmp_path):
+    exported = export(model, backend, tmp_path)
+    assert exported.backend == backend
+
+    torch.manual_seed(1)
+    with torch.no_grad():
+        # Batch sizes other than the traced one go through the dynamic axes
+        for batch_size in (1, 3, EXAMPLE_BATCH_SIZE, 20):
+            news_inputs, user_inputs = example_inputs(model, batch_size)
+            for name, inputs in ((NEWS_ENCODER, news_inputs), (USER_ENCODER, user_inputs)):
+                expected = getattr(model, name)(*inputs)
+                actual = torch.as_tensor(getattr(exported, name)(*inputs))
+                assert actual.shape == expected.shape
+                assert torch.allclose(actual, expected, atol=1e-5, rtol=1e-4), \
+                    f"{name} differs by {(actual - expected).abs().max().item()}"
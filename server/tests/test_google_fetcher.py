@@ -0,0 +1,90 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import news_fetcher.fake_gnews_server as fake_gnews_server
+import news_fetcher.fetcher.google_fetcher as google_fetcher
+from news_fetcher.fetcher.google_fetcher import GoogleNewsFetcher, TokenBucket
+
+
+@pytest.fixture
+def gnews():
+    """
+    Starts a fake GNews server; call the fixture with its options to get
+    the API base url and the server's request stats.
+    """
+    servers = []
+
+    def start(rate=100, fail_rate=0.0, total=50, max=10):
+        args = SimpleNamespace(rate=rate, fail_rate=fail_rate, latency=0, total=total, max=max)
+        handler, stats = fake_gnews_server.make_handler(args)
+        server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://localhost:{server.server_address[1]}/api/v4", stats
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def fetcher(base_url, **args):
+    # A limiter that never waits, so that the server's rate limit is hit
+    return GoogleNewsFetcher("test", category="world", base_url=base_url,
+                             limiter=TokenBucket(1000, 1000), **args)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(google_fetcher, "BACKOFF_BASE", 0.01)
+
+
+def headline_numbers(articles):
+    return [int(article["url"].rsplit("/", 1)[-1]) for article in articles]
+
+
+@pytest.mark.parametrize("max_results, page_size", [(15, 10), (10, 10), (25, 10), (7, 3)])
+def test_pages_are_contiguous(gnews, max_results, page_size):
+    base_url, stats = gnews()
+    articles = fetcher(base_url, max_results=max_results, page_size=page_size).fetch_articles()
+    assert headline_numbers(articles) == list(range(max_results))
+    assert stats["requests"] == -(-max_results // page_size)
+
+
+def test_stops_at_the_end_of_the_feed(gnews):
+    base_url, stats = gnews(total=12)
+    articles = fetcher(base_url, max_results=30, page_size=10).fetch_articles()
+    assert headline_numbers(articles) == list(range(12))
+    assert stats["requests"] == 2
+
+
+def test_waits_for_retry_after_on_429(gnews):
+    base_url, stats = gnews(rate=1)
+    started = time.monotonic()
+    articles = fetcher(base_url, max_results=20, page_size=10).fetch_articles()
+    assert headline_numbers(articles) == list(range(20))
+    assert stats["rate_limited"] >= 1
+    # The server's Retry-After (1s) is honoured rather than the short backoff
+    assert time.monotonic() - started >= 1
+
+
+def test_retries_503(gnews, monkeypatch):
+    base_url, stats = gnews(fail_rate=0.5)
+    # The first two requests fail, the following ones succeed
+    draws = iter([0.0, 0.0] + [1.0] * 10)
+    monkeypatch.setattr(fake_gnews_server, "random", SimpleNamespace(random=lambda: next(draws)))
+    articles = fetcher(base_url, max_results=10, page_size=10).fetch_articles()
+    assert headline_numbers(articles) == list(range(10))
+    assert stats["failed"] == 2
+    assert stats["requests"] == 3
+
+
+def test_gives_up_after_the_retries(gnews):
+    base_url, stats = gnews(fail_rate=1.0)
+    with pytest.raises(RuntimeError, match="failed after"):
+        fetcher(base_url, max_results=10).fetch_articles()
+    assert stats["failed"] == google_fetcher.MAX_RETRIES + 1
@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import datetime
+
+import ingest.stages as stages
+from articles.schema import ARTICLE_FIELDS
+from ingest.pipeline import Pipeline, Stage
+
+
+def run(pipeline, timeout=10):
+    """
+    Run the pipeline, failing the test instead of hanging if it never ends.
+    """
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(pipeline.run()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the pipeline did not terminate"
+    return result
+
+
+class Collect:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.items = []
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        time.sleep(self.delay)
+        with self._lock:
+            self.items.extend(batch)
+        return batch
+
+
+def test_a_slow_stage_holds_back_the_source():
+    sink = Collect(delay=0.002)
+    lead = []
+
+    def source():
+        for i in range(200):
+            # Items read from the source but not through the pipeline yet
+            lead.append(i - len(sink.items))
+            yield i
+
+    pipeline = Pipeline(source(), [Stage("double", lambda batch: [2 * i for i in batch]),
+                                   Stage("sink", sink)], queue_size=5, report_interval=60)
+    metrics = run(pipeline)
+
+    assert sink.items == [2 * i for i in range(200)]
+    assert metrics["fetched"] == 200
+    # Two queues of 5, one item in each stage and one waiting at each put
+    assert max(lead) <= 2 * 5 + 2 + 2
+    assert all(stage["queue_depth"] == 0 for stage in metrics["stages"].values())
+
+
+def test_workers_and_batches_end_together():
+    sink = Collect()
+    pipeline = Pipeline(range(1000), [Stage("batched", lambda batch: batch, batch_size=64, workers=3,
+                                            max_wait=0.01),
+                                      Stage("sink", sink, batch_size=10, workers=2)],
+                        queue_size=50, report_interval=60)
+    metrics = run(pipeline)
+    assert sorted(sink.items) == list(range(1000))
+    assert metrics["stages"]["batched"]["items_out"] == 1000
+
+
+def test_failing_batches_are_dropped_without_hanging():
+    sink = Collect()
+
+    def fragile(batch):
+        if any(i % 10 == 3 for i in batch):
+            raise ValueError("bad item")
+        return batch
+
+    def source():
+        yield from range(50)
+        raise ConnectionError("feed lost")
+
+    pipeline = Pipeline(source(), [Stage("fragile", fragile), Stage("sink", sink)],
+                        queue_size=4, report_interval=60)
+    metrics = run(pipeline)
+    assert sink.items == [i for i in range(50) if i % 10 != 3]
+    assert metrics["stages"]["fragile"]["errors"] == 5
+    assert metrics["stages"]["fragile"]["dropped"] == 5
+
+
+def test_duplicate_urls_are_dropped(monkeypatch):
+    looked_up = []
+
+    def find_existing_urls(urls):
+        looked_up.append(sorted(urls))
+        return {"https://news.example.com/stored"}
+
+    monkeypatch.setattr(stages.repository, "find_existing_urls", find_existing_urls)
+    dedupe = stages.Deduplicator()
+    articles = lambda *urls: [{"url": f"https://news.example.com/{url}"} for url in urls]
+
+    first = dedupe(articles("a", "b", "a", "stored"))
+    second = dedupe(articles("b", "c"))
+    assert [article["url"][-1] for article in first + second] == ["a", "b", "c"]
+    # Urls already seen in this run are not looked up again
+    assert looked_up[1] == ["https://news.example.com/c"]
+
+
+def test_normalized_articles_match_the_served_cards(monkeypatch):
+    csv_row = {"url": " https://news.example.com/1 ", "title": "Cup final tonight", "publisher": "Example News",
+               "date": "2024-05-01 18:30:00", "image": "https://news.example.com/1.jpg", "keyword": "sports",
+               "country": "US", "unexpected": "column"}
+    gnews = {"url": "https://news.example.com/2", "title": "Rates stay put", "description": "...",
+             "publishedAt": "2024-05-01T16:00:00Z", "image": "https://news.example.com/2.jpg",
+             "source": {"name": "Example Wire", "url": "https://wire.example.com"}}
+    incomplete = [{**gnews, "image": None}, {**gnews, "publishedAt": "yesterday"}, {**csv_row, "title": " "}]
+
+    articles = stages.normalize([csv_row, gnews, *incomplete])
+    assert [article["publisher"] for article in articles] == ["Example News", "Example Wire"]
+    assert articles[0]["url"] == "https://news.example.com/1"
+    assert articles[0]["date"] == datetime(2024, 5, 1, 18, 30)
+    # Stored like the served articles: local naive dates
+    assert all(isinstance(article["date"], datetime) and article["date"].tzinfo is None
+               for article in articles)
+
+    monkeypatch.setitem(stages._models, "topics", lambda titles, candidate_labels, batch_size: [
+        {"labels": ["sports" if "Cup" in title else "economics", *candidate_labels]} for title in titles])
+    articles = stages.classify_topics(articles)
+    assert [article["topic"] for article in articles] == ["sports", "economics"]
+
+    served = set(ARTICLE_FIELDS) - {"id"}
+    for article in articles:
+        assert set(article) - {"country"} <= served
+        assert {"title", "url", "image", "publisher", "date", "topic"} <= set(article)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import scripts.precompute_feeds as precompute_feeds
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1000])
+def test_top_columns_match_a_full_scan(monkeypatch, chunk_size):
+    monkeypatch.setattr(precompute_feeds, "SCORE_CHUNK_SIZE", chunk_size)
+    rng = np.random.default_rng(0)
+    user_emb = rng.standard_normal((5, 16)).astype(np.float32)
+    candidates = rng.standard_normal((300, 16)).astype(np.float32)
+    opened = (np.array([0, 0, 3]), np.array([10, 250, 42]))
+    start, stop, n = 20, 260, 12
+
+    columns, scores = precompute_feeds.top_columns(user_emb, candidates, start, stop, n, opened)
+
+    full = user_emb @ candidates.T
+    full[opened] = -np.inf
+    expected = start + np.argsort(-full[:, start:stop], axis=1, kind="stable")[:, :n]
+    np.testing.assert_array_equal(columns, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(full, expected, axis=1), rtol=1e-5)
+    assert 250 not in columns[0]
+
+
+def test_best_of_all_topics_is_merged_from_the_topics():
+    rng = np.random.default_rng(1)
+    user_emb = rng.standard_normal((3, 8)).astype(np.float32)
+    candidates = rng.standard_normal((90, 8)).astype(np.float32)
+    none = (np.empty(0, np.int64), np.empty(0, np.int64))
+    blocks = [(0, 30), (30, 31), (31, 90)]
+
+    tops = [precompute_feeds.top_columns(user_emb, candidates, start, stop, 10, none) for start, stop in blocks]
+    merged = tops[0]
+    for top in tops[1:]:
+        merged = precompute_feeds.merge_best(merged, top, 10)
+
+    expected = precompute_feeds.top_columns(user_emb, candidates, 0, 90, 10, none)
+    np.testing.assert_array_equal(merged[0], expected[0])
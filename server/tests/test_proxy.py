@@ -0,0 +1,195 @@
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from proxy.cache import CachedResponse, DiskCache, ResponseCache
+from proxy.service import ImageProxy, ProxyError
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+class StubServer:
+    """
+    Local upstream: `routes` maps a path to a function of the request
+    handler returning (status, headers, body). Requests are recorded.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                status, headers, body = stub.routes[self.path](self)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path, host="127.0.0.1"):
+        return f"http://{host}:{self.port}{path}"
+
+    def hits(self, path):
+        return sum(1 for requested, _ in self.requests if requested == path)
+
+
+@pytest.fixture
+def upstream():
+    stub = StubServer()
+    yield stub
+    stub.server.shutdown()
+
+
+def make_proxy(**kwargs):
+    kwargs.setdefault("allowed_hosts", "127.0.0.1")
+    return ImageProxy(cache=ResponseCache(1024 * 1024), **kwargs)
+
+
+def image(headers=None, body=PNG):
+    return lambda request: (200, {"Content-Type": "image/png", **(headers or {})}, body)
+
+
+def test_fresh_responses_are_served_from_cache(upstream):
+    upstream.routes["/a.png"] = image({"Cache-Control": "max-age=60"})
+    proxy = make_proxy()
+    assert proxy.fetch(upstream.url("/a.png")).body == PNG
+    assert proxy.fetch(upstream.url("/a.png")).body == PNG
+    assert upstream.hits("/a.png") == 1
+
+
+def test_concurrent_misses_are_collapsed(upstream):
+    def slow(request):
+        time.sleep(0.3)
+        return 200, {"Content-Type": "image/png", "Cache-Control": "max-age=60"}, PNG
+    upstream.routes["/slow.png"] = slow
+    proxy = make_proxy()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(proxy.fetch(upstream.url("/slow.png"))))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [response.body for response in results] == [PNG] * 8
+    assert upstream.hits("/slow.png") == 1
+
+
+def test_stale_responses_are_revalidated(upstream):
+    def revalidated(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"', "Cache-Control": "no-cache"}, b""
+        return 200, {"Content-Type": "image/png", "ETag": '"v1"', "Cache-Control": "no-cache"}, PNG
+    upstream.routes["/r.png"] = revalidated
+    proxy = make_proxy()
+    proxy.fetch(upstream.url("/r.png"))
+    response = proxy.fetch(upstream.url("/r.png"))
+    assert response.status == 200 and response.body == PNG
+    assert upstream.hits("/r.png") == 2
+    assert upstream.requests[-1][1].get("If-None-Match") == '"v1"'
+
+
+def test_large_responses_are_refused(upstream):
+    upstream.routes["/big.png"] = image(body=b"x" * 2048)
+    proxy = make_proxy(max_bytes=1024)
+    with pytest.raises(ProxyError) as error:
+        proxy.fetch(upstream.url("/big.png"))
+    assert error.value.status == 413
+
+
+def test_non_images_are_refused(upstream):
+    upstream.routes["/page"] = lambda request: (200, {"Content-Type": "text/html"}, b"<html></html>")
+    with pytest.raises(ProxyError) as error:
+        make_proxy().fetch(upstream.url("/page"))
+    assert error.value.status == 415
+
+
+def test_redirects_to_allowed_hosts_are_followed(upstream):
+    upstream.routes["/moved.png"] = lambda request: (302, {"Location": "/a.png"}, b"")
+    upstream.routes["/a.png"] = image()
+    assert make_proxy().fetch(upstream.url("/moved.png")).body == PNG
+
+
+def test_redirects_to_internal_addresses_are_refused(upstream):
+    # localhost matches "*" but resolves to a loopback address
+    upstream.routes["/moved.png"] = lambda request: (302, {"Location": upstream.url("/secret", "localhost")}, b"")
+    upstream.routes["/secret"] = image()
+    with pytest.raises(ProxyError) as error:
+        make_proxy(allowed_hosts="127.0.0.1,*").fetch(upstream.url("/moved.png"))
+    assert error.value.status == 403
+    assert upstream.hits("/secret") == 0
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost/a.png",
+    "http://127.0.0.1/a.png",
+    "http://10.0.0.1/a.png",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/a.png",
+    "file:///etc/passwd",
+])
+def test_internal_addresses_are_refused_by_patterns(url):
+    assert not make_proxy(allowed_hosts="*").is_allowed(url)
+
+
+def test_nothing_is_allowed_by_default():
+    assert not ImageProxy(cache=ResponseCache(1024)).is_allowed("https://example.com/a.png")
+
+
+def test_dns_rebinding_after_the_check_is_refused(upstream, monkeypatch):
+    # The host resolves to a public address when checked, then to loopback
+    upstream.routes["/secret"] = image()
+    resolve = socket.getaddrinfo
+    answers = []
+
+    def rebinding(host, port, *args, **kwargs):
+        if host != "rebind.example":
+            return resolve(host, port, *args, **kwargs)
+        answers.append(host)
+        address = "93.184.216.34" if len(answers) == 1 else "127.0.0.1"
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", rebinding)
+    with pytest.raises(ProxyError) as error:
+        make_proxy(allowed_hosts="*.example").fetch(upstream.url("/secret", "rebind.example"))
+    assert error.value.status == 403
+    assert upstream.hits("/secret") == 0
+
+
+def test_disk_cache_size_stays_consistent(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=4000)
+    keys = [f"k{i}" for i in range(8)]
+
+    def churn(seed):
+        rng = random.Random(seed)
+        for _ in range(300):
+            key = rng.choice(keys)
+            action = rng.random()
+            if action < 0.4:
+                cache.put(key, CachedResponse(200, {}, b"x" * rng.randint(1, 1500)))
+            elif action < 0.6:
+                cache.delete(key)
+            else:
+                cache.get(key)
+
+    threads = [threading.Thread(target=churn, args=(seed,)) for seed in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    on_disk = sum(path.stat().st_size for path in tmp_path.glob("*.body"))
+    assert cache.size == on_disk <= 4000
@@ -0,0 +1,38 @@
+from bson import ObjectId
+
+import articles.repository as repository
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc[key], reverse=direction < 0))
+
+
+class FakeArticles:
+    def __init__(self):
+        self.queries = []
+
+    def find(self, query, projection):
+        ids = query["_id"]["$in"]
+        self.queries.append(len(ids))
+        return FakeCursor({"_id": id, "date": None, "topic": "world"} for id in ids)
+
+
+def test_pending_ids_are_looked_up_in_batches(monkeypatch):
+    ids = [ObjectId() for _ in range(25)]
+    looked_up = []
+
+    def find_vectors(batch, fields, version=None):
+        looked_up.append(len(batch))
+        # Every other article has been re-embedded
+        return {id: {"embeddings_version": version} for id in batch if ids.index(id) % 2 == 0}
+
+    articles = FakeArticles()
+    monkeypatch.setattr(repository, "ID_BATCH_SIZE", 10)
+    monkeypatch.setattr(repository, "find_vectors", find_vectors)
+    monkeypatch.setattr(repository, "articles_collection", articles)
+
+    found = list(repository.find_candidate_vectors(ids=reversed(ids), version="v1"))
+    assert looked_up == [10, 10, 5]
+    assert articles.queries == [5, 5, 3]
+    assert [article["_id"] for article in found] == ids[::2]
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import articles.seen_set as seen_set
+from articles.seen_set import RECENTLY_RECOMMENDED_WINDOW, SeenSet
+
+
+def test_old_buckets_expire_whatever_their_order(monkeypatch):
+    monkeypatch.setattr(seen_set.candidate_store, "rows", {"new": 0, "old": 1, "older": 2, "opened": 3})
+    now = datetime.now()
+    seen = SeenSet.from_interactions([
+        {"article_id": "new", "last_recommended": now - timedelta(minutes=5)},
+        {"article_id": "old", "last_recommended": now - RECENTLY_RECOMMENDED_WINDOW - timedelta(minutes=30)},
+        {"article_id": "older", "last_recommended": now - 2 * RECENTLY_RECOMMENDED_WINDOW},
+        {"article_id": "opened", "is_opened": True, "last_recommended": now - 3 * RECENTLY_RECOMMENDED_WINDOW},
+    ])
+    assert list(seen.mask(np.arange(4), now)) == [True, False, False, True]
+    assert len(seen.recommended) == 1
+
+    # A newer bucket touched again does not shield older ones
+    # (more than a bucket older than the window at `later`, whatever the
+    # bucket boundaries)
+    seen.add_recommended(["old"], now - timedelta(minutes=65))
+    seen.add_recommended(["new"], now - timedelta(minutes=5))
+    later = now + timedelta(minutes=15)
+    assert list(seen.mask(np.arange(4), later)) == [True, False, False, True]
@@ -0,0 +1,31 @@
+import threading
+
+import numpy as np
+
+import articles.service as service
+from article_recommender.model import title_tokens_from_bytes, title_tokens_to_bytes
+
+
+def test_token_ids_are_cached_in_the_background(monkeypatch):
+    release = threading.Event()
+    saved = []
+
+    def save_title_tokens(tokens_by_id):
+        release.wait(5)
+        saved.append(tokens_by_id)
+
+    monkeypatch.setattr(service.repository, "save_title_tokens", save_title_tokens)
+    monkeypatch.setattr(service, "encode_title_tokens",
+                        lambda titles: [np.arange(len(title)) for title in titles])
+    articles = [{"_id": 1, "title": "cached", "title_tokens": title_tokens_to_bytes(np.array([7, 8]))},
+                {"_id": 2, "title": "new"}]
+
+    # Returns while the write is still blocked
+    tokens = service.get_title_tokens(articles)
+    assert [list(ids) for ids in tokens] == [[7, 8], [0, 1, 2]]
+    assert saved == []
+
+    release.set()
+    service.write_executor.submit(lambda: None).result(5)
+    assert list(saved[0]) == [2]
+    assert list(title_tokens_from_bytes(saved[0][2])) == [0, 1, 2]
@@ -0,0 +1,109 @@
+from collections import Counter
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import interactions.write_behind as write_behind
+from interactions.write_behind import InteractionSink
+
+
+class FakeCollection:
+    """
+    Applies UpdateOne $set/$inc upserts to dicts keyed by the filter; the
+    ops listed in `fail` (by their filter) are reported as write errors once.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.fail = set()
+        self.error = None
+
+    def bulk_write(self, ops, ordered=True):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        errors = []
+        for index, op in enumerate(ops):
+            key = tuple(sorted(op._filter.items()))
+            if key in self.fail:
+                self.fail.discard(key)
+                errors.append({"index": index, "code": 11000, "errmsg": "failed"})
+                continue
+            doc = self.docs.setdefault(key, {})
+            doc.update(op._doc.get("$set", {}))
+            for field, value in op._doc.get("$inc", {}).items():
+                doc[field] = doc.get(field, 0) + value
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    interactions, topics = FakeCollection(), FakeCollection()
+    monkeypatch.setattr(write_behind, "interactions_collection", interactions)
+    monkeypatch.setattr(write_behind, "topic_interaction_collection", topics)
+    sink = InteractionSink(flush_interval=3600)
+    monkeypatch.setattr(sink, "_start", lambda: None)
+    monkeypatch.setattr(sink, "_topics", lambda ids: {id: "topic-" + id[-1] for id in ids})
+    return sink, interactions, topics
+
+
+def topic_counts(topics):
+    return {dict(key)["user"] + "/" + dict(key)["topic"]: doc["count"] for key, doc in topics.docs.items()}
+
+
+def test_failed_counter_increments_are_retried_alone(sink):
+    sink, interactions, topics = sink
+    sink.record_open("u1", "a1")
+    sink.record_open("u2", "a2")
+    topics.fail.add((("topic", "topic-2"), ("user", "u2")))
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1}
+
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1, "u2/topic-2": 1}
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1, "u2/topic-2": 1}
+
+
+def test_failed_interaction_writes_are_retried_with_their_opens(sink):
+    sink, interactions, topics = sink
+    sink.record_open("u1", "a1")
+    interactions.error = AutoReconnect("down")
+    sink.flush()
+    assert interactions.docs == {} and topics.docs == {}
+
+    sink.flush()
+    assert len(interactions.docs) == 1
+    assert topic_counts(topics) == {"u1/topic-1": 1}
+
+
+def test_increments_of_unknown_outcome_are_not_reapplied(sink):
+    sink, interactions, topics = sink
+    sink.record_open("u1", "a1")
+    topics.error = AutoReconnect("down")
+    sink.flush()
+    sink.record_open("u1", "a1")
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1}
+    assert sink._topic_counts == Counter()
+
+
+def test_opens_whose_topics_failed_to_resolve_are_retried(sink, monkeypatch):
+    sink, interactions, topics = sink
+    resolve = sink._topics
+
+    def unavailable(ids):
+        raise AutoReconnect("down")
+
+    monkeypatch.setattr(sink, "_topics", unavailable)
+    sink.record_open("u1", "a1")
+    sink.flush()
+    assert len(interactions.docs) == 1 and topics.docs == {}
+
+    # Retried on the next flush, with no other write pending
+    monkeypatch.setattr(sink, "_topics", resolve)
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1}
+    sink.flush()
+    assert topic_counts(topics) == {"u1/topic-1": 1}